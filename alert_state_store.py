@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 2
+
+# <username>-<chat_id>-YYYYMMDD-<ss8>-<md8 or "no-media">. Usernames
+# can't contain '-', chat ids can start with one
+LEGACY_KEY = re.compile(r'^[^-]+-(?P<chat_id>-?\d+)-(?P<date>\d{8})-')
+
+
+class AlertStateStore:
+    """
+    Per-username alert state in <directory>/<username>.json:
+
+        {"version": 2,
+         "next_seq": 8,
+         "seen": {"7": {"hashes": "<screenshot>:<media>", "seen_at": iso}},
+         "cursors": {"<chat_id>": 7},
+         "timestamp": iso, "last_check": iso}
+
+    Every story is recorded once per account, under an increasing
+    sequence number, however many chats track it. Each chat only keeps a
+    cursor: the highest sequence number delivered to it. States written
+    by older versions (one hash key per chat and story) are migrated when
+    read.
+
+    Stories expire after a day, so seen stories older than the retention
+    window can never match again. They are dropped whenever a state is
+    written, and a background pass compacts the files of accounts that
+    haven't posted in a while, so state size follows active stories, not
+    history.
+    """
+
+    def __init__(self, directory: str = "alert_states",
+                 retention_hours: float = 48):
+        self.directory = directory
+        self.retention = timedelta(hours=retention_hours)
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "AlertStateStore":
+        """Build a store configured from the environment."""
+        return cls(os.getenv('ALERT_STATES_DIR', 'alert_states'),
+                   float(os.getenv('ALERT_STATE_RETENTION_HOURS', '48')))
+
+    @staticmethod
+    def empty() -> Dict[str, Any]:
+        return {
+            "version": STATE_VERSION,
+            "next_seq": 1,
+            "seen": {},
+            "cursors": {},
+            "timestamp": "",
+            "last_check": ""
+        }
+
+    def path(self, username: str) -> str:
+        return os.path.join(self.directory, f"{username}.json")
+
+    @classmethod
+    def migrate(cls, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convert a state with per-chat hash keys
+        (<username>-<chat_id>-YYYYMMDD-<ss8>-<md8> -> "ss:md") into the
+        seen set plus delivery cursors.
+        """
+        if state.get('version') == STATE_VERSION:
+            return state
+        migrated = cls.empty()
+        migrated['timestamp'] = state.get('timestamp', '')
+        migrated['last_check'] = state.get('last_check', '')
+
+        stories = {}
+        for key, value in (state.get('hashes') or {}).items():
+            match = LEGACY_KEY.match(key)
+            try:
+                seen_at = datetime.strptime(match['date'],
+                                            "%Y%m%d").isoformat()
+            except (TypeError, ValueError):
+                seen_at = migrated['timestamp']
+            story = stories.setdefault(value, {'seen_at': seen_at,
+                                               'chats': set()})
+            story['seen_at'] = min(story['seen_at'], seen_at)
+            if match:
+                story['chats'].add(match['chat_id'])
+
+        for value, story in sorted(stories.items(),
+                                   key=lambda item: item[1]['seen_at']):
+            seq = migrated['next_seq']
+            migrated['next_seq'] += 1
+            migrated['seen'][str(seq)] = {
+                'hashes': value,
+                'seen_at': story['seen_at']
+            }
+            for chat_id in story['chats']:
+                migrated['cursors'][chat_id] = seq
+        return migrated
+
+    def _load(self, username: str) -> Optional[Dict[str, Any]]:
+        file_path = self.path(username)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading alert state for {username}: {e}")
+            return None
+
+    def _read(self, username: str) -> Dict[str, Any]:
+        state = self._load(username)
+        return self.empty() if state is None else self.migrate(state)
+
+    def get(self, username: str) -> Dict[str, Any]:
+        """Get the alert state of a user."""
+        return self._read(username)
+
+    def set(self, username: str, state: Dict[str, Any]) -> None:
+        """Compact and atomically write the alert state of a user."""
+        with self._lock:
+            state = self.migrate(state)
+            self.compact_state(state)
+            self._write(username, state)
+
+    def _write(self, username: str, state: Dict[str, Any]) -> None:
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                            suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path(username))
+        except Exception as e:
+            logger.error(f"Error saving alert state for {username}: {e}")
+
+    @staticmethod
+    def find_seen(state: Dict[str, Any],
+                  story: Dict[str, Any]) -> Optional[int]:
+        """
+        Sequence number of a seen story matching either the screenshot or
+        the media hash of `story`, or None if it is new.
+        """
+        screenshot_hash = story['screenshot_hash']
+        media_hash = story.get('media_hash')
+        for seq, entry in state['seen'].items():
+            seen_screenshot, _, seen_media = entry['hashes'].partition(':')
+            if screenshot_hash == seen_screenshot or (
+                    media_hash and media_hash == seen_media):
+                return int(seq)
+        return None
+
+    @staticmethod
+    def cursor(state: Dict[str, Any], chat_id: Any) -> int:
+        """Highest sequence number delivered to a chat (0 if none)."""
+        return state['cursors'].get(str(chat_id), 0)
+
+    def record_seen(self, username: str, story: Dict[str, Any]) -> int:
+        """Record a story once for the account and return its seq."""
+        with self._lock:
+            state = self._read(username)
+            seq = self.find_seen(state, story)
+            if seq is None:
+                seq = state['next_seq']
+                state['next_seq'] += 1
+                state['seen'][str(seq)] = {
+                    'hashes': f"{story['screenshot_hash']}:"
+                              f"{story.get('media_hash') or ''}",
+                    'seen_at': datetime.now().isoformat()
+                }
+                state['timestamp'] = datetime.now().isoformat()
+                self.compact_state(state)
+                self._write(username, state)
+            return seq
+
+    def advance_cursors(self, username: str, delivered: Dict[Any,
+                                                             int]) -> None:
+        """Move the delivery cursors of several chats forward at once."""
+        with self._lock:
+            state = self._read(username)
+            for chat_id, seq in delivered.items():
+                if seq > self.cursor(state, chat_id):
+                    state['cursors'][str(chat_id)] = seq
+            self._write(username, state)
+
+    def compact_state(self,
+                      state: Dict[str, Any],
+                      now: Optional[datetime] = None) -> int:
+        """
+        Drop stories seen before the retention window, and cursors older
+        than every story left, and return how many entries were dropped.
+        A dropped cursor reads as 0, which changes nothing once no story
+        at or below it remains.
+        """
+        cutoff = ((now or datetime.now()) - self.retention).isoformat()
+        seen = state['seen']
+        kept = {
+            seq: entry
+            for seq, entry in seen.items() if entry['seen_at'] >= cutoff
+        }
+        oldest = min((int(seq) for seq in kept), default=state['next_seq'])
+        cursors = {
+            chat_id: seq
+            for chat_id, seq in state['cursors'].items() if seq >= oldest
+        }
+        dropped = (len(seen) - len(kept)) + (len(state['cursors']) -
+                                             len(cursors))
+        state['seen'] = kept
+        state['cursors'] = cursors
+        return dropped
+
+    def compact_file(self, username: str,
+                     now: Optional[datetime] = None) -> int:
+        """Compact one state file and return the bytes reclaimed."""
+        with self._lock:
+            file_path = self.path(username)
+            try:
+                before = os.path.getsize(file_path)
+            except OSError:
+                return 0
+            raw = self._load(username)
+            if raw is None:
+                return 0
+            outdated = raw.get('version') != STATE_VERSION
+            state = self.migrate(raw)
+            if not self.compact_state(state, now) and not outdated:
+                return 0
+            self._write(username, state)
+            try:
+                return max(0, before - os.path.getsize(file_path))
+            except OSError:
+                return 0
+
+    async def compact_all(self, batch_size: int = 20) -> Dict[str, int]:
+        """
+        Compact every state file, a batch at a time in a worker thread so
+        the event loop keeps serving checks in between.
+        """
+        usernames = [
+            name[:-len('.json')] for name in os.listdir(self.directory)
+            if name.endswith('.json')
+        ]
+        reclaimed = 0
+        compacted = 0
+        for start in range(0, len(usernames), batch_size):
+            batch = usernames[start:start + batch_size]
+            results = await asyncio.to_thread(
+                lambda: [self.compact_file(username) for username in batch])
+            reclaimed += sum(results)
+            compacted += sum(1 for result in results if result)
+            await asyncio.sleep(0)
+        stats = {
+            'files': len(usernames),
+            'compacted': compacted,
+            'reclaimed_bytes': reclaimed
+        }
+        logger.info(f"Alert state compaction: {stats}")
+        return stats
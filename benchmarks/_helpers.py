@@ -0,0 +1,48 @@
+"""Data builders shared by the benchmark modules."""
+import hashlib
+import random
+from datetime import datetime
+from typing import Any, Dict, List
+
+# Realistic and extreme scale
+TRACKED_ACCOUNTS = 10_000
+CHATS = 50_000
+STORED_HASHES = 100_000
+RETAINED_HASHES = 200
+
+
+def fake_hash(n: int) -> str:
+    return hashlib.sha256(str(n).encode()).hexdigest()
+
+
+def make_story(n: int) -> Dict[str, str]:
+    return {'type': 'image', 'screenshot_hash': fake_hash(-n),
+            'media_hash': fake_hash(n)}
+
+
+def make_seen_state(count: int) -> Dict[str, Any]:
+    """A v2 alert state holding `count` seen stories, all within retention."""
+    seen_at = datetime.now().isoformat()
+    return {
+        "version": 2,
+        "next_seq": count + 1,
+        "seen": {
+            str(seq): {"hashes": f"{fake_hash(-seq)}:{fake_hash(seq)}",
+                       "seen_at": seen_at}
+            for seq in range(1, count + 1)
+        },
+        "cursors": {str(chat): count for chat in range(100)},
+        "timestamp": seen_at,
+        "last_check": seen_at
+    }
+
+
+def make_users(chats: int = CHATS,
+               accounts: int = TRACKED_ACCOUNTS) -> Dict[str, List[str]]:
+    """A users.json-shaped mapping: chat id -> 1..5 tracked usernames."""
+    rng = random.Random(42)
+    names = [f"account_{n}" for n in range(accounts)]
+    return {
+        str(1_000_000 + chat): rng.sample(names, rng.randint(1, 5))
+        for chat in range(chats)
+    }
@@ -0,0 +1,134 @@
+"""
+Offline microbenchmarks for the state, dedupe and subscription hot paths.
+
+Run them explicitly (they are skipped by a plain `pytest` run):
+
+    python -m pytest benchmarks -q
+    python -m pytest benchmarks -q --update-baseline
+
+Every benchmark reports ops/sec and peak traced memory and is compared
+with benchmarks/baseline.json; a benchmark that is slower, or uses more
+memory, than the baseline by more than --bench-tolerance fails.
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import pytest
+
+from benchmarks._helpers import make_users
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+_results: Dict[str, Dict[str, float]] = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption("--update-baseline", action="store_true",
+                    help="write the measured numbers to baseline.json")
+    group.addoption("--bench-tolerance", type=float, default=0.5,
+                    help="allowed slowdown/memory growth vs. the baseline "
+                    "(fraction, default 0.5)")
+
+
+def _load_baseline() -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, "r") as f:
+        return json.load(f)
+
+
+def _measure(fn: Callable[[], Any], rounds: int,
+             round_time: float) -> Dict[str, float]:
+    fn()  # warm up
+    best = 0.0
+    for _ in range(rounds):
+        calls = 0
+        gc.collect()
+        started = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= round_time:
+                break
+        best = max(best, calls / elapsed)
+
+    # Memory is traced separately; tracing slows everything down
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_sec": best, "peak_kib": peak / 1024}
+
+
+@pytest.fixture
+def bench(request):
+    """Measure a zero-argument callable and check it against the baseline."""
+    config = request.config
+
+    def run(fn: Callable[[], Any], rounds: int = 5,
+            round_time: float = 0.05) -> Dict[str, float]:
+        name = request.node.name
+        result = _measure(fn, rounds, round_time)
+        _results[name] = result
+        if config.getoption("update_baseline"):
+            return result
+
+        baseline = _load_baseline().get(name)
+        if baseline is None:
+            return result
+        tolerance = config.getoption("bench_tolerance")
+        slowest = baseline["ops_per_sec"] * (1 - tolerance)
+        if result["ops_per_sec"] < slowest:
+            pytest.fail(f"{name}: {result['ops_per_sec']:.1f} ops/s, "
+                        f"baseline {baseline['ops_per_sec']:.1f} ops/s")
+        # Small allocations are noise; only growth past 64 KiB counts
+        largest = baseline["peak_kib"] * (1 + tolerance) + 64
+        if result["peak_kib"] > largest:
+            pytest.fail(f"{name}: peak {result['peak_kib']:.0f} KiB, "
+                        f"baseline {baseline['peak_kib']:.0f} KiB")
+        return result
+
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if _results and session.config.getoption("update_baseline"):
+        baseline = _load_baseline()
+        baseline.update({
+            name: {key: round(value, 1) for key, value in result.items()}
+            for name, result in _results.items()
+        })
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write("\n")
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    baseline = _load_baseline()
+    terminalreporter.section("benchmarks")
+    terminalreporter.write_line(
+        f"{'name':<48} {'ops/sec':>12} {'peak KiB':>10} {'vs baseline':>12}")
+    for name, result in sorted(_results.items()):
+        change = ""
+        if name in baseline and baseline[name]["ops_per_sec"]:
+            ratio = result["ops_per_sec"] / baseline[name]["ops_per_sec"]
+            change = f"{ratio - 1:+.0%}"
+        terminalreporter.write_line(
+            f"{name:<48} {result['ops_per_sec']:>12.1f} "
+            f"{result['peak_kib']:>10.0f} {change:>12}")
+
+
+@pytest.fixture(scope="session")
+def users() -> Dict[str, List[str]]:
+    return make_users()
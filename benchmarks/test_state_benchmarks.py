@@ -0,0 +1,75 @@
+import pytest
+
+from alert_state_store import AlertStateStore
+from benchmarks._helpers import (RETAINED_HASHES, STORED_HASHES, fake_hash,
+                                 make_seen_state, make_story)
+from detection_pipeline import DetectionPipeline
+from instagram_monitor import InstagramMonitor
+
+SCALES = [RETAINED_HASHES, STORED_HASHES]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AlertStateStore(str(tmp_path / "alert_states"),
+                           retention_hours=48)
+
+
+@pytest.mark.parametrize("hashes", SCALES)
+def test_get_alert_state(bench, store, hashes):
+    store.set('someone', make_seen_state(hashes))
+    bench(lambda: store.get('someone'))
+
+
+@pytest.mark.parametrize("hashes", SCALES)
+def test_set_alert_state(bench, store, hashes):
+    state = make_seen_state(hashes)
+    bench(lambda: store.set('someone', state))
+
+
+@pytest.mark.parametrize("hashes", SCALES)
+def test_find_seen_miss(bench, hashes):
+    state = make_seen_state(hashes)
+    story = make_story(hashes + 1)
+    bench(lambda: AlertStateStore.find_seen(state, story))
+
+
+def test_record_seen(bench, store):
+    store.set('someone', make_seen_state(RETAINED_HASHES))
+    story = make_story(1)
+    bench(lambda: store.record_seen('someone', story))
+
+
+def test_advance_cursors(bench, store):
+    store.set('someone', make_seen_state(RETAINED_HASHES))
+    delivered = {str(chat): RETAINED_HASHES + 1 for chat in range(100)}
+    bench(lambda: store.advance_cursors('someone', delivered))
+
+
+def test_undelivered_chats(bench, tmp_path, monkeypatch):
+    # Dedupe of a seen story: which of an account's chats still need it
+    monkeypatch.chdir(tmp_path)
+    pipeline = DetectionPipeline(InstagramMonitor('user', 'pass'), None)
+    state = make_seen_state(RETAINED_HASHES)
+    chats = [str(chat) for chat in range(1000)]
+    bench(lambda: pipeline._undelivered('someone', state, RETAINED_HASHES,
+                                        chats))
+
+
+def test_compact_state(bench, store):
+    state = make_seen_state(STORED_HASHES)
+    bench(lambda: store.compact_state(state))
+
+
+def test_migrate_legacy_state(bench):
+    legacy = {
+        'hashes': {
+            f"someone-{n % 1000}-20240101-{fake_hash(-n)[:8]}-"
+            f"{fake_hash(n)[:8]}": f"{fake_hash(-n)}:{fake_hash(n)}"
+            for n in range(STORED_HASHES)
+        },
+        'timestamp': '',
+        'last_check': ''
+    }
+    bench(lambda: AlertStateStore.migrate(legacy), rounds=3)
+
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import run_bot
+from detection_pipeline import DetectionPipeline
+from fair_scheduler import FairScheduler
+from user_registry import UserRegistry
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch, users):
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps(users))
+    registry = UserRegistry(str(path))
+    monkeypatch.setattr(run_bot, 'registry', registry)
+    return registry
+
+
+def test_load_users_cached(bench, registry):
+    bench(run_bot.load_users)
+
+
+def test_load_users_cold(bench, registry):
+    bench(lambda: UserRegistry(registry.path).load())
+
+
+def test_add_and_remove_users(bench, registry):
+    names = [f"new_account_{n}" for n in range(10)]
+
+    def add_and_remove():
+        run_bot.add_users('1000000', names)
+        run_bot.remove_users('1000000', names)
+
+    bench(add_and_remove)
+
+
+def test_subscribers_index(bench, users):
+    bench(lambda: DetectionPipeline._subscribers(users))
+
+
+def test_fair_check_order(bench, users):
+    scheduler = FairScheduler({chat_id: 3 for chat_id in list(users)[:100]})
+    bench(lambda: scheduler.order(users))
+
+
+def test_parse_usernames(bench):
+    text = "\n".join(f"@account_{n}," for n in range(1000))
+    bench(lambda: run_bot.parse_usernames(text))
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+def _child_pids() -> Dict[int, List[int]]:
+    """Map each pid to its children by scanning /proc."""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The command name may contain spaces, ppid follows the ')'
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+# Regenerable parts of a Chromium profile, dropped first when it grows
+PROFILE_CACHE_DIRS = ('Default/Cache', 'Default/Code Cache',
+                      'Default/Service Worker/CacheStorage',
+                      'Default/Service Worker/ScriptCache', 'GrShaderCache',
+                      'ShaderCache', 'GraphiteDawnCache')
+
+
+def directory_size(path: str) -> int:
+    """Bytes used by the files below path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def prune_browser_profile(path: str, max_bytes: int) -> int:
+    """
+    Keep a persistent browser profile under max_bytes: drop its caches
+    first, then the whole profile (the session is restored from the
+    saved storage state). Call it while no browser uses the profile.
+    Returns the bytes freed.
+    """
+    size = directory_size(path)
+    if size <= max_bytes:
+        return 0
+    for relative in PROFILE_CACHE_DIRS:
+        shutil.rmtree(os.path.join(path, relative), ignore_errors=True)
+    remaining = directory_size(path)
+    if remaining > max_bytes:
+        shutil.rmtree(path, ignore_errors=True)
+        remaining = 0
+    logger.info(f"Pruned browser profile {path} from "
+                f"{size / 1024 / 1024:.0f} MB to "
+                f"{remaining / 1024 / 1024:.0f} MB")
+    return size - remaining
+
+
+def descendants_rss(root_pid: Optional[int] = None) -> int:
+    """
+    Total RSS of every process below root_pid (the Playwright driver,
+    Chromium and its renderers). Returns 0 where /proc isn't available.
+    """
+    if not os.path.isdir('/proc'):
+        return 0
+    root_pid = root_pid or os.getpid()
+    children = _child_pids()
+    total = 0
+    stack = list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        total += _rss_bytes(pid)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+class BrowserLifecycleManager:
+    """
+    Tracks browser memory and checks served, and recycles the browser
+    context (cheap) or the whole browser (thorough) past thresholds.
+
+    Every use of the browser goes through check_slot(), and each one that
+    actually drives the page reports it with page_used(); only those
+    count towards the check thresholds. A recycle stops
+    new slots from being handed out, waits for in-flight ones to drain,
+    waits out any login, saves the session, swaps the context or browser,
+    restores the session from storage state and lets waiting checks
+    resume.
+    """
+
+    def __init__(self,
+                 monitor,
+                 max_checks_per_context: int = 250,
+                 max_checks_per_browser: int = 2000,
+                 max_rss_mb: int = 1500,
+                 max_browser_age_hours: float = 24,
+                 rss_check_interval: float = 30,
+                 drain_timeout: float = 120):
+        self.monitor = monitor
+        self.max_checks_per_context = max_checks_per_context
+        self.max_checks_per_browser = max_checks_per_browser
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        # Contexts are recycled first, the browser once that isn't enough
+        self.context_rss_bytes = int(self.max_rss_bytes * 0.75)
+        self.max_browser_age = max_browser_age_hours * 3600
+        self.rss_check_interval = rss_check_interval
+        self.drain_timeout = drain_timeout
+
+        self.in_flight = 0
+        self.checks_in_context = 0
+        self.checks_in_browser = 0
+        self.context_recycles = 0
+        self.browser_recycles = 0
+        self.browser_started_at = time.monotonic()
+        self.last_rss = 0
+        self._last_rss_check = 0.0
+        self._ready = asyncio.Event()
+        self._ready.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._recycle_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, monitor) -> "BrowserLifecycleManager":
+        """Build a manager configured from the environment."""
+        return cls(
+            monitor,
+            max_checks_per_context=int(
+                os.getenv('BROWSER_MAX_CHECKS_PER_CONTEXT', '250')),
+            max_checks_per_browser=int(
+                os.getenv('BROWSER_MAX_CHECKS_PER_BROWSER', '2000')),
+            max_rss_mb=int(os.getenv('BROWSER_MAX_RSS_MB', '1500')),
+            max_browser_age_hours=float(
+                os.getenv('BROWSER_MAX_AGE_HOURS', '24')))
+
+    @asynccontextmanager
+    async def check_slot(self):
+        """Hold the browser for one check; waits while a recycle runs."""
+        await self._ready.wait()
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    def page_used(self) -> None:
+        """Count a check that rendered pages, not just fetched JSON."""
+        self.checks_in_context += 1
+        self.checks_in_browser += 1
+
+    def browser_started(self) -> None:
+        """Reset the per-browser counters after a launch."""
+        self.browser_started_at = time.monotonic()
+        self.checks_in_browser = 0
+        self.checks_in_context = 0
+
+    def measure_rss(self, force: bool = False) -> int:
+        """Sample browser RSS, at most once per rss_check_interval."""
+        now = time.monotonic()
+        if force or now - self._last_rss_check >= self.rss_check_interval:
+            self._last_rss_check = now
+            self.last_rss = descendants_rss()
+        return self.last_rss
+
+    def recycle_reason(self) -> Optional[str]:
+        """Return 'browser' or 'context' if a recycle is due, else None."""
+        if self.monitor.browser is None and self.monitor.context is None:
+            return None
+        rss = self.measure_rss()
+        if rss > self.max_rss_bytes:
+            return 'browser'
+        if self.checks_in_browser >= self.max_checks_per_browser:
+            return 'browser'
+        if time.monotonic() - self.browser_started_at > self.max_browser_age:
+            return 'browser'
+        if rss > self.context_rss_bytes:
+            return 'context'
+        if self.checks_in_context >= self.max_checks_per_context:
+            return 'context'
+        return None
+
+    async def maybe_recycle(self) -> None:
+        """Recycle if a threshold has been crossed."""
+        scope = self.recycle_reason()
+        if scope:
+            await self.recycle(scope)
+
+    async def recycle(self, scope: str = 'context') -> None:
+        """Drain in-flight checks, then replace the context or browser."""
+        if self._recycle_lock.locked():
+            return
+        async with self._recycle_lock:
+            self._ready.clear()
+            try:
+                rss_before = self.measure_rss(force=True)
+                logger.info(
+                    f"Recycling browser {scope} after "
+                    f"{self.checks_in_context} checks in context, "
+                    f"{self.checks_in_browser} in browser, "
+                    f"RSS {rss_before / 1024 / 1024:.0f} MB")
+                try:
+                    await asyncio.wait_for(self._idle.wait(),
+                                           self.drain_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"{self.in_flight} checks still running after "
+                        f"{self.drain_timeout}s, recycling anyway")
+
+                # Logins (e.g. warm-up or /download) run outside check
+                # slots; wait for them and keep new ones off the page
+                async with self.monitor.exclusive_browser():
+                    await self.monitor.save_session()
+                    if scope == 'browser':
+                        await self.monitor.cleanup_browser()
+                        await self.monitor.launch_browser()
+                        self.browser_recycles += 1
+                    else:
+                        await self.monitor.recycle_context()
+                        self.checks_in_context = 0
+                        self.context_recycles += 1
+                    await self.monitor.restore_session()
+
+                rss_after = self.measure_rss(force=True)
+                logger.info(f"Browser {scope} recycled, RSS now "
+                            f"{rss_after / 1024 / 1024:.0f} MB")
+            except Exception as e:
+                logger.error(f"Error recycling browser {scope}: {e}")
+            finally:
+                self._ready.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current counters for reporting."""
+        return {
+            'rss_mb': round(self.last_rss / 1024 / 1024, 1),
+            'in_flight': self.in_flight,
+            'checks_in_context': self.checks_in_context,
+            'checks_in_browser': self.checks_in_browser,
+            'context_recycles': self.context_recycles,
+            'browser_recycles': self.browser_recycles,
+            'browser_age_hours': round(
+                (time.monotonic() - self.browser_started_at) / 3600, 2)
+        }
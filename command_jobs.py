@@ -0,0 +1,226 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class JobLimitError(Exception):
+    """A chat hit its queue or rate limit; the message is user-facing."""
+
+
+class CommandJob:
+    """One heavy command (e.g. /download) waiting for or holding a worker."""
+
+    def __init__(self, job_id: int, chat_id: int, kind: str, description: str,
+                 run: Callable[["CommandJob"], Awaitable[None]]):
+        self.id = job_id
+        self.chat_id = chat_id
+        self.kind = kind
+        self.description = description
+        self.run = run
+        self.status = 'queued'
+        self.created_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.progress: Optional[Callable[[str], Awaitable[Any]]] = None
+
+    async def report(self, text: str) -> None:
+        """Send a progress update; never lets a failed update kill the job."""
+        if not self.progress:
+            return
+        try:
+            await self.progress(text)
+        except Exception as e:
+            logger.warning(f"Could not report progress of job {self.id}: {e}")
+
+
+class CommandJobManager:
+    """
+    Runs heavy bot commands on a bounded set of workers.
+
+    Handlers submit a job and return right away. Each chat has its own
+    queue; workers serve chats round-robin, never running more than
+    per_chat_concurrency jobs of one chat at a time, so a single chat
+    can't monopolize the scraping capacity. Submissions are also capped
+    per chat (queued jobs and jobs per rate window).
+
+    Jobs run in the process that received the command, on its own
+    browser, so every limit here is per process: under several webhook
+    workers a chat can get up to that many times the configured limits.
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 per_chat_concurrency: int = 1,
+                 per_chat_queued: int = 3,
+                 rate_limit: int = 5,
+                 rate_window: float = 60):
+        self.workers = workers
+        self.per_chat_concurrency = per_chat_concurrency
+        self.per_chat_queued = per_chat_queued
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+
+        self._ids = itertools.count(1)
+        self._queues: Dict[int, Deque[CommandJob]] = {}
+        self._running: Dict[int, List[CommandJob]] = {}
+        self._ready: Deque[int] = deque()
+        self._submissions: Dict[int, Deque[float]] = {}
+        self._wakeup = asyncio.Event()
+        self._worker_tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    @classmethod
+    def from_env(cls) -> "CommandJobManager":
+        """Build a manager configured from the environment."""
+        return cls(workers=int(os.getenv('JOB_WORKERS', '2')),
+                   per_chat_concurrency=int(
+                       os.getenv('JOB_PER_CHAT_CONCURRENCY', '1')),
+                   per_chat_queued=int(os.getenv('JOB_PER_CHAT_QUEUED', '3')),
+                   rate_limit=int(os.getenv('JOB_RATE_LIMIT', '5')),
+                   rate_window=float(os.getenv('JOB_RATE_WINDOW_SECONDS',
+                                               '60')))
+
+    def start(self) -> None:
+        """Start the worker tasks."""
+        if self._worker_tasks:
+            return
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel running jobs and stop the workers."""
+        for jobs in self._running.values():
+            for job in jobs:
+                job.task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, chat_id: int, kind: str, description: str,
+               run: Callable[[CommandJob], Awaitable[None]]) -> CommandJob:
+        """Queue a job for a chat, or raise JobLimitError."""
+        now = time.monotonic()
+        recent = self._submissions.setdefault(chat_id, deque())
+        while recent and now - recent[0] > self.rate_window:
+            recent.popleft()
+        if len(recent) >= self.rate_limit:
+            raise JobLimitError(
+                f"Slow down! You can start {self.rate_limit} of these every "
+                f"{self.rate_window:.0f} seconds.")
+        queue = self._queues.setdefault(chat_id, deque())
+        if len(queue) >= self.per_chat_queued:
+            raise JobLimitError(
+                f"You already have {len(queue)} jobs waiting. "
+                "Let them finish or /cancel one.")
+
+        recent.append(now)
+        job = CommandJob(next(self._ids), chat_id, kind, description, run)
+        queue.append(job)
+        self._mark_ready(chat_id)
+        return job
+
+    def position(self, job: CommandJob) -> int:
+        """1-based position of a queued job within its chat's queue."""
+        queue = self._queues.get(job.chat_id, deque())
+        return list(queue).index(job) + 1 if job in queue else 0
+
+    def jobs_for(self, chat_id: int) -> List[CommandJob]:
+        """Running and queued jobs of a chat."""
+        return list(self._running.get(chat_id, [])) + list(
+            self._queues.get(chat_id, []))
+
+    def cancel(self, chat_id: int,
+               job_id: Optional[int] = None) -> Optional[CommandJob]:
+        """Cancel a chat's job (the newest one if no id is given)."""
+        jobs = self.jobs_for(chat_id)
+        if job_id is not None:
+            jobs = [job for job in jobs if job.id == job_id]
+        if not jobs:
+            return None
+        job = max(jobs, key=lambda j: j.id)
+        if job.status == 'running':
+            job.task.cancel()
+        else:
+            self._queues[chat_id].remove(job)
+            job.status = 'cancelled'
+            self.cancelled += 1
+        return job
+
+    def _mark_ready(self, chat_id: int) -> None:
+        if (chat_id not in self._ready and self._queues.get(chat_id) and
+                len(self._running.get(chat_id, [])) <
+                self.per_chat_concurrency):
+            self._ready.append(chat_id)
+            self._wakeup.set()
+
+    def _next_job(self) -> Optional[CommandJob]:
+        while self._ready:
+            chat_id = self._ready.popleft()
+            queue = self._queues.get(chat_id)
+            if not queue:
+                continue
+            job = queue.popleft()
+            self._running.setdefault(chat_id, []).append(job)
+            # Round-robin: the chat goes to the back if it can run more
+            self._mark_ready(chat_id)
+            return job
+        return None
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: CommandJob) -> None:
+        job.status = 'running'
+        job.started_at = time.monotonic()
+        job.task = asyncio.create_task(job.run(job))
+        try:
+            await job.task
+            job.status = 'done'
+            self.completed += 1
+        except asyncio.CancelledError:
+            if not job.task.cancelled():
+                # The worker itself is being stopped
+                job.task.cancel()
+                raise
+            job.status = 'cancelled'
+            self.cancelled += 1
+            await job.report(f"🛑 Job #{job.id} cancelled.")
+        except Exception as e:
+            job.status = 'failed'
+            self.failed += 1
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+        finally:
+            running = self._running.get(job.chat_id, [])
+            if job in running:
+                running.remove(job)
+            if not running:
+                self._running.pop(job.chat_id, None)
+            if not self._queues.get(job.chat_id):
+                self._queues.pop(job.chat_id, None)
+            self._mark_ready(job.chat_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth and outcome counters."""
+        return {
+            'queued': sum(len(q) for q in self._queues.values()),
+            'running': sum(len(r) for r in self._running.values()),
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled
+        }
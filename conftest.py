@@ -0,0 +1,17 @@
+import os
+
+# The live-network scripts need real Instagram credentials and are run
+# directly (python3 test_instagram.py), not collected by pytest.
+collect_ignore = ["test_download.py", "test_instagram.py", "test_story_checker.py"]
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(__file__), "benchmarks")
+
+
+def pytest_ignore_collect(collection_path, config):
+    # Benchmarks are slow and only run when asked for (pytest benchmarks)
+    if str(collection_path) != BENCHMARKS_DIR:
+        return None
+    requested = (os.path.abspath(arg.split("::")[0]) for arg in config.args)
+    if any(path.startswith(BENCHMARKS_DIR) for path in requested):
+        return None
+    return True
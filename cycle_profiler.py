@@ -0,0 +1,141 @@
+import asyncio
+import cProfile
+import logging
+import os
+import pstats
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('cycle', 'download')
+
+# (chat_id, path of the .prof file, summary) -> awaitable
+Reporter = Callable[[Any, str, str], Awaitable[None]]
+
+
+class CycleProfiler:
+    """
+    Runs cProfile over the next N monitor cycles or /download runs when
+    an admin asks for it.
+
+    While nothing is armed, profile() is a dict lookup and a bare yield.
+    cProfile sees the whole event-loop thread, so a profiled run also
+    includes whatever other tasks ran alongside it. Each run is written
+    to <directory>/<kind>-<timestamp>-<suffix>.prof (open it with pstats
+    or snakeviz) and a top-functions summary goes to the reporter, or the
+    log when there is none. Reports go out in the background so a slow
+    upload doesn't hold up the next run.
+    """
+
+    def __init__(self,
+                 directory: str = "profiles",
+                 top: int = 15,
+                 reporter: Optional[Reporter] = None):
+        self.directory = directory
+        self.top = top
+        self.reporter = reporter
+        # kind -> {"remaining": runs left, "chat_id": who asked}
+        self.armed: Dict[str, Dict[str, Any]] = {}
+        self._active = False
+        self._reporting: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls) -> "CycleProfiler":
+        """Build a profiler configured from the environment."""
+        return cls(os.getenv('PROFILE_DIR', 'profiles'),
+                   top=int(os.getenv('PROFILE_TOP_FUNCTIONS', '15')))
+
+    def arm(self, kind: str, runs: int, chat_id: Any = None) -> None:
+        """Profile the next `runs` runs of `kind` and report to `chat_id`."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown profile kind: {kind}")
+        if runs <= 0:
+            self.armed.pop(kind, None)
+        else:
+            self.armed[kind] = {"remaining": runs, "chat_id": chat_id}
+
+    def disarm(self) -> None:
+        """Cancel all pending profiling."""
+        self.armed.clear()
+
+    @asynccontextmanager
+    async def profile(self, kind: str, label: str = ""):
+        """Profile the enclosed block if a run of this kind is armed."""
+        request = self.armed.get(kind)
+        # One profiler per thread; a run overlapping another isn't counted
+        if request is None or self._active:
+            yield
+            return
+
+        self._active = True
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._active = False
+            elapsed = time.perf_counter() - started
+            request["remaining"] -= 1
+            if request["remaining"] <= 0 and self.armed.get(kind) is request:
+                del self.armed[kind]
+            task = asyncio.create_task(
+                self._report(kind, label, profiler, elapsed,
+                             request["remaining"], request["chat_id"]))
+            self._reporting.add(task)
+            task.add_done_callback(self._reporting.discard)
+
+    async def flush(self) -> None:
+        """Wait for reports still being written or sent."""
+        if self._reporting:
+            await asyncio.gather(*self._reporting, return_exceptions=True)
+
+    async def _report(self, kind: str, label: str, profiler: cProfile.Profile,
+                      elapsed: float, remaining: int, chat_id: Any) -> None:
+        try:
+            await self._send_report(kind, label, profiler, elapsed, remaining,
+                                    chat_id)
+        except Exception as e:
+            logger.error(f"Error writing {kind} profile: {e}")
+
+    async def _send_report(self, kind: str, label: str,
+                           profiler: cProfile.Profile, elapsed: float,
+                           remaining: int, chat_id: Any) -> None:
+        path, rows = await asyncio.to_thread(self._write, kind, profiler)
+        header = f"{label or kind}: {elapsed:.2f}s"
+        if remaining > 0:
+            header += f" ({remaining} more to profile)"
+        summary = "\n".join([header, *rows])
+        logger.info(f"Profile written to {path}\n{summary}")
+        if self.reporter and chat_id is not None:
+            await self.reporter(chat_id, path, summary)
+
+    def _write(self, kind: str, profiler: cProfile.Profile):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        # Runs finishing within the same second, or in another worker,
+        # each get their own file
+        fd, path = tempfile.mkstemp(prefix=f"{kind}-{stamp}-",
+                                    suffix=".prof",
+                                    dir=self.directory)
+        os.close(fd)
+        profiler.dump_stats(path)
+        return path, self.summarize(pstats.Stats(profiler), self.top)
+
+    @staticmethod
+    def summarize(stats: pstats.Stats, top: int = 15) -> List[str]:
+        """Top functions by cumulative time, one line each."""
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3],
+                      reverse=True)[:top]
+        lines = ["   cum s   own s    calls  function"]
+        for (filename, line, name), (_, calls, own, cumulative,
+                                      _) in rows:
+            where = (f"{os.path.basename(filename)}:{line}"
+                     if filename != '~' else 'builtin')
+            lines.append(f"{cumulative:8.3f} {own:7.3f} {calls:8d}  "
+                         f"{name} ({where})")
+        return lines
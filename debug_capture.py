@@ -0,0 +1,123 @@
+import asyncio
+import gzip
+import html
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = ('.html.gz', '.png')
+
+
+class DebugCapture:
+    """
+    Saves what a Playwright page looked like when a step failed.
+
+    Each capture is <identity>-<step>-<timestamp>.html.gz (the page HTML
+    behind a comment naming the step, URL and error) plus, optionally,
+    a .png screenshot of the same name. Files are written off the event
+    loop, only the newest `max_captures` are kept, and a step is
+    captured at most once per `min_interval` seconds so a failure that
+    repeats every cycle doesn't keep rewriting the ring.
+    """
+
+    def __init__(self,
+                 directory: str = "debug_captures",
+                 max_captures: int = 20,
+                 screenshots: bool = True,
+                 min_interval: float = 600):
+        self.directory = directory
+        self.max_captures = max_captures
+        self.screenshots = screenshots
+        self.min_interval = min_interval
+        self._last: Dict[Tuple[str, str], float] = {}
+
+    @classmethod
+    def from_env(cls) -> "DebugCapture":
+        """Build a capture ring configured from the environment."""
+        return cls(os.getenv('DEBUG_CAPTURE_DIR', 'debug_captures'),
+                   max_captures=int(os.getenv('DEBUG_CAPTURE_MAX', '20')),
+                   screenshots=os.getenv('DEBUG_CAPTURE_SCREENSHOTS',
+                                         '1') != '0',
+                   min_interval=float(
+                       os.getenv('DEBUG_CAPTURE_INTERVAL_SECONDS', '600')))
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return re.sub(r'[^A-Za-z0-9_.]+', '_', name).strip('_') or 'unknown'
+
+    async def capture(self,
+                      page,
+                      identity: str,
+                      step: str,
+                      error: Optional[BaseException] = None
+                      ) -> Optional[str]:
+        """
+        Record the page after `step` failed. Returns the path of the HTML
+        capture, or None if capturing is off, throttled or failed.
+        """
+        if page is None or self.max_captures <= 0:
+            return None
+        key = (identity, step)
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.min_interval:
+            return None
+        self._last[key] = now
+
+        try:
+            content = await page.content()
+            screenshot = None
+            if self.screenshots:
+                try:
+                    screenshot = await page.screenshot(type='png')
+                except Exception as e:
+                    logger.debug(f"No screenshot for {step} capture: {e}")
+            header = html.escape(f"step: {step}\nurl: {page.url}\n"
+                                 f"error: {error!r}\n"
+                                 f"at: {datetime.now().isoformat()}")
+            stem = (f"{self._safe(identity)}-{self._safe(step)}-"
+                    f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+            path = await asyncio.to_thread(self._write, stem,
+                                           f"<!--\n{header}\n-->\n{content}",
+                                           screenshot)
+            logger.info(f"Saved debug capture of failed {step} to {path}")
+            return path
+        except Exception as e:
+            logger.error(f"Error saving debug capture of {step}: {e}")
+            return None
+
+    def _write(self, stem: str, content: str,
+               screenshot: Optional[bytes]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, stem + '.html.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(content)
+        if screenshot:
+            with open(os.path.join(self.directory, stem + '.png'),
+                      'wb') as f:
+                f.write(screenshot)
+        self._prune()
+        return path
+
+    def _prune(self) -> None:
+        """Delete the oldest captures beyond max_captures."""
+        stems: Dict[str, float] = {}
+        for name in os.listdir(self.directory):
+            for suffix in SUFFIXES:
+                if name.endswith(suffix):
+                    mtime = os.path.getmtime(
+                        os.path.join(self.directory, name))
+                    stem = name[:-len(suffix)]
+                    stems[stem] = max(stems.get(stem, 0), mtime)
+        oldest_first = sorted(stems, key=lambda stem: (stems[stem], stem))
+        for stem in oldest_first[:-self.max_captures]:
+            for suffix in SUFFIXES:
+                try:
+                    os.unlink(os.path.join(self.directory, stem + suffix))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,430 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import (Awaitable, Callable, Dict, Iterable, List, Optional, Set,
+                    Tuple, Union, Any)
+
+from fair_scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+# Sends one story alert to one chat: (chat_id, username, story) ->
+# delivered, or a future of it when the alert is held back (e.g. for a
+# digest); the cursor only advances once it resolves to True
+Notifier = Callable[[str, str, Dict[str, Any]],
+                    Awaitable[Union[bool, "asyncio.Future[bool]"]]]
+
+
+class PipelineStage:
+    """
+    One stage of the pipeline: a bounded input queue drained by a fixed
+    number of workers. A handler returns the items to pass on (none to
+    filter an item out, several to fan out). Putting into a full queue
+    blocks, so a slow stage pushes back on the stages before it.
+
+    Items with a lower priority number are served first (FIFO within a
+    priority), and whatever they produce keeps their priority.
+    """
+
+    def __init__(self,
+                 name: str,
+                 handler: Callable[[Any], Awaitable[Iterable[Any]]],
+                 concurrency: int = 1,
+                 queue_size: int = 50,
+                 output: Optional["PipelineStage"] = None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.output = output
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self._order = itertools.count()
+        self.processed = 0
+        self.failed = 0
+        self.in_progress = 0
+        self.max_depth = 0
+        self._workers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self.queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def put(self, item: Any, priority: int = 1) -> None:
+        """Queue an item, waiting while the queue is full."""
+        await self.queue.put((priority, next(self._order), item))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def join(self) -> None:
+        """Wait until every queued item has been handled."""
+        await self.queue.join()
+
+    def drain(self, min_priority: int = 1) -> List[Any]:
+        """
+        Take back queued items no worker has started on, oldest first.
+        Items more urgent than `min_priority` stay queued.
+        """
+        taken, kept = [], []
+        while not self.queue.empty():
+            entry = self.queue.get_nowait()
+            self.queue.task_done()
+            (taken if entry[0] >= min_priority else kept).append(entry)
+        for entry in kept:
+            self.queue.put_nowait(entry)
+        return [item for _, _, item in sorted(taken)]
+
+    async def _worker(self) -> None:
+        while True:
+            priority, _, item = await self.queue.get()
+            self.in_progress += 1
+            try:
+                results = await self.handler(item)
+                self.processed += 1
+                if self.output:
+                    for result in results or ():
+                        await self.output.put(result, priority)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Pipeline stage {self.name} failed: {e}")
+            finally:
+                self.in_progress -= 1
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'depth': self.queue.qsize() if self.queue else 0,
+            'max_depth': self.max_depth,
+            'in_progress': self.in_progress,
+            'processed': self.processed,
+            'failed': self.failed,
+            'concurrency': self.concurrency
+        }
+
+
+class DetectionPipeline:
+    """
+    probe -> capture -> dedupe -> commit -> notify
+
+    probe:   cheap check whether an account has a story at all
+    capture: fetch the story media into the media store
+    dedupe:  match hashes against the account's seen stories, and drop
+             stories every subscribing chat has already received
+    commit:  record a new story once for the account
+    notify:  fan out one alert per chat, advancing its delivery cursor
+
+    A cycle returns once commit has drained; deliveries keep going in the
+    background so a slow Telegram doesn't hold up the next cycle. A cycle
+    with a deadline stops feeding probe when it passes; the accounts it
+    didn't reach go first in the next cycle; the rest are ordered fairly
+    across chats by the FairScheduler.
+    """
+
+    def __init__(self,
+                 monitor,
+                 notifier: Notifier,
+                 concurrency: Optional[Dict[str, int]] = None,
+                 queue_size: int = 50,
+                 scheduler: Optional[FairScheduler] = None):
+        self.monitor = monitor
+        self.notifier = notifier
+        # Check order across chats
+        self.scheduler = scheduler or FairScheduler()
+        concurrency = {
+            'probe': 2,
+            'capture': 1,
+            'dedupe': 2,
+            'commit': 1,
+            'notify': 4,
+            **(concurrency or {})
+        }
+        self.notify = PipelineStage('notify', self._notify,
+                                    concurrency['notify'], queue_size)
+        self.commit = PipelineStage('commit', self._commit,
+                                    concurrency['commit'], queue_size,
+                                    self.notify)
+        self.dedupe = PipelineStage('dedupe', self._dedupe,
+                                    concurrency['dedupe'], queue_size,
+                                    self.commit)
+        self.capture = PipelineStage('capture', self._capture,
+                                     concurrency['capture'], queue_size,
+                                     self.dedupe)
+        self.probe = PipelineStage('probe', self._probe, concurrency['probe'],
+                                   queue_size, self.capture)
+        self.stages = [self.probe, self.capture, self.dedupe, self.commit,
+                       self.notify]
+        self.store = monitor.alert_states
+        self.media = monitor.media_store
+        # Deliveries handed to notify, and delivered but not yet persisted
+        self._inflight: Set[Tuple[str, str, int]] = set()
+        self._delivered: Dict[str, Dict[str, int]] = {}
+        self.stories_recorded = 0
+        self.alerts_sent = 0
+        self.alerts_failed = 0
+        # username -> monotonic time of its last probe (or of being tracked)
+        self.last_checked: Dict[str, float] = {}
+        self._carry_over: List[str] = []
+        self.last_cycle: Dict[str, Any] = {}
+
+    @classmethod
+    def from_env(cls, monitor, notifier: Notifier) -> "DetectionPipeline":
+        """Build a pipeline with per-stage concurrency from the environment."""
+        concurrency = {
+            stage: int(
+                os.getenv(f'PIPELINE_{stage.upper()}_CONCURRENCY', default))
+            for stage, default in (('probe', '2'), ('capture', '1'),
+                                   ('dedupe', '2'), ('commit', '1'),
+                                   ('notify', '4'))
+        }
+        return cls(monitor,
+                   notifier,
+                   concurrency,
+                   queue_size=int(os.getenv('PIPELINE_QUEUE_SIZE', '50')),
+                   scheduler=FairScheduler.from_env())
+
+    def start(self) -> None:
+        for stage in self.stages:
+            stage.start()
+
+    async def stop(self) -> None:
+        for stage in self.stages:
+            await stage.stop()
+        await self.flush_cursors()
+
+    @staticmethod
+    def _subscribers(users: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        subscribers: Dict[str, List[str]] = {}
+        for chat_id, usernames in users.items():
+            for username in usernames:
+                subscribers.setdefault(username, []).append(chat_id)
+        return subscribers
+
+    def _cycle_order(self, users: Dict[str, List[str]],
+                     subscribers: Dict[str, List[str]]) -> List[str]:
+        carried = [name for name in self._carry_over if name in subscribers]
+        first = set(carried)
+        return carried + [
+            name for name in self.scheduler.order(users) if name not in first
+        ]
+
+    async def run_cycle(self,
+                        users: Dict[str, List[str]],
+                        deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Push every tracked account through the pipeline once, or as many
+        as can start before `deadline` (a time.monotonic() value).
+        Returns the cycle's coverage report.
+        """
+        self.start()
+        await self.flush_cursors()
+        started = time.monotonic()
+        subscribers = self._subscribers(users)
+        order = self._cycle_order(users, subscribers)
+        self.last_checked = {
+            username: self.last_checked.get(username, started)
+            for username in subscribers
+        }
+
+        fed = 0
+        for username in order:
+            item = {'username': username, 'chats': subscribers[username]}
+            if deadline is None:
+                await self.probe.put(item)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self.probe.put(item), remaining)
+                except asyncio.TimeoutError:
+                    break
+            fed += 1
+        carry_over = order[fed:]
+        if deadline is not None:
+            try:
+                await asyncio.wait_for(self.probe.join(),
+                                       max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                # Probes that haven't started go to the next cycle too
+                carry_over = [item['username']
+                              for item in self.probe.drain()] + carry_over
+
+        for stage in (self.probe, self.capture, self.dedupe, self.commit):
+            await stage.join()
+        await self.flush_cursors()
+
+        self._carry_over = carry_over
+        self.last_cycle = self._cycle_report(started, order, carry_over)
+        return self.last_cycle
+
+    def _cycle_report(self, started: float, order: List[str],
+                      carry_over: List[str]) -> Dict[str, Any]:
+        now = time.monotonic()
+        checked = sum(1 for username in order
+                      if self.last_checked[username] > started)
+        return {
+            'accounts': len(order),
+            'checked': checked,
+            'coverage': checked / len(order) if order else 1.0,
+            'carried_over': len(carry_over),
+            'duration': now - started,
+            # Age of the account that has waited longest for a check
+            'max_staleness': max((now - self.last_checked[username]
+                                  for username in carry_over),
+                                 default=0.0)
+        }
+
+    async def check_now(self, users: Dict[str, List[str]]) -> None:
+        """Queue accounts ahead of everything waiting in the pipeline."""
+        self.start()
+        for username, chats in self._subscribers(users).items():
+            await self.probe.put({'username': username, 'chats': chats},
+                                 priority=0)
+
+    async def _probe(self, item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.last_checked[item['username']] = time.monotonic()
+        probe = await self.monitor.probe_story(item['username'])
+        return [{**item, 'probe': probe}] if probe else []
+
+    async def _capture(self, item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        story = await self.monitor.capture_story(item['username'],
+                                                 item['probe'])
+        if not story:
+            return []
+        # Held until the story is dropped or every alert for it settles,
+        # so eviction can't remove blobs an alert is about to send
+        await self._pin(story)
+        return [{**item, 'story': story}]
+
+    @staticmethod
+    def _blobs(story: Dict[str, Any]) -> List[str]:
+        return [
+            story[key] for key in ('screenshot_hash', 'media_hash')
+            if story.get(key)
+        ]
+
+    async def _pin(self, story: Dict[str, Any], count: int = 1) -> None:
+        await asyncio.to_thread(self.media.pin, *self._blobs(story) * count)
+
+    async def _unpin(self, story: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.media.unpin, *self._blobs(story))
+
+    def _undelivered(self, username: str, state: Dict[str, Any], seq: int,
+                     chats: List[str]) -> List[str]:
+        delivered = self._delivered.get(username, {})
+        return [
+            chat_id for chat_id in chats
+            if max(self.store.cursor(state, chat_id),
+                   delivered.get(str(chat_id), 0)) < seq and
+            (str(chat_id), username, seq) not in self._inflight
+        ]
+
+    async def _dedupe(self, item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        try:
+            items = await self._dedupe_story(item)
+        except BaseException:
+            await self._unpin(item['story'])
+            raise
+        if not items:
+            await self._unpin(item['story'])
+        return items
+
+    async def _dedupe_story(self,
+                            item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        username = item['username']
+        state = await asyncio.to_thread(self.store.get, username)
+        seq = self.store.find_seen(state, item['story'])
+        if seq is None:
+            return [{**item, 'seq': None}]
+        # Seen before: only chats that haven't received it yet
+        chats = self._undelivered(username, state, seq, item['chats'])
+        return [{**item, 'seq': seq, 'chats': chats}] if chats else []
+
+    async def _commit(self, item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        username, seq, chats = item['username'], item['seq'], item['chats']
+        try:
+            if seq is None:
+                seq = await asyncio.to_thread(self.store.record_seen,
+                                              username, item['story'])
+                # A priority check and the cycle can both find the story
+                # new; whichever commits second only fans out to chats
+                # the first one didn't already take
+                state = await asyncio.to_thread(self.store.get, username)
+                chats = self._undelivered(username, state, seq, chats)
+                if chats and len(chats) == len(item['chats']):
+                    self.stories_recorded += 1
+            # One pin per alert, released as each one settles
+            await self._pin(item['story'], len(chats))
+        finally:
+            await self._unpin(item['story'])
+        for chat_id in chats:
+            self._inflight.add((str(chat_id), username, seq))
+        return [{
+            'chat_id': chat_id,
+            'username': username,
+            'story': item['story'],
+            'seq': seq
+        } for chat_id in chats]
+
+    async def _notify(self, item: Dict[str, Any]) -> List[Any]:
+        chat_id, username, seq = item['chat_id'], item['username'], item['seq']
+        blobs = self._blobs(item['story'])
+        try:
+            delivered = await self.notifier(chat_id, username, item['story'])
+        except BaseException:
+            self._inflight.discard((str(chat_id), username, seq))
+            self.media.unpin(*blobs)
+            raise
+        if isinstance(delivered, asyncio.Future):
+            # Held back: free the worker, settle when it goes out
+            def settle_held(future: asyncio.Future) -> None:
+                self.media.unpin(*blobs)
+                self._settle(
+                    chat_id, username, seq, not future.cancelled() and
+                    future.exception() is None and future.result())
+
+            delivered.add_done_callback(settle_held)
+        else:
+            self.media.unpin(*blobs)
+            self._settle(chat_id, username, seq, delivered)
+        return []
+
+    def _settle(self, chat_id: str, username: str, seq: int,
+                delivered: bool) -> None:
+        self._inflight.discard((str(chat_id), username, seq))
+        if delivered:
+            self.alerts_sent += 1
+            cursors = self._delivered.setdefault(username, {})
+            cursors[str(chat_id)] = max(cursors.get(str(chat_id), 0), seq)
+        else:
+            # The cursor stays put, so the next cycle tries again
+            self.alerts_failed += 1
+
+    async def flush_cursors(self) -> None:
+        """Persist delivery cursors, one write per account."""
+        delivered, self._delivered = self._delivered, {}
+        for username, cursors in delivered.items():
+            await asyncio.to_thread(self.store.advance_cursors, username,
+                                    cursors)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and throughput of every stage."""
+        stats: Dict[str, Any] = {
+            stage.name: stage.stats()
+            for stage in self.stages
+        }
+        stats['stories_recorded'] = self.stories_recorded
+        stats['alerts_sent'] = self.alerts_sent
+        stats['alerts_failed'] = self.alerts_failed
+        return stats
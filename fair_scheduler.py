@@ -0,0 +1,71 @@
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FairScheduler:
+    """
+    Orders a cycle's account checks by deficit round-robin over chats,
+    so a chat tracking hundreds of accounts can't push everyone else's
+    to the back of the cycle.
+
+    Each round a chat earns its weight in credit and spends one credit
+    per account it gets checked, in the order it tracks them. An account
+    several chats track is checked once, as soon as any of them reaches
+    it, and costs the others nothing, so shared accounts are served with
+    the combined weight of their chats.
+    """
+
+    def __init__(self,
+                 weights: Optional[Dict[str, float]] = None,
+                 default_weight: float = 1.0):
+        self.weights = {str(chat): w for chat, w in (weights or {}).items()}
+        self.default_weight = default_weight
+
+    @classmethod
+    def from_env(cls) -> "FairScheduler":
+        """Build a scheduler with CHAT_WEIGHTS ("chat_id:weight,...")."""
+        weights = {}
+        for entry in os.getenv('CHAT_WEIGHTS', '').split(','):
+            chat_id, _, weight = entry.strip().partition(':')
+            if not chat_id:
+                continue
+            try:
+                weights[chat_id] = float(weight)
+            except ValueError:
+                logger.error(f"Ignoring invalid chat weight: {entry!r}")
+        return cls(weights,
+                   default_weight=float(
+                       os.getenv('DEFAULT_CHAT_WEIGHT', '1')))
+
+    def weight(self, chat_id: str) -> float:
+        return self.weights.get(str(chat_id), self.default_weight)
+
+    def order(self, users: Dict[str, List[str]]) -> List[str]:
+        """Every tracked account once, in fair check order."""
+        queues: Dict[str, Deque[str]] = {
+            chat_id: deque(usernames)
+            for chat_id, usernames in users.items()
+            if usernames and self.weight(chat_id) > 0
+        }
+        deficits = dict.fromkeys(queues, 0.0)
+        scheduled: Dict[str, None] = {}
+        while queues:
+            for chat_id in list(queues):
+                queue = queues[chat_id]
+                deficits[chat_id] += self.weight(chat_id)
+                while queue and deficits[chat_id] >= 1:
+                    username = queue.popleft()
+                    if username not in scheduled:
+                        scheduled[username] = None
+                        deficits[chat_id] -= 1
+                if not queue:
+                    del queues[chat_id]
+        # Chats weighted 0 still get their accounts checked, last
+        for usernames in users.values():
+            for username in usernames:
+                scheduled.setdefault(username, None)
+        return list(scheduled)
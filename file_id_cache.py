@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import ExitStack, asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Any
+
+from telegram import InputMediaPhoto, InputMediaVideo, Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# Fragments of the errors Telegram returns for stale or foreign file_ids
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier",
+                  "file reference")
+
+
+class FileIdCache:
+    """
+    Persistent map of media hash -> Telegram file_id.
+
+    The first successful upload of a piece of media records the file_id
+    Telegram hands back; every later delivery, to any chat, references
+    that id instead of uploading the bytes again.
+
+    Entries are kept oldest first, so trimming to `max_entries` is cheap.
+    Changes stay in memory; the send helpers write them from a worker
+    thread at most every `save_interval` seconds (maybe_flush). Call
+    flush() before exiting.
+    """
+
+    def __init__(self,
+                 path: str = "telegram_file_ids.json",
+                 max_entries: int = 10000,
+                 save_interval: float = 30):
+        self.path = path
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        # key -> [lock, deliveries holding or waiting for it]
+        self._upload_locks: Dict[str, List[Any]] = {}
+        self._dirty = False
+        self._last_save = 0.0
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading file_id cache: {e}")
+            return {}
+        return dict(
+            sorted(entries.items(), key=lambda item: item[1]["stored_at"]))
+
+    def flush(self) -> None:
+        """Write pending changes to disk (blocking)."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._last_save = time.monotonic()
+        # Entries are replaced, never mutated, so a shallow copy is stable
+        entries = dict(self.entries)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving file_id cache: {e}")
+            self._dirty = True
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    async def maybe_flush(self) -> None:
+        """Write pending changes off the event loop if they are due."""
+        if self._dirty and (time.monotonic() - self._last_save >=
+                            self.save_interval):
+            await asyncio.to_thread(self.flush)
+
+    @staticmethod
+    def _key(media_hash: str, kind: str) -> str:
+        return f"{kind}:{media_hash}"
+
+    def get(self, media_hash: str, kind: str) -> Optional[str]:
+        """Return the cached file_id for a media hash, if any."""
+        entry = self.entries.get(self._key(media_hash, kind))
+        return entry["file_id"] if entry else None
+
+    def set(self, media_hash: str, kind: str, file_id: str) -> None:
+        """Record the file_id Telegram assigned to an upload."""
+        key = self._key(media_hash, kind)
+        # Re-inserted at the end, keeping the dict oldest first
+        self.entries.pop(key, None)
+        self.entries[key] = {"file_id": file_id, "stored_at": time.time()}
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+        self._dirty = True
+
+    def discard(self, media_hash: str, kind: str) -> None:
+        """Forget a file_id Telegram no longer accepts."""
+        if self.entries.pop(self._key(media_hash, kind), None):
+            self._dirty = True
+
+    @asynccontextmanager
+    async def upload_lock(self, media_hash: str,
+                          kind: str) -> AsyncIterator[None]:
+        """Lets concurrent deliveries wait for the first upload."""
+        key = self._key(media_hash, kind)
+        entry = self._upload_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._upload_locks[key]
+
+
+def is_file_id_error(error: BadRequest) -> bool:
+    """Whether Telegram rejected a request over a file_id it doesn't know."""
+    message = str(error).lower()
+    return any(marker in message for marker in FILE_ID_ERRORS)
+
+
+def _sent_file_id(message: Message, kind: str) -> Optional[str]:
+    if kind == "photo" and message.photo:
+        return message.photo[-1].file_id
+    if kind == "video" and message.video:
+        return message.video.file_id
+    return None
+
+
+async def send_story_media(bot, cache: FileIdCache, chat_id: Any, kind: str,
+                           media_hash: str, path: str, **kwargs) -> Message:
+    """
+    Send a photo or video to a chat, uploading the file only if Telegram
+    doesn't already have it under a cached file_id.
+    """
+    send = bot.send_photo if kind == "photo" else bot.send_video
+
+    file_id = cache.get(media_hash, kind)
+    if file_id:
+        try:
+            return await send(chat_id=chat_id, **{kind: file_id}, **kwargs)
+        except BadRequest as e:
+            if not is_file_id_error(e):
+                raise
+            logger.warning(f"Cached file_id for {media_hash[:8]} rejected, "
+                           f"re-uploading: {e}")
+            cache.discard(media_hash, kind)
+
+    async with cache.upload_lock(media_hash, kind):
+        # Another delivery may have finished the upload while we waited
+        file_id = cache.get(media_hash, kind)
+        if file_id:
+            return await send(chat_id=chat_id, **{kind: file_id}, **kwargs)
+
+        with open(path, "rb") as f:
+            message = await send(chat_id=chat_id, **{kind: f}, **kwargs)
+        new_file_id = _sent_file_id(message, kind)
+        if new_file_id:
+            cache.set(media_hash, kind, new_file_id)
+            await cache.maybe_flush()
+        return message
+
+
+async def send_story_album(bot, cache: FileIdCache, chat_id: Any,
+                           items: List[Dict[str, Any]]) -> List[Message]:
+    """
+    Send up to 10 photos/videos as one album. Each item has "kind",
+    "media_hash", "path" and an optional "caption"; media Telegram
+    already has goes by file_id, the rest is uploaded and cached.
+    """
+    for attempt in range(2):
+        with ExitStack() as files:
+            media = []
+            for item in items:
+                kind = item["kind"]
+                source = cache.get(item["media_hash"], kind)
+                if source is None:
+                    source = files.enter_context(open(item["path"], "rb"))
+                input_media = (InputMediaPhoto
+                               if kind == "photo" else InputMediaVideo)
+                media.append(input_media(media=source,
+                                         caption=item.get("caption"),
+                                         parse_mode="HTML"))
+            try:
+                messages = await bot.send_media_group(chat_id=chat_id,
+                                                      media=media)
+                break
+            except BadRequest as e:
+                # Other rejections (caption too long, ...) aren't about
+                # the cached ids, and re-uploading wouldn't fix them
+                if attempt or not is_file_id_error(e):
+                    raise
+                logger.warning(f"Album with cached file_ids rejected, "
+                               f"re-uploading: {e}")
+                for item in items:
+                    cache.discard(item["media_hash"], item["kind"])
+
+    for item, message in zip(items, messages):
+        if cache.get(item["media_hash"], item["kind"]) is None:
+            new_file_id = _sent_file_id(message, item["kind"])
+            if new_file_id:
+                cache.set(item["media_hash"], item["kind"], new_file_id)
+    await cache.maybe_flush()
+    return messages
@@ -0,0 +1,9 @@
+import os
+
+# Webhook mode: gunicorn manages uvicorn workers serving run_bot:app
+bind = f"0.0.0.0:{os.getenv('PORT', '443')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+timeout = 120
+keepalive = 5
+graceful_timeout = 30
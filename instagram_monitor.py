@@ -5,67 +5,134 @@ import json
 import sys
 import hashlib
 from datetime import datetime, timedelta
-from playwright.async_api import async_playwright, TimeoutError
 import logging
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Set, Tuple, Any
 import asyncio
-from dotenv import load_dotenv
 import random
+from contextlib import asynccontextmanager
+
+from alert_state_store import AlertStateStore
+from browser_lifecycle import BrowserLifecycleManager, prune_browser_profile
+from cycle_profiler import CycleProfiler
+from debug_capture import DebugCapture
+from log_setup import configure_logging, hot_logger
+from detection_pipeline import DetectionPipeline
+from media_store import MediaStore
+from profile_cache import ProfileCache
+from request_throttle import CircuitOpenError, RequestThrottle
+from story_buffer import StoryBuffer, budget_from_env
+from user_registry import UserRegistry
+from story_api import (InstagramStoryAPI, StoryAPIError, SessionChallengedError,
+                       RateLimitedError, AccountNotFoundError,
+                       ProfileMismatchError, INSTAGRAM_BASE_URL)
 
-# Load environment variables
-load_dotenv()
-
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# Per-account and per-hash messages, rate limited
+item_logger = hot_logger(__name__)
 
 
 class InstagramMonitor:
 
-    def __init__(self, instagram_username: str, instagram_password: str):
+    def __init__(self,
+                 instagram_username: str,
+                 instagram_password: str,
+                 registry: Optional[UserRegistry] = None):
         self.bot_token = os.getenv(
             'BOT_TOKEN')  # keep this if you still use it here
         self.instagram_username = instagram_username
         self.instagram_password = instagram_password
-        self.check_interval_minutes = 5
+        # Target start-to-start cadence of monitoring cycles
+        self.check_interval_minutes = float(
+            os.getenv('CHECK_INTERVAL_MINUTES', '5'))
+        # A cycle stops starting checks after this long; the rest carry over
+        self.cycle_budget_seconds = float(
+            os.getenv('CYCLE_BUDGET_SECONDS',
+                      str(self.check_interval_minutes * 60 * 0.8)))
+        self.min_cycle_sleep_seconds = float(
+            os.getenv('MIN_CYCLE_SLEEP_SECONDS', '30'))
         self.max_retries = 3
         self.retry_delay = 5
 
-        # Ensure required directories exist
-        self.alert_states_dir = "alert_states"
-        os.makedirs(self.alert_states_dir, exist_ok=True)
+        # Paces all Instagram traffic of this account, pauses it if flagged
+        self.throttle = RequestThrottle.from_env(instagram_username or
+                                                 'anonymous',
+                                                 max_retries=self.max_retries,
+                                                 retry_delay=self.retry_delay)
+
+        # Seen-story hashes per username, compacted to a retention window
+        self.alert_states = AlertStateStore.from_env()
+        self.alert_states_dir = self.alert_states.directory
+        self.compact_interval_minutes = float(
+            os.getenv('ALERT_STATE_COMPACT_MINUTES', '60'))
+
+        # Content-addressed store for captured story media
+        self.media_store = MediaStore.from_env()
+
+        # Videos are first identified by a ranged read of their head (0
+        # disables); only unknown fingerprints are downloaded in full
+        self.fingerprint_bytes = int(os.getenv('MEDIA_FINGERPRINT_KB',
+                                               '64')) * 1024
+        self.fingerprint_tail_bytes = int(
+            os.getenv('MEDIA_FINGERPRINT_TAIL_KB', '0')) * 1024
 
-        # Load tracked users
+        # Caps the bytes in-flight captures may hold in memory
+        self.capture_budget = budget_from_env()
+
+        # Load tracked users (the bot passes its registry to share state)
         self.users_file = "users.json"
+        self.registry = registry or UserRegistry(self.users_file)
         self.tracked_users = self.load_users()
+        self._run_task: Optional[asyncio.Task] = None
+        self._priority_tasks: Set[asyncio.Task] = set()
+        self._compaction_task: Optional[asyncio.Task] = None
+        self._last_compaction: Optional[float] = None
 
         # Initialize browser context
+        self.playwright = None
         self.browser = None
         self.context = None
         self.page = None
         self.last_login_time = None
         self.login_interval = timedelta(hours=6)  # Re-login every 6 hours
 
+        # Playwright storage state, so restarts can skip the login form
+        self.session_file = os.getenv('IG_SESSION_FILE', 'state.json')
+        self._login_lock = asyncio.Lock()
+        # The single page is shared by checks and /download
+        self.page_lock = asyncio.Lock()
+        # Optional persistent profile, so Instagram's static assets stay
+        # in Chromium's disk cache across restarts and recycles
+        self.browser_profile_dir = os.getenv('BROWSER_PROFILE_DIR') or None
+        self.browser_disk_cache_bytes = int(
+            os.getenv('BROWSER_DISK_CACHE_MB', '256')) * 1024 * 1024
+        self.browser_profile_max_bytes = int(
+            os.getenv('BROWSER_PROFILE_MAX_MB', '1024')) * 1024 * 1024
+        self.service_workers = os.getenv('BROWSER_SERVICE_WORKERS', 'block')
+        # Recycles contexts/the browser before memory grows unbounded
+        self.lifecycle = BrowserLifecycleManager.from_env(self)
+
+        # Browserless JSON fast path, falls back to the browser on failure
+        self.use_http_fast_path = os.getenv('IG_HTTP_FAST_PATH', '1') != '0'
+        self.api_base_url = os.getenv('IG_API_BASE_URL', INSTAGRAM_BASE_URL)
+        self.story_api = None
+        # username -> user id and visibility, so reels are fetched by id
+        self.profile_cache = ProfileCache.from_env()
+
+        # probe -> capture -> dedupe -> commit -> notify; the bot swaps in
+        # a notifier that sends the media itself
+        self.pipeline = DetectionPipeline.from_env(self, self.notify_story)
+        # Off unless an admin arms it with /profile
+        self.profiler = CycleProfiler.from_env()
+        # Page HTML/screenshots of failed steps, for post-mortems
+        self.debug_capture = DebugCapture.from_env()
+
     def load_users(self) -> Dict[str, List[str]]:
-        """Load users from the users file."""
-        if not os.path.exists(self.users_file):
-            return {}
-        try:
-            with open(self.users_file, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading users: {e}")
-            return {}
+        """Load users from the shared registry."""
+        return self.registry.load()
 
     def save_users(self, users: Dict[str, List[str]]) -> None:
-        """Save users to the users file."""
-        try:
-            with open(self.users_file, "w") as f:
-                json.dump(users, f)
-        except Exception as e:
-            logger.error(f"Error saving users: {e}")
+        """Save users to the shared registry."""
+        self.registry.save(users)
 
     def get_story_hash(self, content: bytes) -> str:
         """Create a unique hash from story content."""
@@ -73,25 +140,12 @@ class InstagramMonitor:
 
     def get_last_alert_state(self, username: str) -> Dict[str, Any]:
         """Get the last alert state for a user."""
-        file_path = os.path.join(self.alert_states_dir, f"{username}.json")
-        if not os.path.exists(file_path):
-            return {"hashes": {}, "timestamp": "", "last_check": ""}
-        try:
-            with open(file_path, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error reading alert state for {username}: {e}")
-            return {"hashes": {}, "timestamp": "", "last_check": ""}
+        return self.alert_states.get(username)
 
     def set_last_alert_state(self, username: str, state: Dict[str,
                                                               Any]) -> None:
         """Set the last alert state for a user."""
-        try:
-            file_path = os.path.join(self.alert_states_dir, f"{username}.json")
-            with open(file_path, "w") as f:
-                json.dump(state, f)
-        except Exception as e:
-            logger.error(f"Error saving alert state for {username}: {e}")
+        self.alert_states.set(username, state)
 
     def send_telegram_message(self, chat_id: str, message: str) -> bool:
         """Send a message via Telegram bot."""
@@ -100,7 +154,7 @@ class InstagramMonitor:
             data = {"chat_id": chat_id, "text": message, "parse_mode": "HTML"}
             response = requests.post(url, data=data)
             if response.ok:
-                logger.info(f"Sent alert to {chat_id}")
+                item_logger.info("Sent alert to %s", chat_id)
             else:
                 logger.error(
                     f"Failed to send alert to {chat_id}: {response.text}")
@@ -115,24 +169,159 @@ class InstagramMonitor:
             return True
         return datetime.now() - self.last_login_time > self.login_interval
 
+    def _load_storage_state(self) -> Optional[Dict[str, Any]]:
+        """Read the saved browser session, if there is a usable one."""
+        if not os.path.exists(self.session_file):
+            return None
+        try:
+            with open(self.session_file, "r") as f:
+                state = json.load(f)
+            return state if state.get("cookies") else None
+        except Exception as e:
+            logger.error(f"Error loading saved session: {e}")
+            return None
+
+    async def launch_browser(self) -> None:
+        """Start Chromium and open a context with the saved session, if any."""
+        if self.browser is not None:
+            return
+        # Imported lazily so importing this module stays cheap
+        from playwright.async_api import async_playwright
+
+        # Read the saved session while Chromium starts
+        storage_state_task = asyncio.create_task(
+            asyncio.to_thread(self._load_storage_state))
+        self.playwright = await async_playwright().start()
+        args = [
+            '--no-sandbox', '--disable-setuid-sandbox',
+            '--disable-dev-shm-usage', '--disable-accelerated-2d-canvas',
+            '--disable-gpu', '--window-size=1920,1080'
+        ]
+        if self.browser_profile_dir:
+            await self.launch_persistent_context(args, storage_state_task)
+        else:
+            self.browser = await self.playwright.chromium.launch(
+                headless=True, args=args)
+            storage_state = await storage_state_task
+            self.context = await self.browser.new_context(
+                storage_state=storage_state,
+                service_workers=self.service_workers)
+            self.page = await self.context.new_page()
+        self.lifecycle.browser_started()
+
+    async def launch_persistent_context(
+            self, args: List[str],
+            storage_state_task: "asyncio.Task") -> None:
+        """Open the browser on the persistent profile directory."""
+        await asyncio.to_thread(prune_browser_profile,
+                                self.browser_profile_dir,
+                                self.browser_profile_max_bytes)
+        chromium = self.playwright.chromium
+        self.context = await chromium.launch_persistent_context(
+            self.browser_profile_dir,
+            headless=True,
+            args=args +
+            [f'--disk-cache-size={self.browser_disk_cache_bytes}'],
+            service_workers=self.service_workers)
+        # A persistent context is its own browser: closing it shuts down
+        # Chromium, so it stands in for self.browser
+        self.browser = self.context
+        storage_state = await storage_state_task
+        cookies = await self.context.cookies()
+        if storage_state and not any(cookie['name'] == 'sessionid'
+                                     for cookie in cookies):
+            # Fresh or pruned profile: seed it with the saved session
+            await self.context.add_cookies(storage_state['cookies'])
+        self.page = (self.context.pages[0]
+                     if self.context.pages else await self.context.new_page())
+
+    async def recycle_context(self) -> None:
+        """Replace the browser context, carrying over the saved session."""
+        if self.browser_profile_dir:
+            # The persistent context stays (with its cache); fresh pages
+            # release the renderer memory
+            old_pages = list(self.context.pages)
+            self.page = await self.context.new_page()
+            for page in old_pages:
+                try:
+                    await page.close()
+                except Exception as e:
+                    logger.error(f"Error closing page: {e}")
+            return
+        try:
+            await self.context.close()
+        except Exception as e:
+            logger.error(f"Error closing browser context: {e}")
+        storage_state = await asyncio.to_thread(self._load_storage_state)
+        self.context = await self.browser.new_context(
+            storage_state=storage_state,
+            service_workers=self.service_workers)
+        self.page = await self.context.new_page()
+
+    @asynccontextmanager
+    async def browser_page(self):
+        """Exclusive use of the shared page, counted by the lifecycle manager."""
+        async with self.lifecycle.check_slot():
+            async with self.page_lock:
+                try:
+                    yield self.page
+                finally:
+                    self.lifecycle.page_used()
+
+    @asynccontextmanager
+    async def exclusive_browser(self):
+        """Keep logins and page use out, e.g. while the browser is swapped."""
+        async with self._login_lock:
+            async with self.page_lock:
+                yield
+
+    async def restore_session(self) -> bool:
+        """Treat a saved session cookie as logged in, skipping the login form."""
+        if self.context is None:
+            return False
+        cookies = await self.context.cookies()
+        if any(cookie['name'] == 'sessionid' and cookie['value']
+               for cookie in cookies):
+            logger.info("Restored Instagram session from saved state.")
+            self.last_login_time = datetime.now()
+            return True
+        return False
+
+    async def save_session(self) -> None:
+        """Persist the browser session for the next start."""
+        try:
+            await self.context.storage_state(path=self.session_file)
+        except Exception as e:
+            logger.error(f"Error saving session: {e}")
+
+    async def ensure_logged_in(self) -> bool:
+        """Log in only if there is no live session or it is due for refresh."""
+        async with self._login_lock:
+            if self.browser is not None and not self.should_relogin():
+                return True
+            if self.browser is None:
+                await self.launch_browser()
+                if await self.restore_session():
+                    return True
+            return await self.login_to_instagram()
+
+    async def warm_up(self) -> bool:
+        """Launch the browser and restore or create a session ahead of use."""
+        return await self.ensure_logged_in()
+
     async def login_to_instagram(self) -> bool:
         """Login to Instagram and return success status."""
+        # The login form drives the shared page, so take turns with checks
+        async with self.page_lock:
+            return await self._login_to_instagram()
+
+    async def _login_to_instagram(self) -> bool:
         try:
-            if self.browser is None:
-                playwright = await async_playwright().start()
-                self.browser = await playwright.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--no-sandbox', '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-accelerated-2d-canvas', '--disable-gpu',
-                        '--window-size=1920,1080'
-                    ])
-                self.context = await self.browser.new_context()
-                self.page = await self.context.new_page()
-
-            await self.page.goto('https://www.instagram.com/accounts/login/',
-                                 wait_until='domcontentloaded')
+            await self.launch_browser()
+
+            await self.throttle.call(lambda: self.page.goto(
+                'https://www.instagram.com/accounts/login/',
+                wait_until='domcontentloaded'))
             await asyncio.sleep(2)  # Allow page to load
 
             # Updated selectors for username and password fields
@@ -143,6 +332,7 @@ class InstagramMonitor:
 
             if not username_field or not password_field:
                 logger.error("Could not find username or password field.")
+                await self.capture_failure('login-form')
                 return False
 
             # Enter credentials
@@ -154,6 +344,7 @@ class InstagramMonitor:
                 'button[type="submit"]')
             if not login_button:
                 logger.error("Could not find login button.")
+                await self.capture_failure('login-form')
                 return False
 
             await login_button.click()
@@ -163,6 +354,7 @@ class InstagramMonitor:
             if await self.page.query_selector('svg[aria-label="Home"]'):
                 logger.info("Successfully logged in to Instagram.")
                 self.last_login_time = datetime.now()
+                await self.save_session()
                 return True
 
             # Check for login error messages
@@ -171,20 +363,49 @@ class InstagramMonitor:
             if error_message:
                 error_text = await error_message.text_content()
                 logger.error(f"Login failed: {error_text}")
+                await self.capture_failure('login')
                 return False
 
             logger.error("Login failed for an unknown reason.")
+            await self.capture_failure('login')
             return False
 
         except Exception as e:
             logger.error(f"Error during Instagram login: {e}")
+            await self.capture_failure('login', e)
             return False
 
-        finally:
-            if self.page:
-                content = await self.page.content()
-                with open('debug_instagram_login.html', 'w') as f:
-                    f.write(content)
+    async def capture_failure(self,
+                              step: str,
+                              error: Optional[BaseException] = None) -> None:
+        """Save the current page for debugging after a failed step."""
+        await self.debug_capture.capture(self.page, self.throttle.identity,
+                                         step, error)
+
+    async def navigate(self, url: str):
+        """
+        Load a page through the throttle. Raises SessionChallengedError if
+        Instagram redirects to login or a challenge and RateLimitedError
+        on 429s; timeouts and other browser errors are retried.
+        """
+        from playwright.async_api import Error as PlaywrightError
+
+        async def visit():
+            response = await self.page.goto(url)
+            if response and response.status == 429:
+                raise RateLimitedError(f"HTTP 429 from {url}")
+            if ('/accounts/login' in self.page.url or
+                    '/challenge' in self.page.url):
+                self.last_login_time = None
+                raise SessionChallengedError(
+                    f"Redirected to {self.page.url}")
+            return response
+
+        return await self.throttle.call(visit,
+                                        flagged=(SessionChallengedError,
+                                                 RateLimitedError),
+                                        retryable=(RateLimitedError,
+                                                   PlaywrightError))
 
     async def handle_route(self, route):
         """Handle request interception."""
@@ -196,6 +417,9 @@ class InstagramMonitor:
 
     async def cleanup_browser(self) -> None:
         """Clean up browser resources."""
+        if self.story_api:
+            await self.story_api.close()
+            self.story_api = None
         if self.browser:
             try:
                 await self.browser.close()
@@ -205,20 +429,124 @@ class InstagramMonitor:
                 self.browser = None
                 self.context = None
                 self.page = None
-
-    async def download_media_content(self, url: str) -> Optional[bytes]:
-        """Download media content from URL."""
+                self.last_login_time = None
+        if self.playwright:
+            try:
+                await self.playwright.stop()
+            except Exception as e:
+                logger.error(f"Error stopping Playwright: {e}")
+            finally:
+                self.playwright = None
+
+    async def get_story_api(self) -> InstagramStoryAPI:
+        """Return the pooled HTTP client, synced with the browser's cookies."""
+        cookies = await self.context.cookies() if self.context else []
+        if self.story_api is None:
+            user_agent = await self.page.evaluate(
+                'navigator.userAgent') if self.page else None
+            self.story_api = InstagramStoryAPI(cookies,
+                                               base_url=self.api_base_url,
+                                               user_agent=user_agent,
+                                               throttle=self.throttle)
+        else:
+            self.story_api.update_cookies(cookies)
+        return self.story_api
+
+    async def new_capture_buffer(self,
+                                 expected_size: Optional[int] = None
+                                 ) -> StoryBuffer:
+        """Create a capture buffer charged against the memory budget."""
+        return await StoryBuffer.create(self.capture_budget, expected_size)
+
+    async def download_media_content(self,
+                                     url: str) -> Optional[StoryBuffer]:
+        """Download media content from URL into a capture buffer."""
         try:
-            response = requests.get(url, timeout=10)
-            if response.ok:
-                return response.content
-            logger.error(f"Failed to download media: {response.status_code}")
-            return None
+            story_api = await self.get_story_api()
+            return await story_api.download_to(url, self.new_capture_buffer)
         except Exception as e:
             logger.error(f"Error downloading media: {e}")
             return None
 
-    async def get_story_content(self, story_element) -> Dict[str, Any]:
+    async def media_fingerprint(self, url: str) -> Optional[str]:
+        """Fingerprint a video from a ranged read, or None if disabled/failed."""
+        if not self.fingerprint_bytes:
+            return None
+        try:
+            story_api = await self.get_story_api()
+            return await story_api.fingerprint(url, self.fingerprint_bytes,
+                                               self.fingerprint_tail_bytes)
+        except Exception as e:
+            logger.warning(f"Error fingerprinting media: {e}")
+            return None
+
+    async def known_media(self, url: str) -> Tuple[Optional[str],
+                                                     Optional[str]]:
+        """
+        Fingerprint a video and look it up in the media store. Returns
+        (fingerprint, media_hash); media_hash is None if it must be
+        downloaded.
+        """
+        fingerprint = await self.media_fingerprint(url)
+        if fingerprint is None:
+            return None, None
+        return fingerprint, await asyncio.to_thread(
+            self.media_store.find_fingerprint, fingerprint)
+
+    def _put_buffer(self, buffer: StoryBuffer, media_hash: str) -> None:
+        if buffer.in_memory:
+            self.media_store.put(buffer.getbuffer(), media_hash)
+        else:
+            self.media_store.put_file(buffer.open(), media_hash)
+
+    def release_story(self, story: Dict[str, Any]) -> None:
+        """Free the capture buffers of a story that wasn't stored."""
+        for key in ('screenshot', 'media_content'):
+            if isinstance(story.get(key), StoryBuffer):
+                story[key].close()
+
+    async def store_story(self, username: str,
+                          story: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Move a story's screenshot and media buffers into the media store,
+        replacing them with blob paths senders can stream from.
+        """
+        try:
+            await asyncio.to_thread(self._put_buffer, story['screenshot'],
+                                    story['screenshot_hash'])
+            # None when the media blob was already stored (fingerprint hit)
+            if story['media_content'] is not None and (
+                    story['media_content'] is not story['screenshot']):
+                await asyncio.to_thread(self._put_buffer,
+                                        story['media_content'],
+                                        story['media_hash'])
+        finally:
+            self.release_story(story)
+        del story['screenshot'], story['media_content']
+        await asyncio.to_thread(self.media_store.record_story, username,
+                                story)
+        story['screenshot_path'] = self.media_store.blob_path(
+            story['screenshot_hash'])
+        story['media_path'] = self.media_store.blob_path(story['media_hash'])
+        return story
+
+    def load_stored_story(self, stored: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a story dict from an entry of the media store index."""
+        return {
+            'type': stored['type'],
+            'screenshot_hash': stored['screenshot_hash'],
+            'screenshot_path': self.media_store.blob_path(
+                stored['screenshot_hash']),
+            'media_hash': stored['media_hash'],
+            'media_path': self.media_store.blob_path(stored['media_hash']),
+            'story_id': stored.get('story_id'),
+            'source': 'store'
+        }
+
+    async def get_story_content(self,
+                                story_element,
+                                username: Optional[str] = None
+                                ) -> Dict[str, Any]:
         """Extract and process story content including media and screenshot."""
         try:
             # Get media elements with updated selectors
@@ -239,136 +567,278 @@ class InstagramMonitor:
                 return None
 
             # Take full screenshot of the story with maximum quality
-            screenshot = await story_element.screenshot(
+            screenshot_bytes = await story_element.screenshot(
                 type='png',
                 animations='disabled',  # Capture the current frame for videos
                 scale='css',  # Use CSS pixels for consistent sizing
                 quality=100  # Maximum quality for PNG
             )
 
-            if not screenshot:
+            if not screenshot_bytes:
                 logger.warning("Could not take screenshot")
                 return None
-
-            # Download media content
-            media_content = await self.download_media_content(content_url)
-            if not media_content:
-                logger.warning("Could not download media content")
-                return None
-
-            # Generate hashes
-            screenshot_hash = self.get_story_hash(screenshot)
-            media_hash = self.get_story_hash(media_content)
-
-            return {
+            screenshot_hash = self.get_story_hash(screenshot_bytes)
+            screenshot = await StoryBuffer.from_bytes(screenshot_bytes,
+                                                      self.capture_budget)
+            del screenshot_bytes
+
+            # A video we already hold needs no second download
+            fingerprint = media_hash = None
+            if content_type == 'video' and username:
+                fingerprint, media_hash = await self.known_media(content_url)
+            if media_hash:
+                media_content = None
+            else:
+                # Stream media content into a budgeted buffer
+                media_content = await self.download_media_content(
+                    content_url)
+                if not media_content:
+                    logger.warning("Could not download media content")
+                    screenshot.close()
+                    return None
+                media_hash = media_content.hexdigest()
+
+            story = {
                 'type': content_type,
                 'screenshot': screenshot,
                 'screenshot_hash': screenshot_hash,
                 'media_content': media_content,
                 'media_hash': media_hash
             }
+            if username:
+                story = await self.store_story(username, story)
+                if fingerprint and media_content is not None:
+                    await asyncio.to_thread(
+                        self.media_store.record_fingerprint, fingerprint,
+                        media_hash)
+            return story
 
         except Exception as e:
             logger.error(f"Error getting story content: {e}")
             return None
 
-    def generate_hash_key(self, username: str, chat_id: str,
-                          story: Dict[str, Any]) -> str:
+    async def probe_story_http(self,
+                               username: str) -> Optional[Dict[str, Any]]:
         """
-        Generate a unique hash key for a story that combines:
-        - Username
-        - Chat ID
-        - Date (YYYYMMDD format)
-        - First 8 chars of screenshot hash
-        - First 8 chars of media hash (if available)
+        Return the latest story item of a user through the JSON endpoints
+        using the browser session's cookies, or None if there is no story.
+        Raises StoryAPIError if the browser has to take over.
         """
-        date_str = datetime.now().strftime("%Y%m%d")
-        screenshot_hash_prefix = story['screenshot_hash'][:8]
-        media_hash_prefix = story.get(
-            'media_hash', '')[:8] if story.get('media_hash') else 'no-media'
-
-        return f"{username}-{chat_id}-{date_str}-{screenshot_hash_prefix}-{media_hash_prefix}"
-
-    def compare_story_content(self, new_content: Dict[str, Any],
-                              old_hashes: Dict[str, str]) -> bool:
+        if self.context is None:
+            raise StoryAPIError("No browser session to borrow cookies from")
+        story_api = await self.get_story_api()
+        if not story_api.has_session():
+            raise SessionChallengedError("No sessionid cookie")
+
+        profile = await self.resolve_profile(story_api, username)
+        if self.profile_cache.skip_reason(profile):
+            return None
+        try:
+            item = await story_api.get_latest_story_item(
+                username, profile['user_id'])
+        except ProfileMismatchError as e:
+            # The cached id answers to another name now: look it up again
+            item_logger.info("@%s was renamed: %s", username, e)
+            self.profile_cache.invalidate(username)
+            profile = await self.resolve_profile(story_api, username)
+            item = await story_api.get_latest_story_item(
+                username, profile['user_id'])
+        return item
+
+    async def resolve_profile(self, story_api: InstagramStoryAPI,
+                              username: str) -> Dict[str, Any]:
         """
-        Compare story content with previously seen stories using both screenshot and media hashes.
-        Returns True if the story is new, False if it's been seen before.
+        Cached profile of a username, looked up when missing or stale.
+        Raises AccountNotFoundError for accounts that don't exist.
         """
-        if not new_content:
-            return False
-
-        # Get new content hashes
-        screenshot_hash = new_content['screenshot_hash']
-        media_hash = new_content.get('media_hash')
-
-        # If we have no previous hashes, it's definitely new
-        if not old_hashes:
-            return True
+        profile = self.profile_cache.get(username)
+        if profile is None:
+            try:
+                profile = self.profile_cache.put(
+                    username, **await story_api.get_profile(username))
+            except AccountNotFoundError:
+                self.profile_cache.mark_missing(username)
+                raise
+        if not profile.get('exists', True):
+            raise AccountNotFoundError(f"@{username} doesn't exist")
+        return profile
+
+    async def capture_story_http(self, username: str,
+                                 item: Dict[str, Any]) -> Dict[str, Any]:
+        """Fetch a probed story item into the media store."""
+        stored = await asyncio.to_thread(self.media_store.find_story,
+                                         username, item['id'])
+        if stored:
+            return self.load_stored_story(stored)
+        fingerprint = media_hash = None
+        if item['type'] == 'video' and item['thumbnail_url']:
+            fingerprint, media_hash = await self.known_media(item['media_url'])
+        story_api = await self.get_story_api()
+        story = await story_api.fetch_story(item, self.new_capture_buffer,
+                                            media_hash)
+        downloaded = story['media_content'] is not None
+        story = await self.store_story(username, story)
+        if fingerprint and downloaded:
+            await asyncio.to_thread(self.media_store.record_fingerprint,
+                                    fingerprint, story['media_hash'])
+        return story
+
+    async def check_story_http(self,
+                               username: str) -> Optional[Dict[str, Any]]:
+        """Check a user's story through the JSON endpoints."""
+        item = await self.probe_story_http(username)
+        if item is None:
+            return None
+        return await self.capture_story_http(username, item)
 
-        for hash_key, stored_hashes in old_hashes.items():
+    async def check_story_browser(self,
+                                  username: str) -> Optional[Dict[str, Any]]:
+        """Check a user's story by rendering the profile in the browser."""
+        async with self.page_lock:
             try:
-                # Split stored combined hash into screenshot and media hashes
-                stored_screenshot_hash, stored_media_hash = stored_hashes.split(
-                    ':')
-
-                # Story is considered the same if either:
-                # 1. Screenshot hashes match
-                # 2. Media hashes exist and match
-                if screenshot_hash == stored_screenshot_hash:
-                    logger.info(
-                        f"Found matching screenshot hash in {hash_key}")
-                    return False
-                if media_hash and stored_media_hash and media_hash == stored_media_hash:
-                    logger.info(f"Found matching media hash in {hash_key}")
-                    return False
-
-            except ValueError:
-                # Handle legacy format or corrupted hash entries
-                if screenshot_hash == stored_hashes or (
-                        media_hash and media_hash == stored_hashes):
-                    logger.info(f"Found matching legacy hash in {hash_key}")
-                    return False
-
-        # If we get here, no matches were found - it's a new story
-        logger.info("No matching hashes found - this is a new story")
-        return True
+                return await self._check_story_browser(username)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                await self.capture_failure('story-check', e)
+                raise
+            finally:
+                self.lifecycle.page_used()
 
-    async def check_story(self, username: str) -> Dict[str, Any]:
-        """Check if a user has posted a new story."""
-        try:
-            if not await self.login_to_instagram():
-                logger.error("Failed to login to Instagram")
-                return None
+    async def _check_story_browser(self,
+                                   username: str) -> Optional[Dict[str, Any]]:
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 
-            logger.info(f"Checking stories for @{username}...")
-            await self.page.goto(f'https://www.instagram.com/{username}/')
-            await self.page.wait_for_load_state('networkidle')
+        response = await self.navigate(f'https://www.instagram.com/{username}/')
+        if response and response.status == 404:
+            item_logger.info("@%s doesn't exist", username)
+            self.profile_cache.mark_missing(username)
+            return None
+        await self.page.wait_for_load_state('networkidle')
+        if await self.page.query_selector(
+                'h2:has-text("This account is private")'):
+            item_logger.info("@%s is private", username)
+            self.profile_cache.mark_private(username)
+            return None
 
-            # Look for story ring
+        # Look for story ring; most profiles have none, which isn't a failure
+        try:
             story_button = await self.page.wait_for_selector(
                 'div[role="button"] canvas', timeout=5000)
-            if not story_button:
-                logger.info(f"No story found for @{username}")
-                return None
+        except PlaywrightTimeoutError:
+            story_button = None
+        if not story_button:
+            item_logger.info("No story found for @%s", username)
+            return None
 
-            # Click on the story
-            await story_button.click()
-            await self.page.wait_for_selector('div[role="dialog"]',
-                                              timeout=5000)
+        # Click on the story
+        await story_button.click()
+        await self.page.wait_for_selector('div[role="dialog"]', timeout=5000)
 
-            # Get story content
-            story_content = await self.get_story_content(self.page)
-            if not story_content:
-                logger.warning(f"Could not get story content for @{username}")
-                return None
+        # Get story content
+        story_content = await self.get_story_content(self.page, username)
+        if not story_content:
+            logger.warning(f"Could not get story content for @{username}")
+            return None
+
+        return story_content
 
-            return story_content
+    @asynccontextmanager
+    async def _browser_use(self):
+        """Hold a lifecycle slot, recycling the browser afterwards if due."""
+        try:
+            async with self.lifecycle.check_slot():
+                yield
+        finally:
+            await self.lifecycle.maybe_recycle()
 
+    async def probe_story(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Cheap first look at a user's stories. Returns None if there is
+        nothing to capture, otherwise a probe for capture_story: the story
+        item on the fast path, or a marker that the browser has to look.
+        """
+        try:
+            async with self._browser_use():
+                # Private or deleted accounts cost no request at all
+                skip = self.profile_cache.skip_reason(
+                    self.profile_cache.get(username))
+                if skip:
+                    item_logger.info("Skipping @%s: %s", username, skip)
+                    return None
+
+                if not await self.ensure_logged_in():
+                    logger.error("Failed to login to Instagram")
+                    return None
+
+                item_logger.info("Checking stories for @%s...", username)
+
+                if self.use_http_fast_path:
+                    try:
+                        item = await self.probe_story_http(username)
+                        if item is None:
+                            item_logger.info("No story found for @%s", username)
+                            return None
+                        return {'mode': 'api', 'item': item}
+                    except AccountNotFoundError as e:
+                        item_logger.info("Skipping @%s: %s", username, e)
+                        return None
+                    except SessionChallengedError as e:
+                        logger.warning(
+                            f"Session challenged on fast path for @{username}, "
+                            f"falling back to browser: {e}")
+                        self.last_login_time = None
+                    except StoryAPIError as e:
+                        logger.warning(
+                            f"Fast path failed for @{username}, "
+                            f"falling back to browser: {e}")
+
+                # The browser checks and captures in one go on the page
+                return {'mode': 'browser'}
+
+        except CircuitOpenError as e:
+            item_logger.warning("Skipping @%s: %s", username, e)
+            return None
         except Exception as e:
             logger.error(f"Error checking story for @{username}: {str(e)}")
             return None
 
+    async def capture_story(self, username: str,
+                            probe: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Capture the story a probe found."""
+        try:
+            async with self._browser_use():
+                if probe['mode'] == 'api':
+                    try:
+                        return await self.capture_story_http(
+                            username, probe['item'])
+                    except StoryAPIError as e:
+                        logger.warning(
+                            f"Fast path capture failed for @{username}, "
+                            f"falling back to browser: {e}")
+                return await self.check_story_browser(username)
+
+        except CircuitOpenError as e:
+            item_logger.warning("Skipping @%s: %s", username, e)
+            return None
+        except Exception as e:
+            logger.error(f"Error capturing story for @{username}: {str(e)}")
+            return None
+
+    async def check_story(self, username: str) -> Optional[Dict[str, Any]]:
+        """Probe and capture a user's current story."""
+        probe = await self.probe_story(username)
+        if probe is None:
+            return None
+        return await self.capture_story(username, probe)
+
+    async def notify_story(self, chat_id: str, username: str,
+                           story: Dict[str, Any]) -> bool:
+        """Default notifier: a text alert through the Bot API."""
+        message = f"🎭 <b>@{username}</b> just posted a new story!"
+        return await asyncio.to_thread(self.send_telegram_message, chat_id,
+                                       message)
+
     async def run(self) -> None:
         """Main monitoring loop."""
         while True:
@@ -381,19 +851,88 @@ class InstagramMonitor:
                     await asyncio.sleep(60)
                     continue
 
-                # Check each tracked username
-                for chat_id, usernames in self.tracked_users.items():
-                    for username in usernames:
-                        await self.check_story(username)
-                        await asyncio.sleep(2)  # Small delay between users
-
-                # Sleep before next check
-                await asyncio.sleep(self.check_interval_minutes * 60)
+                cycle_started = time.monotonic()
+                async with self.profiler.profile(
+                        'cycle',
+                        f"Cycle of {len(self.tracked_users)} chats"):
+                    report = await self.pipeline.run_cycle(
+                        self.tracked_users,
+                        deadline=cycle_started + self.cycle_budget_seconds)
+
+                self.maybe_compact_alert_states()
+                # Story, fingerprint and profile records are batched
+                await asyncio.to_thread(self.media_store.flush)
+                await asyncio.to_thread(self.profile_cache.flush)
+
+                logger.info(
+                    "Cycle checked %d/%d accounts (%.0f%%) in %.0fs, "
+                    "%d carried over, oldest unchecked %.0fs",
+                    report['checked'], report['accounts'],
+                    report['coverage'] * 100, report['duration'],
+                    report['carried_over'], report['max_staleness'])
+                logger.info("Pipeline stats: %s", self.pipeline.stats())
+                logger.info("Throttle stats: %s", self.throttle.stats())
+                logger.info("Browser stats: %s", self.lifecycle.stats())
+
+                # Sleep out the rest of the cadence, not a full interval
+                elapsed = time.monotonic() - cycle_started
+                await asyncio.sleep(
+                    max(self.check_interval_minutes * 60 - elapsed,
+                        self.min_cycle_sleep_seconds))
 
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {e}")
                 await asyncio.sleep(60)  # Wait a minute before retrying
 
+    def maybe_compact_alert_states(self) -> Optional[asyncio.Task]:
+        """Start a background compaction pass once per interval."""
+        if self._compaction_task and not self._compaction_task.done():
+            return self._compaction_task
+        now = time.monotonic()
+        if (self._last_compaction is not None and now - self._last_compaction
+                < self.compact_interval_minutes * 60):
+            return None
+        self._last_compaction = now
+        self._compaction_task = asyncio.create_task(
+            self.alert_states.compact_all())
+        return self._compaction_task
+
+    def request_priority_check(self, users: Dict[str, List[str]]) -> bool:
+        """
+        Check accounts (chat id -> usernames) ahead of the regular cycle,
+        e.g. right after they were tracked. Returns False if the monitor
+        loop doesn't run in this process.
+        """
+        if self._run_task is None or self._run_task.done():
+            return False
+        task = asyncio.create_task(self.pipeline.check_now(users))
+        self._priority_tasks.add(task)
+        task.add_done_callback(self._priority_tasks.discard)
+        return True
+
+    def start(self) -> asyncio.Task:
+        """Run the monitoring loop as a background task in the current loop."""
+        if self._run_task is None or self._run_task.done():
+            self._run_task = asyncio.create_task(self.run())
+            logger.info("Instagram monitor started.")
+        return self._run_task
+
+    async def stop(self) -> None:
+        """Stop the monitoring loop, letting it unwind cleanly."""
+        task, self._run_task = self._run_task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            logger.info("Instagram monitor stopped.")
+        if self._compaction_task and not self._compaction_task.done():
+            self._compaction_task.cancel()
+        await self.pipeline.stop()
+        await asyncio.to_thread(self.media_store.flush)
+        await asyncio.to_thread(self.profile_cache.flush)
+
     async def __aenter__(self):
         """Async context manager entry."""
         return self
@@ -404,10 +943,16 @@ class InstagramMonitor:
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    configure_logging()
 
     async def main():
         try:
-            async with InstagramMonitor() as monitor:
+            async with InstagramMonitor(
+                    instagram_username=os.getenv('IG_USERNAME'),
+                    instagram_password=os.getenv('IG_PASSWORD')) as monitor:
                 await monitor.run()
         except KeyboardInterrupt:
             print("\nShutting down...")
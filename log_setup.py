@@ -0,0 +1,129 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, TextIO, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+_RECORD_ATTRS = set(
+    logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created,
+                                           timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records with the same message template through
+    per `interval` seconds. The first record after a quiet spell carries
+    the number it stands in for as `suppressed`.
+    """
+
+    def __init__(self, interval: float = 60, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        # (logger, template) -> [window start, emitted, suppressed]
+        self._windows: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                    record.msg = f"{record.msg} (+{suppressed} suppressed)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def hot_logger(name: str) -> logging.Logger:
+    """
+    Logger for per-item messages (one per account, hash or story): the
+    same message template is rate limited per LOG_SAMPLE_SECONDS.
+    """
+    logger = logging.getLogger(f"{name}.hot")
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(
+            RateLimitFilter(interval=float(
+                os.getenv('LOG_SAMPLE_SECONDS', '60')),
+                            burst=int(os.getenv('LOG_SAMPLE_BURST', '5'))))
+    return logger
+
+
+def configure_logging(level: Optional[str] = None,
+                      fmt: Optional[str] = None,
+                      stream: Optional[TextIO] = None) -> None:
+    """
+    Route all logging through a queue to a background thread that does
+    the (possibly slow) writing, so callers never block on stdout.
+    LOG_LEVEL and LOG_FORMAT (json or text) are the defaults. Calling it
+    again replaces the previous setup.
+    """
+    global _listener, _queue_handler
+    shutdown_logging()
+
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt ==
+                        'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and detach the queue handler."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Any, BinaryIO
+
+logger = logging.getLogger(__name__)
+
+
+class MediaStore:
+    """
+    Content-addressed on-disk store for story media.
+
+    Blobs are keyed by their SHA-256 (the same digest get_story_hash
+    produces) and sharded by the first two hex characters, so identical
+    media is stored once no matter how many users or chats reference it.
+    An index maps each username to the stories whose blobs we hold, and
+    cheap media fingerprints (see InstagramStoryAPI.fingerprint) to the
+    blobs they identify.
+
+    Every method may block on disk, so call them off the event loop.
+    Index changes are written at most every `save_interval` seconds, and
+    on flush(), which the monitor runs after every cycle. Pinned blobs (e.g. those of alerts still being delivered)
+    are never evicted.
+    """
+
+    def __init__(self,
+                 root: str = "media_store",
+                 max_bytes: int = 512 * 1024 * 1024,
+                 max_age_seconds: float = 48 * 3600,
+                 save_interval: float = 5):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_file = os.path.join(root, "index.json")
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.save_interval = save_interval
+        # Guards the in-memory index; disk writes happen outside it
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._pins: Dict[str, int] = {}
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    @classmethod
+    def from_env(cls) -> "MediaStore":
+        """Build a store configured from the environment."""
+        return cls(root=os.getenv('MEDIA_STORE_DIR', 'media_store'),
+                   max_bytes=int(os.getenv('MEDIA_STORE_MAX_MB', '512')) *
+                   1024 * 1024,
+                   max_age_seconds=float(
+                       os.getenv('MEDIA_STORE_MAX_AGE_HOURS', '48')) * 3600)
+
+    def _load_index(self) -> Dict[str, Any]:
+        if not os.path.exists(self.index_file):
+            return {"blobs": {}, "users": {}, "fingerprints": {}}
+        try:
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+            index.setdefault("blobs", {})
+            index.setdefault("users", {})
+            index.setdefault("fingerprints", {})
+            return index
+        except Exception as e:
+            logger.error(f"Error loading media index, starting fresh: {e}")
+            return {"blobs": {}, "users": {}, "fingerprints": {}}
+
+    def flush(self) -> None:
+        """Write the index if it changed since the last write."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps(self.index).encode("utf-8")
+                self._dirty = False
+                self._last_save = time.monotonic()
+            self._atomic_write(self.index_file, data)
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.flush()
+
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        """Write to a temp file in the target directory, then rename over."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def blob_path(self, media_hash: str) -> str:
+        """Return the sharded path of a blob."""
+        return os.path.join(self.objects_dir, media_hash[:2], media_hash)
+
+    def has(self, media_hash: str) -> bool:
+        """Check whether a blob is present on disk."""
+        return os.path.exists(self.blob_path(media_hash))
+
+    def put(self, data: bytes, media_hash: Optional[str] = None) -> str:
+        """Store bytes (deduplicated) and return their hash."""
+        media_hash = media_hash or hashlib.sha256(data).hexdigest()
+        if not self.has(media_hash):
+            # Same hash, same bytes: concurrent writers can't conflict
+            self._atomic_write(self.blob_path(media_hash), data)
+        with self._lock:
+            self._touch(media_hash, len(data))
+            self._evict_locked()
+        self._maybe_flush()
+        return media_hash
+
+    def put_file(self, source: BinaryIO, media_hash: Optional[str] = None) -> str:
+        """Stream a file object into the store and return its hash."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix=".tmp")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: source.read(64 * 1024), b""):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            media_hash = media_hash or digest.hexdigest()
+            if self.has(media_hash):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(self.blob_path(media_hash)),
+                            exist_ok=True)
+                os.replace(tmp_path, self.blob_path(media_hash))
+            with self._lock:
+                self._touch(media_hash, size)
+                self._evict_locked()
+            self._maybe_flush()
+            return media_hash
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def open(self, media_hash: str) -> BinaryIO:
+        """Open a blob for streaming."""
+        return open(self.blob_path(media_hash), "rb")
+
+    def _touch(self, media_hash: str, size: int) -> None:
+        now = time.time()
+        entry = self.index["blobs"].setdefault(media_hash, {
+            "size": size,
+            "stored_at": now
+        })
+        entry["last_used"] = now
+        self._dirty = True
+
+    def pin(self, *media_hashes: str) -> None:
+        """Keep blobs from being evicted until they are unpinned."""
+        with self._lock:
+            for media_hash in media_hashes:
+                self._pins[media_hash] = self._pins.get(media_hash, 0) + 1
+
+    def unpin(self, *media_hashes: str) -> None:
+        """Release pins taken with pin()."""
+        with self._lock:
+            for media_hash in media_hashes:
+                count = self._pins.get(media_hash, 0) - 1
+                if count > 0:
+                    self._pins[media_hash] = count
+                else:
+                    self._pins.pop(media_hash, None)
+
+    def record_story(self, username: str, story: Dict[str, Any]) -> None:
+        """Remember which blobs hold a user's story."""
+        entry = {
+            "story_id": story.get("story_id"),
+            "type": story["type"],
+            "screenshot_hash": story["screenshot_hash"],
+            "media_hash": story["media_hash"],
+            "stored_at": time.time()
+        }
+        with self._lock:
+            stories = [
+                s for s in self.index["users"].get(username, [])
+                if s["media_hash"] != entry["media_hash"]
+            ]
+            stories.append(entry)
+            self.index["users"][username] = stories
+            self._dirty = True
+        self._maybe_flush()
+
+    def get_user_stories(self, username: str) -> List[Dict[str, Any]]:
+        """Return the stored stories of a user, oldest first."""
+        return [
+            s for s in self.index["users"].get(username, [])
+            if self.has(s["media_hash"]) and self.has(s["screenshot_hash"])
+        ]
+
+    def find_story(self, username: str,
+                   story_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a stored story of a user by its Instagram story id. A hit
+        counts as a use of its blobs for LRU eviction.
+        """
+        if not story_id:
+            return None
+        with self._lock:
+            for story in self.get_user_stories(username):
+                if story.get("story_id") == story_id:
+                    for media_hash in (story["screenshot_hash"],
+                                       story["media_hash"]):
+                        entry = self.index["blobs"].get(media_hash)
+                        if entry:
+                            self._touch(media_hash, entry["size"])
+                    return story
+        return None
+
+    def record_fingerprint(self, fingerprint: str, media_hash: str) -> None:
+        """Remember which stored blob a media fingerprint identifies."""
+        with self._lock:
+            if media_hash not in self.index["blobs"]:
+                return
+            self.index["fingerprints"][fingerprint] = media_hash
+            self._dirty = True
+        self._maybe_flush()
+
+    def find_fingerprint(self, fingerprint: str) -> Optional[str]:
+        """
+        Hash of the stored blob a fingerprint identifies, if we hold it.
+        A hit counts as a use of the blob for LRU eviction.
+        """
+        with self._lock:
+            media_hash = self.index["fingerprints"].get(fingerprint)
+            entry = self.index["blobs"].get(media_hash)
+            if not entry or not self.has(media_hash):
+                return None
+            self._touch(media_hash, entry["size"])
+        return media_hash
+
+    def evict(self) -> int:
+        """Drop expired blobs and enforce the disk budget. Returns bytes freed."""
+        with self._lock:
+            freed = self._evict_locked()
+        self.flush()
+        return freed
+
+    def _evict_locked(self) -> int:
+        blobs = self.index["blobs"]
+        now = time.time()
+        freed = 0
+        expired = [
+            h for h, entry in blobs.items()
+            if now - entry["stored_at"] > self.max_age_seconds
+            and h not in self._pins
+        ]
+        for media_hash in expired:
+            freed += self._remove_blob(media_hash)
+
+        total = sum(entry["size"] for entry in blobs.values())
+        if total > self.max_bytes:
+            # Least recently used first
+            for media_hash in sorted(blobs,
+                                     key=lambda h: blobs[h]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                if media_hash in self._pins:
+                    continue
+                size = self._remove_blob(media_hash)
+                total -= size
+                freed += size
+
+        if freed:
+            self._dirty = True
+            for username in list(self.index["users"]):
+                stories = [
+                    s for s in self.index["users"][username]
+                    if s["media_hash"] in blobs
+                    and s["screenshot_hash"] in blobs
+                ]
+                if stories:
+                    self.index["users"][username] = stories
+                else:
+                    del self.index["users"][username]
+            self.index["fingerprints"] = {
+                fingerprint: media_hash for fingerprint, media_hash in
+                self.index["fingerprints"].items() if media_hash in blobs
+            }
+            logger.info(f"Evicted {freed} bytes from media store")
+        return freed
+
+    def _remove_blob(self, media_hash: str) -> int:
+        entry = self.index["blobs"].pop(media_hash, None)
+        try:
+            os.unlink(self.blob_path(media_hash))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing blob {media_hash}: {e}")
+        return entry["size"] if entry else 0
@@ -1,19 +1,38 @@
 import requests
 import json
 import os
+import tempfile
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from log_setup import configure_logging
+from user_registry import UserRegistry
+
+logger = logging.getLogger(__name__)
 
 USERS_FILE = "users.json"
-BOT_TOKEN = "7569840561:AAHnbeez9FcYFM_IpwyxJ1AwaiqKA7r_jiA"
+# Set from the environment by main(), once .env has been loaded
+OFFSET_FILE = 'multi_tracker_offset.json'
+BOT_TOKEN: Optional[str] = None
+POLL_TIMEOUT = 30
+BATCH_SIZE = 100
+
+registry = UserRegistry(USERS_FILE)
+_session: Optional[requests.Session] = None
+
+def get_session() -> requests.Session:
+    """Pooled HTTP session for the Bot API."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
 
 def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return registry.load()
 
 def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+    registry.save(users)
 
 def is_new_user(chat_id):
     """Check if a user is new to the bot."""
@@ -22,32 +41,33 @@ def is_new_user(chat_id):
 
 def add_user(chat_id, username):
     """Add a user to track list. Returns True if added, False if already tracking."""
-    users = load_users()
+    with registry.transaction() as users:
+        return _add(users, chat_id, username)
+
+def _add(users, chat_id, username):
     if chat_id not in users:
         users[chat_id] = []
-    
+
     # Clean username
     username = username.strip().lstrip('@')
-    
+
     if username not in users[chat_id]:
         users[chat_id].append(username)
-        save_users(users)
         return True
     return False
 
 def remove_user(chat_id, username):
     """Remove a user from track list. Returns True if removed, False if not found."""
-    users = load_users()
-    if chat_id in users:
-        # Clean username
-        username = username.strip().lstrip('@')
-        
-        if username in users[chat_id]:
-            users[chat_id].remove(username)
-            if not users[chat_id]:  # If no more tracked users, remove the chat_id
-                del users[chat_id]
-            save_users(users)
-            return True
+    with registry.transaction() as users:
+        if chat_id in users:
+            # Clean username
+            username = username.strip().lstrip('@')
+
+            if username in users[chat_id]:
+                users[chat_id].remove(username)
+                if not users[chat_id]:  # If no more tracked users, remove the chat_id
+                    del users[chat_id]
+                return True
     return False
 
 def get_tracked_users(chat_id):
@@ -55,23 +75,90 @@ def get_tracked_users(chat_id):
     users = load_users()
     return users.get(chat_id, [])
 
-def update_users():
-    """Update users from Telegram updates."""
+def load_offset() -> Optional[int]:
+    """The next update_id to ask for, if any updates were processed before."""
+    try:
+        with open(OFFSET_FILE, "r") as f:
+            return json.load(f).get("offset")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_offset(offset: int) -> None:
+    directory = os.path.dirname(os.path.abspath(OFFSET_FILE))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"offset": offset}, f)
+    os.replace(tmp_path, OFFSET_FILE)
+
+def apply_updates(updates: List[Dict[str, Any]]) -> int:
+    """Apply a batch of updates with a single registry write."""
+    added = 0
+    with registry.transaction() as users:
+        for update in updates:
+            try:
+                chat_id = str(update["message"]["chat"]["id"])
+                text = update["message"]["text"]
+            except (KeyError, TypeError):
+                continue
+            if text.lower().startswith("track "):
+                username = text.split(" ", 1)[1].strip()
+                if username and _add(users, chat_id, username):
+                    logger.info(f"Added {username} for {chat_id}")
+                    added += 1
+    return added
+
+def update_users(timeout: int = POLL_TIMEOUT) -> int:
+    """
+    Long-poll getUpdates past the saved offset and apply what arrived.
+    The offset is saved after the batch is applied, so a crash replays
+    the batch rather than losing it (adding a user twice is a no-op).
+    Returns the number of updates processed.
+    """
     url = f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates"
-    response = requests.get(url)
+    params = {
+        "timeout": timeout,
+        "limit": BATCH_SIZE,
+        "allowed_updates": json.dumps(["message"])
+    }
+    offset = load_offset()
+    if offset is not None:
+        params["offset"] = offset
+    response = get_session().get(url, params=params, timeout=timeout + 10)
+    response.raise_for_status()
     updates = response.json().get("result", [])
-    users = load_users()
+    if not updates:
+        return 0
+
+    apply_updates(updates)
+    save_offset(max(update["update_id"] for update in updates) + 1)
+    return len(updates)
 
-    for update in updates:
+def run():
+    """Ingest updates until interrupted."""
+    if not BOT_TOKEN:
+        raise ValueError("BOT_TOKEN environment variable is required")
+    while True:
         try:
-            chat_id = str(update["message"]["chat"]["id"])
-            text = update["message"]["text"]
-            if text.lower().startswith("track "):
-                username = text.split(" ", 1)[1].strip()
-                if add_user(chat_id, username):
-                    print(f"Added {username} for {chat_id}")
-        except Exception:
-            continue
+            update_users()
+        except requests.RequestException as e:
+            logger.error(f"Error fetching updates: {e}")
+            time.sleep(5)
+        except (ValueError, OSError) as e:
+            # A garbled response or a failed offset write; the batch is
+            # fetched again next time
+            logger.error(f"Error processing updates: {e}")
+            time.sleep(5)
+
+def main():
+    """Load .env and settings, then run the poller."""
+    global BOT_TOKEN, OFFSET_FILE
+    from dotenv import load_dotenv
 
-    save_users(users)
+    load_dotenv()
+    configure_logging()
+    BOT_TOKEN = os.getenv('BOT_TOKEN')
+    OFFSET_FILE = os.getenv('MULTI_TRACKER_OFFSET_FILE', OFFSET_FILE)
+    run()
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileCache:
+    """
+    Persistent map of username -> Instagram profile metadata:
+
+        {"user_id": "123", "exists": true, "is_private": false,
+         "followed": false, "fetched_at": <epoch>}
+
+    Filled the first time an account is looked up and trusted for `ttl`
+    seconds (accounts that don't exist for `missing_ttl`), so checks can
+    address reels by id and skip private or deleted accounts without
+    loading their profile page.
+
+    Changes stay in memory until flush(), which the monitor runs off the
+    event loop once per cycle.
+    """
+
+    def __init__(self,
+                 path: str = "profile_cache.json",
+                 ttl: float = 24 * 3600,
+                 missing_ttl: float = 6 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        self._dirty = False
+
+    @classmethod
+    def from_env(cls) -> "ProfileCache":
+        """Build a cache configured from the environment."""
+        return cls(os.getenv('PROFILE_CACHE_FILE', 'profile_cache.json'),
+                   ttl=float(os.getenv('PROFILE_CACHE_TTL_HOURS', '24')) *
+                   3600)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading profile cache: {e}")
+            return {}
+
+    def flush(self) -> None:
+        """Write the cache if it changed since the last flush."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        # Entries are replaced, never mutated, so a shallow copy is stable
+        entries = dict(self.entries)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving profile cache: {e}")
+            self._dirty = True
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        """Return the cached profile if it is still fresh."""
+        entry = self.entries.get(username)
+        if not entry:
+            return None
+        ttl = self.ttl if entry.get("exists", True) else self.missing_ttl
+        if time.time() - entry.get("fetched_at", 0) > ttl:
+            return None
+        return entry
+
+    def put(self, username: str, user_id: str, is_private: bool = False,
+            followed: bool = False) -> Dict[str, Any]:
+        """Record a freshly resolved profile."""
+        entry = {
+            "user_id": user_id,
+            "exists": True,
+            "is_private": is_private,
+            "followed": followed,
+            "fetched_at": time.time()
+        }
+        self.entries[username] = entry
+        self._dirty = True
+        return entry
+
+    def mark_missing(self, username: str) -> None:
+        """Remember that a username doesn't exist (404, or renamed away)."""
+        self.entries[username] = {"exists": False, "fetched_at": time.time()}
+        self._dirty = True
+
+    def mark_private(self, username: str) -> None:
+        """Remember that a profile is private and we don't follow it."""
+        entry = dict(self.entries.get(username, {}))
+        entry.update(exists=True, is_private=True, followed=False,
+                     fetched_at=time.time())
+        self.entries[username] = entry
+        self._dirty = True
+
+    def invalidate(self, username: str) -> None:
+        """Forget a profile, e.g. when its id now answers to another name."""
+        if self.entries.pop(username, None):
+            self._dirty = True
+
+    @staticmethod
+    def skip_reason(entry: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Why a check of this profile would be pointless, if it would."""
+        if not entry:
+            return None
+        if not entry.get("exists", True):
+            return "account doesn't exist"
+        if entry.get("is_private") and not entry.get("followed"):
+            return "account is private"
+        return None
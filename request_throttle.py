@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar, Any
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+Errors = Tuple[Type[BaseException], ...]
+
+
+class CircuitOpenError(Exception):
+    """The identity was flagged and is paused until the breaker closes."""
+
+
+class RequestThrottle:
+    """
+    Paces every Instagram request of one identity (logged-in account).
+
+    A token bucket hands out requests at `rate` per second. The rate
+    grows additively after each success and is cut multiplicatively when
+    Instagram pushes back (429s, challenge pages, login redirects), which
+    settles close to the highest rate that doesn't get us flagged.
+
+    Failures worth retrying are retried with jittered exponential
+    backoff. After `breaker_threshold` consecutive flags the breaker opens
+    and the identity is paused for a cooldown that doubles on every trip.
+    Once it expires a single trial request is let through while the rest
+    are still turned away; a flag reopens the breaker, a success closes
+    it, and anything else lets the next request try instead.
+    """
+
+    def __init__(self,
+                 identity: str,
+                 rate: float = 0.5,
+                 min_rate: float = 0.05,
+                 max_rate: float = 2.0,
+                 burst: float = 3,
+                 increase: float = 0.02,
+                 decrease: float = 0.5,
+                 max_retries: int = 3,
+                 retry_delay: float = 5,
+                 max_retry_delay: float = 120,
+                 breaker_threshold: int = 3,
+                 breaker_cooldown: float = 900,
+                 max_breaker_cooldown: float = 6 * 3600):
+        self.identity = identity
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_breaker_cooldown = max_breaker_cooldown
+
+        self.tokens = burst
+        self._refilled_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.consecutive_flags = 0
+        self.trips = 0
+        self.open_until: Optional[float] = None
+        self.half_open = False
+        self.requests = 0
+        self.flags = 0
+        self.retries = 0
+
+    @classmethod
+    def from_env(cls,
+                 identity: str,
+                 max_retries: int = 3,
+                 retry_delay: float = 5) -> "RequestThrottle":
+        """Build a throttle configured from the environment."""
+        return cls(identity,
+                   rate=float(os.getenv('IG_REQUEST_RATE', '0.5')),
+                   min_rate=float(os.getenv('IG_REQUEST_RATE_MIN', '0.05')),
+                   max_rate=float(os.getenv('IG_REQUEST_RATE_MAX', '2')),
+                   max_retries=max_retries,
+                   retry_delay=retry_delay,
+                   breaker_threshold=int(
+                       os.getenv('IG_BREAKER_THRESHOLD', '3')),
+                   breaker_cooldown=float(
+                       os.getenv('IG_BREAKER_COOLDOWN_MINUTES', '15')) * 60)
+
+    def is_open(self) -> bool:
+        """Whether requests are being turned away (has no side effects)."""
+        if self.open_until is not None:
+            return time.monotonic() < self.open_until
+        return self.half_open
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _admit(self) -> bool:
+        """
+        Raise CircuitOpenError unless a request may go out. Returns True
+        if it is the half-open trial.
+        """
+        if self.open_until is not None:
+            remaining = self.open_until - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"{self.identity} is paused for another {remaining:.0f}s")
+            # Cooldown over: this request probes, the rest keep waiting
+            self.open_until = None
+            self.half_open = True
+            logger.info(f"Circuit half-open for {self.identity}, probing")
+            return True
+        if self.half_open:
+            raise CircuitOpenError(
+                f"{self.identity} is paused until a probe request succeeds")
+        return False
+
+    def _release_trial(self) -> None:
+        """The trial ended without a verdict: the next request probes."""
+        if self.half_open:
+            self.half_open = False
+            self.open_until = time.monotonic()
+
+    async def acquire(self) -> bool:
+        """
+        Wait for a request token, or raise CircuitOpenError. Returns True
+        if the request is the half-open trial.
+        """
+        async with self._lock:
+            trial = self._admit()
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                if not trial:
+                    self._admit()
+                self._refill()
+            self.tokens -= 1
+            self.requests += 1
+            return trial
+
+    def record_success(self) -> None:
+        """Additive increase; a success also closes a half-open breaker."""
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        self.consecutive_flags = 0
+        if self.half_open:
+            logger.info(f"Circuit closed for {self.identity}")
+            self.half_open = False
+            self.trips = 0
+
+    def record_flag(self, reason: Any) -> None:
+        """Multiplicative decrease; opens the breaker on repeated flags."""
+        self.flags += 1
+        self.consecutive_flags += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = min(self.tokens, 0)
+        logger.warning(f"Instagram pushed back on {self.identity} ({reason}), "
+                       f"rate now {self.rate:.3f}/s")
+        if self.half_open or self.consecutive_flags >= self.breaker_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        cooldown = min(self.max_breaker_cooldown,
+                       self.breaker_cooldown * 2**self.trips)
+        self.trips += 1
+        self.open_until = time.monotonic() + cooldown
+        self.half_open = False
+        self.consecutive_flags = 0
+        logger.error(f"Circuit open for {self.identity}, pausing for "
+                     f"{cooldown:.0f}s")
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential delay before retry number `attempt`."""
+        ceiling = min(self.max_retry_delay,
+                      self.retry_delay * 2**(attempt - 1))
+        return random.uniform(0, ceiling)
+
+    async def call(self,
+                   request: Callable[[], Awaitable[T]],
+                   flagged: Errors = (),
+                   retryable: Errors = ()) -> T:
+        """
+        Run `request` under the throttle. Errors in `flagged` mean Instagram
+        pushed back; errors in `retryable` are retried up to max_retries
+        times. Anything else is passed through untouched.
+        """
+        attempt = 0
+        while True:
+            trial = await self.acquire()
+            try:
+                result = await request()
+            except flagged as e:
+                self.record_flag(e)
+                if not isinstance(e, retryable) or attempt >= self.max_retries:
+                    raise
+            except BaseException as e:
+                if trial:
+                    self._release_trial()
+                if not isinstance(e, retryable) or attempt >= self.max_retries:
+                    raise
+            else:
+                self.record_success()
+                return result
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(self.backoff(attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'identity': self.identity,
+            'rate': round(self.rate, 3),
+            'requests': self.requests,
+            'flags': self.flags,
+            'retries': self.retries,
+            'open': self.is_open(),
+            'trips': self.trips
+        }
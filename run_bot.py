@@ -1,53 +1,95 @@
+import time
+
+_process_start = time.monotonic()
+
+import html
 import os
-import json
 import logging
 import re
+from functools import partial
 from typing import Dict, List, Optional, Any
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.ext import (Application, CommandHandler, ContextTypes,
+                          MessageHandler, filters)
 
 from instagram_monitor import InstagramMonitor
+from log_setup import configure_logging
+from file_id_cache import FileIdCache, send_story_album, send_story_media
+from command_jobs import CommandJob, CommandJobManager, JobLimitError
+from request_throttle import CircuitOpenError
+from startup_timer import StartupTimer
+from story_digest import StoryDigest
+from webhook_app import TelegramWebhookApp
+from user_registry import UserRegistry
 import asyncio
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize bot and application
-bot_token = os.getenv('BOT_TOKEN')
-ig_username = os.getenv('IG_USERNAME')
-ig_password = os.getenv('IG_PASSWORD')
-if not bot_token:
-    raise ValueError("BOT_TOKEN environment variable is required")
+startup = StartupTimer(_process_start)
+startup.mark("imports done")
+
+# Telegram file_ids of media we've already uploaded, shared by all chats;
+# created on first use, once .env has been loaded
+file_id_cache: Optional[FileIdCache] = None
+
+# users.json, shared with the monitor loop when it runs in this process
+registry = UserRegistry("users.json")
+
+# Largest username list accepted as an uploaded file
+MAX_BULK_FILE_BYTES = 256 * 1024
+
+# Newly tracked accounts of one request checked ahead of the cycle; the
+# rest wait for their fair turn instead of crowding out other chats
+MAX_FIRST_CHECKS = 10
+
+# Heavy commands run here instead of inside the update handlers; created
+# on first use, once .env has been loaded
+command_jobs: Optional[CommandJobManager] = None
+
+# Shared Instagram monitor, created on first use and warmed up at boot
+monitor: Optional[InstagramMonitor] = None
+warm_up_task: Optional[asyncio.Task] = None
+# Coalesces a chat's story alerts when DIGEST_WINDOW_SECONDS is set
+story_digest: Optional[StoryDigest] = None
+monitor_lock_file = None
+
+
+def get_monitor() -> InstagramMonitor:
+    """Return the shared Instagram monitor, creating it on first use."""
+    global monitor
+    if monitor is None:
+        monitor = InstagramMonitor(
+            instagram_username=os.getenv('IG_USERNAME'),
+            instagram_password=os.getenv('IG_PASSWORD'),
+            registry=registry)
+    return monitor
+
 
-application = Application.builder().token(bot_token).build()
+def get_file_id_cache() -> FileIdCache:
+    """Return the shared file_id cache, creating it on first use."""
+    global file_id_cache
+    if file_id_cache is None:
+        file_id_cache = FileIdCache(
+            os.getenv('FILE_ID_CACHE_FILE', 'telegram_file_ids.json'))
+    return file_id_cache
 
-# Initialize Instagram monitor
-monitor = InstagramMonitor(instagram_username=ig_username,
-                           instagram_password=ig_password)
+
+def get_command_jobs() -> CommandJobManager:
+    """Return the shared command job manager, creating it on first use."""
+    global command_jobs
+    if command_jobs is None:
+        command_jobs = CommandJobManager.from_env()
+    return command_jobs
 
 
 def load_users() -> Dict[str, List[str]]:
     """Load users from the users file."""
-    if not os.path.exists("users.json"):
-        return {}
-    try:
-        with open("users.json", "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError, PermissionError) as e:
-        logger.error(f"Error loading users: {e}")
-        return {}
+    return registry.load()
 
 
 def save_users(users: Dict[str, List[str]]) -> None:
     """Save users to the users file."""
-    try:
-        with open("users.json", "w") as f:
-            json.dump(users, f)
-    except (PermissionError, IOError) as e:
-        logger.error(f"Error saving users: {e}")
+    registry.save(users)
 
 
 def validate_username(username: str) -> bool:
@@ -59,34 +101,104 @@ def validate_username(username: str) -> bool:
     return bool(re.match(r'^[a-zA-Z0-9._]+$', username))
 
 
+def parse_usernames(text: str) -> List[str]:
+    """Split a list of usernames (spaces, commas, semicolons or lines)."""
+    return [
+        name.lstrip('@').lower() for name in re.split(r'[\s,;]+', text)
+        if name.lstrip('@')
+    ]
+
+
+def add_users(chat_id: str, usernames: List[str]) -> Dict[str, List[str]]:
+    """Validate and add many users to a chat's tracking list in one write."""
+    result = {'added': [], 'duplicate': [], 'invalid': []}
+    valid = []
+    for username in usernames:
+        if validate_username(username):
+            valid.append(username)
+        else:
+            result['invalid'].append(username)
+    if not valid:
+        return result
+
+    with registry.transaction() as users:
+        tracked = users.setdefault(str(chat_id), [])
+        for username in valid:
+            if username in tracked:
+                result['duplicate'].append(username)
+            else:
+                tracked.append(username)
+                result['added'].append(username)
+    return result
+
+
+def remove_users(chat_id: str,
+                 usernames: List[str]) -> Dict[str, List[str]]:
+    """Validate and remove many users from a chat's list in one write."""
+    result = {'removed': [], 'missing': [], 'invalid': []}
+    valid = []
+    for username in usernames:
+        if validate_username(username):
+            valid.append(username)
+        else:
+            result['invalid'].append(username)
+    if not valid:
+        return result
+
+    with registry.transaction() as users:
+        tracked = users.get(str(chat_id), [])
+        for username in valid:
+            if username in tracked:
+                tracked.remove(username)
+                result['removed'].append(username)
+            else:
+                result['missing'].append(username)
+        if not tracked:
+            users.pop(str(chat_id), None)
+    return result
+
+
 def add_user(chat_id: str, username: str) -> bool:
     """Add a user to the tracking list."""
-    if not validate_username(username):
-        return False
-
-    users = load_users()
-    if str(chat_id) not in users:
-        users[str(chat_id)] = []
-    if username not in users[str(chat_id)]:
-        users[str(chat_id)].append(username)
-        save_users(users)
-        return True
-    return False
+    return bool(add_users(chat_id, [username])['added'])
 
 
 def remove_user(chat_id: str, username: str) -> bool:
     """Remove a user from the tracking list."""
-    if not validate_username(username):
-        return False
+    return bool(remove_users(chat_id, [username])['removed'])
 
-    users = load_users()
-    if str(chat_id) in users and username in users[str(chat_id)]:
-        users[str(chat_id)].remove(username)
-        if not users[str(chat_id)]:
-            del users[str(chat_id)]
-        save_users(users)
-        return True
-    return False
+
+def queue_first_check(chat_id: str, usernames: List[str]) -> bool:
+    """
+    Have the monitor check the first MAX_FIRST_CHECKS freshly tracked
+    accounts right away; any others are checked in the next cycle.
+    """
+    if not usernames or monitor is None:
+        return False
+    return monitor.request_priority_check(
+        {str(chat_id): usernames[:MAX_FIRST_CHECKS]})
+
+
+def format_bulk_result(result: Dict[str, List[str]]) -> str:
+    """Summarize a bulk track/untrack for the chat."""
+    labels = {
+        'added': "✅ Now tracking",
+        'removed': "✅ Stopped tracking",
+        'duplicate': "ℹ️ Already tracking",
+        'missing': "ℹ️ Weren't tracking",
+        'invalid': "❌ Invalid"
+    }
+    lines = []
+    for key, label in labels.items():
+        if key in result and result[key]:
+            # Invalid entries are raw user input, sent with parse_mode HTML
+            names = ", ".join(f"@{html.escape(name)}"
+                              for name in result[key][:20])
+            more = len(result[key]) - 20
+            if more > 0:
+                names += f" and {more} more"
+            lines.append(f"{label} ({len(result[key])}): {names}")
+    return "\n".join(lines) or "🤷 No usernames found."
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -102,7 +214,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "Example: /track instagram\n\n"
         "📥 <b>Download Stories:</b>\n"
         "/download &lt;username&gt; - Download someone's current story\n"
-        "Example: /download kimkardashian\n\n"
+        "Example: /download kimkardashian\n"
+        "/cancel - Changed your mind? Stop a pending download\n\n"
         "🚫 <b>Stop Stalking:</b>\n"
         "/untrack &lt;username&gt; - Stop being creepy (or at least pretend to)\n\n"
         "📋 <b>Your Stalking List:</b>\n"
@@ -124,40 +237,50 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def track(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle the /track command."""
+    """Handle the /track command (one or more usernames)."""
     chat_id = update.effective_chat.id
     if not context.args:
         await context.bot.send_message(
             chat_id=chat_id,
             text="❌ Please provide an Instagram username to track.\n"
-            "Example: /track instagram",
+            "Example: /track instagram\n"
+            "Track several at once: /track instagram natgeo nasa, "
+            "or send a .txt/.csv file with /track as its caption.",
             parse_mode="HTML")
         return
 
-    username = context.args[0].lower()
-    if not validate_username(username):
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="❌ Invalid Instagram username format.\n"
-            "Usernames can only contain letters, numbers, periods, and underscores.",
-            parse_mode="HTML")
-        return
+    await track_usernames(context.bot, chat_id,
+                          parse_usernames(" ".join(context.args)))
 
-    if add_user(chat_id, username):
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"✅ Now tracking @{username}!\n"
-            "You'll be notified when they post new stories. 🎭",
-            parse_mode="HTML")
+
+async def track_usernames(bot, chat_id: int, usernames: List[str]) -> None:
+    """Add usernames to a chat and report the outcome."""
+    result = add_users(chat_id, usernames)
+    first_check = queue_first_check(chat_id, result['added'])
+
+    if len(usernames) == 1:
+        username = usernames[0]
+        if result['invalid']:
+            text = ("❌ Invalid Instagram username format.\n"
+                    "Usernames can only contain letters, numbers, periods, "
+                    "and underscores.")
+        elif result['added']:
+            text = (f"✅ Now tracking @{username}!\n"
+                    "You'll be notified when they post new stories. 🎭")
+        else:
+            text = f"ℹ️ You're already tracking @{username}!"
     else:
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"ℹ️ You're already tracking @{username}!",
-            parse_mode="HTML")
+        text = format_bulk_result(result)
+        if first_check and len(result['added']) > MAX_FIRST_CHECKS:
+            text += (f"\n\n🚀 Checking the first {MAX_FIRST_CHECKS} new "
+                     "accounts right away, the rest in the next round.")
+        elif first_check:
+            text += "\n\n🚀 Checking the new accounts right away."
+    await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
 
 
 async def untrack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle the /untrack command."""
+    """Handle the /untrack command (one or more usernames)."""
     chat_id = update.effective_chat.id
     if not context.args:
         await context.bot.send_message(
@@ -167,24 +290,55 @@ async def untrack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             parse_mode="HTML")
         return
 
-    username = context.args[0].lower()
-    if not validate_username(username):
+    await untrack_usernames(context.bot, chat_id,
+                            parse_usernames(" ".join(context.args)))
+
+
+async def untrack_usernames(bot, chat_id: int, usernames: List[str]) -> None:
+    """Remove usernames from a chat and report the outcome."""
+    result = remove_users(chat_id, usernames)
+
+    if len(usernames) == 1:
+        username = usernames[0]
+        if result['invalid']:
+            text = ("❌ Invalid Instagram username format.\n"
+                    "Usernames can only contain letters, numbers, periods, "
+                    "and underscores.")
+        elif result['removed']:
+            text = f"✅ Stopped tracking @{username}."
+        else:
+            text = f"ℹ️ You weren't tracking @{username}."
+    else:
+        text = format_bulk_result(result)
+    await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+
+
+async def bulk_document(update: Update,
+                        context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle a .txt/.csv upload captioned /track or /untrack."""
+    chat_id = update.effective_chat.id
+    document = update.message.document
+    command = update.message.caption.split()[0].split('@')[0].lower()
+
+    if document.file_size and document.file_size > MAX_BULK_FILE_BYTES:
         await context.bot.send_message(
             chat_id=chat_id,
-            text="❌ Invalid Instagram username format.\n"
-            "Usernames can only contain letters, numbers, periods, and underscores.",
+            text=f"❌ That file is too big. Keep it under "
+            f"{MAX_BULK_FILE_BYTES // 1024} KB.",
             parse_mode="HTML")
         return
 
-    if remove_user(chat_id, username):
-        await context.bot.send_message(chat_id=chat_id,
-                                       text=f"✅ Stopped tracking @{username}.",
-                                       parse_mode="HTML")
+    file = await document.get_file()
+    content = bytes(await file.download_as_bytearray())
+    usernames = parse_usernames(content.decode('utf-8', errors='replace'))
+    # A CSV header like "username" isn't an account anyone meant to track
+    if usernames and usernames[0] in ('username', 'usernames'):
+        usernames = usernames[1:]
+
+    if command == '/untrack':
+        await untrack_usernames(context.bot, chat_id, usernames)
     else:
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"ℹ️ You weren't tracking @{username}.",
-            parse_mode="HTML")
+        await track_usernames(context.bot, chat_id, usernames)
 
 
 async def list_tracked(update: Update,
@@ -229,109 +383,169 @@ async def download(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             parse_mode="HTML")
         return
 
-    # Send initial message
-    await context.bot.send_message(
+    async def run(job: CommandJob) -> None:
+        await run_download(job, context.bot, chat_id, username)
+
+    try:
+        job = get_command_jobs().submit(chat_id, 'download',
+                                        f"/download @{username}", run)
+    except JobLimitError as e:
+        await context.bot.send_message(chat_id=chat_id,
+                                       text=f"⏳ {e}",
+                                       parse_mode="HTML")
+        return
+
+    # Acknowledge right away; the job edits this message as it progresses
+    position = get_command_jobs().position(job)
+    queued = f" You're #{position} in line." if position > 1 else ""
+    ack = await context.bot.send_message(
         chat_id=chat_id,
         text=f"🔄 Checking stories for @{username}...\n"
-        "This might take a moment while I do my sneaky business. 👀",
+        "This might take a moment while I do my sneaky business. 👀\n"
+        f"Job #{job.id}.{queued} Send /cancel to stop it.",
         parse_mode="HTML")
 
-    try:
-        # Initialize monitor
-        monitor = InstagramMonitor(instagram_username=ig_username,
-                                   instagram_password=ig_password)
-
-        # Login to Instagram
-        if not await monitor.login_to_instagram():
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Failed to login to Instagram. Please try again later.",
-                parse_mode="HTML")
-            return
+    async def progress(text: str) -> None:
+        await context.bot.edit_message_text(chat_id=chat_id,
+                                            message_id=ack.message_id,
+                                            text=text,
+                                            parse_mode="HTML")
 
-        # Navigate to profile
-        await monitor.page.goto(f"https://www.instagram.com/{username}/")
-        await monitor.page.wait_for_selector('header', timeout=10000)
+    job.progress = progress
 
-        # Check for story ring
-        story_ring = await monitor.page.query_selector(
-            'div[role="button"] canvas')
-        if not story_ring:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"😴 No active stories found for @{username}.\n\n"
-                "Your collection of sadness is empty. Maybe they're:\n"
-                "• Living their best life offline (unlike you)\n"
-                "• Actually being productive (unlike you)\n"
-                "• Just not interested in sharing their life with random stalkers (like you)\n\n"
-                "Try again later when they're actually doing something interesting. Or maybe... get a life? 🤷‍♂️",
-                parse_mode="HTML")
-            return
 
-        # Click story ring and wait for story viewer
-        await story_ring.click()
-        await monitor.page.wait_for_selector('div[role="dialog"]',
-                                             timeout=5000)
+async def run_download(job: CommandJob, bot, chat_id: int,
+                       username: str) -> None:
+    """Download a user's current story and send it to a chat."""
+    async with get_monitor().profiler.profile('download',
+                                              f"/download @{username}"):
+        await _run_download(job, bot, chat_id, username)
 
-        # Get story container
-        story_element = await monitor.page.query_selector('div[role="dialog"]')
-        if not story_element:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"❌ Could not open stories for @{username}.\n"
-                "Maybe they're private or blocked you? 🤔",
-                parse_mode="HTML")
-            return
 
-        # Process story content
-        story_content = await monitor.get_story_content(story_element)
-        if not story_content:
-            await context.bot.send_message(
+async def _run_download(job: CommandJob, bot, chat_id: int,
+                        username: str) -> None:
+    monitor = get_monitor()
+    try:
+        # Login to Instagram (no-op while the warmed-up session is valid)
+        await job.report(f"🔐 Getting into Instagram for @{username}...")
+        if not await monitor.ensure_logged_in():
+            await bot.send_message(
                 chat_id=chat_id,
-                text=f"❌ Could not download story content for @{username}.\n"
-                "Instagram might be onto us... 👮‍♂️",
+                text="❌ Failed to login to Instagram. Please try again later.",
                 parse_mode="HTML")
             return
 
-        # Send the content
+        # The browser page is shared with the monitor, take turns
+        await job.report(f"🕵️ Looking for @{username}'s story...")
+        async with monitor.browser_page():
+            # Navigate to profile
+            await monitor.navigate(f"https://www.instagram.com/{username}/")
+            await monitor.page.wait_for_selector('header', timeout=10000)
+
+            # Check for story ring
+            story_ring = await monitor.page.query_selector(
+                'div[role="button"] canvas')
+            if not story_ring:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=f"😴 No active stories found for @{username}.\n\n"
+                    "Your collection of sadness is empty. Maybe they're:\n"
+                    "• Living their best life offline (unlike you)\n"
+                    "• Actually being productive (unlike you)\n"
+                    "• Just not interested in sharing their life with random stalkers (like you)\n\n"
+                    "Try again later when they're actually doing something interesting. Or maybe... get a life? 🤷‍♂️",
+                    parse_mode="HTML")
+                return
+
+            # Click story ring and wait for story viewer
+            await story_ring.click()
+            await monitor.page.wait_for_selector('div[role="dialog"]',
+                                                 timeout=5000)
+
+            # Get story container
+            story_element = await monitor.page.query_selector(
+                'div[role="dialog"]')
+            if not story_element:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=f"❌ Could not open stories for @{username}.\n"
+                    "Maybe they're private or blocked you? 🤔",
+                    parse_mode="HTML")
+                return
+
+            # Process story content
+            story_content = await monitor.get_story_content(
+                story_element, username)
+            if not story_content:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=f"❌ Could not download story content for @{username}.\n"
+                    "Instagram might be onto us... 👮‍♂️",
+                    parse_mode="HTML")
+                return
+
+        await job.report(f"📤 Sending @{username}'s story...")
+
+        # Send the content, uploading each file to Telegram only once
         if story_content['type'] == 'video':
             # For videos, send both the video and a screenshot
-            await context.bot.send_video(
-                chat_id=chat_id,
-                video=story_content['media_content'],
+            await send_story_media(
+                bot,
+                get_file_id_cache(),
+                chat_id,
+                'video',
+                story_content['media_hash'],
+                story_content['media_path'],
                 caption=f"🎥 Story from @{username}\n"
                 "Here's your stolen content, you sneaky stalker! 😏",
                 parse_mode="HTML")
-            await context.bot.send_photo(
-                chat_id=chat_id,
-                photo=story_content['screenshot'],
+            await send_story_media(
+                bot,
+                get_file_id_cache(),
+                chat_id,
+                'photo',
+                story_content['screenshot_hash'],
+                story_content['screenshot_path'],
                 caption=
                 "📸 Screenshot of the video (in case you're too lazy to watch it)",
                 parse_mode="HTML")
         else:
             # For images, just send the image
-            await context.bot.send_photo(
-                chat_id=chat_id,
-                photo=story_content['media_content'],
+            await send_story_media(
+                bot,
+                get_file_id_cache(),
+                chat_id,
+                'photo',
+                story_content['media_hash'],
+                story_content['media_path'],
                 caption=f"🖼️ Story from @{username}\n"
                 "Here's your stolen content, you sneaky stalker! 😏",
                 parse_mode="HTML")
 
-        await context.bot.send_message(
+        await bot.send_message(
             chat_id=chat_id,
             text="✅ Story downloaded successfully!\n"
             "Don't forget to delete this message if you don't want evidence of your stalking habits. 😉",
             parse_mode="HTML")
 
+    except asyncio.CancelledError:
+        raise
+    except CircuitOpenError as e:
+        logger.warning(f"Download of @{username} refused: {e}")
+        await bot.send_message(
+            chat_id=chat_id,
+            text="🚨 Instagram is suspicious of us right now, so I'm lying "
+            "low for a bit. Try again later.",
+            parse_mode="HTML")
     except Exception as e:
         logger.error(f"Error downloading story for @{username}: {e}")
-        await context.bot.send_message(
+        await bot.send_message(
             chat_id=chat_id,
             text=f"❌ Error downloading story: {str(e)}\n"
             "Maybe try again later? Or maybe you should just... stop stalking? 🤷‍♂️",
             parse_mode="HTML")
     finally:
-        await monitor.cleanup_browser()
+        await monitor.lifecycle.maybe_recycle()
 
 
 async def error_handler(update: Optional[Update],
@@ -347,47 +561,331 @@ async def error_handler(update: Optional[Update],
             parse_mode="HTML")
 
 
-# Register handlers
-application.add_handler(CommandHandler("start", start))
-application.add_handler(CommandHandler("track", track))
-application.add_handler(CommandHandler("untrack", untrack))
-application.add_handler(CommandHandler("list", list_tracked))
-application.add_handler(CommandHandler("download", download))
-application.add_handler(
-    CommandHandler(
-        "stats", lambda u, c: c.bot.send_message(u.effective_chat.id,
-                                                 "📊 Stats coming soon!")))
-application.add_handler(
-    CommandHandler(
-        "level", lambda u, c: c.bot.send_message(
-            u.effective_chat.id, "🏆 Level system coming soon!")))
-application.add_handler(
-    CommandHandler(
-        "roast", lambda u, c: c.bot.send_message(
-            u.effective_chat.id, "🔥 Roasting system coming soon!")))
-application.add_handler(
-    CommandHandler(
-        "tips", lambda u, c: c.bot.send_message(u.effective_chat.id,
-                                                "🎯 Tips coming soon!")))
-application.add_handler(
-    CommandHandler(
-        "achievements", lambda u, c: c.bot.send_message(
-            u.effective_chat.id, "🏅 Achievements coming soon!")))
-application.add_handler(CommandHandler("help",
-                                       start))  # Reuse start command for help
-application.add_error_handler(error_handler)
-
-import requests
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /cancel command."""
+    chat_id = update.effective_chat.id
+    job_id = None
+    if context.args:
+        try:
+            job_id = int(context.args[0].lstrip('#'))
+        except ValueError:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="❌ Usage: /cancel [job number]",
+                parse_mode="HTML")
+            return
+
+    job = get_command_jobs().cancel(chat_id, job_id)
+    if job is None:
+        await context.bot.send_message(chat_id=chat_id,
+                                       text="ℹ️ Nothing to cancel.",
+                                       parse_mode="HTML")
+    elif job.status == 'cancelled':
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"🛑 Cancelled job #{job.id} ({job.description}).",
+            parse_mode="HTML")
+    else:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"🛑 Stopping job #{job.id} ({job.description})...",
+            parse_mode="HTML")
+
+
+def is_admin(chat_id: Any) -> bool:
+    """Check whether a chat may use admin commands such as /profile."""
+    admin_chat_ids = {
+        admin_id.strip()
+        for admin_id in os.getenv('ADMIN_CHAT_IDS', '').split(',')
+        if admin_id.strip()
+    }
+    return str(chat_id) in admin_chat_ids
+
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the admin /profile [N] [cycles|downloads|off] command."""
+    chat_id = update.effective_chat.id
+    if not is_admin(chat_id):
+        return
+
+    runs, kind = 1, 'cycle'
+    for arg in context.args or []:
+        if arg.isdigit():
+            runs = int(arg)
+        elif arg in ('cycle', 'cycles'):
+            kind = 'cycle'
+        elif arg in ('download', 'downloads'):
+            kind = 'download'
+        elif arg == 'off':
+            runs = 0
+        else:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="❌ Usage: /profile [N] [cycles|downloads|off]",
+                parse_mode="HTML")
+            return
+
+    monitor = get_monitor()
+    if runs == 0:
+        monitor.profiler.disarm()
+        text = "🔬 Profiling is off."
+    else:
+        monitor.profiler.arm(kind, runs, chat_id)
+        text = f"🔬 Profiling the next {runs} {kind}(s)."
+        if kind == 'cycle' and (monitor._run_task is None
+                                or monitor._run_task.done()):
+            text += ("\n⚠️ The monitor loop doesn't run in this worker, "
+                     "so cycles won't be profiled here.")
+    await context.bot.send_message(chat_id=chat_id,
+                                   text=text,
+                                   parse_mode="HTML")
+
+
+async def send_profile_report(bot, chat_id: Any, path: str,
+                              summary: str) -> None:
+    """Profiler reporter: send the summary and the .prof file to the admin."""
+    try:
+        # Telegram messages are capped at 4096 characters
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"<pre>{html.escape(summary[:3900])}</pre>",
+            parse_mode="HTML")
+        with open(path, 'rb') as f:
+            await bot.send_document(chat_id=chat_id,
+                                    document=f,
+                                    filename=os.path.basename(path))
+    except Exception as e:
+        logger.error(f"Failed to send profile {path} to {chat_id}: {e}")
+
+
+async def startup_report(update: Update,
+                         context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /startup command."""
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=f"⏱️ <b>Startup timings</b>\n<pre>{startup.report()}</pre>",
+        parse_mode="HTML")
+
+
+async def warm_up() -> None:
+    """Launch the browser and restore the Instagram session in the background."""
+    try:
+        with startup.phase("browser warm-up"):
+            ok = await get_monitor().warm_up()
+        startup.mark("Instagram session ready" if ok else
+                     "Instagram login failed during warm-up")
+    except Exception as e:
+        logger.error(f"Error warming up browser: {e}")
+
+
+def acquire_monitor_lock() -> bool:
+    """
+    Make sure only one process runs the monitor loop, even with several
+    webhook workers. The lock is held until the process exits.
+    """
+    global monitor_lock_file
+    import fcntl
+
+    lock_file = open(os.getenv('MONITOR_LOCK_FILE', 'monitor.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    monitor_lock_file = lock_file
+    return True
+
+
+async def send_story_alert(bot, chat_id: str, username: str,
+                           story: Dict[str, Any]) -> bool:
+    """Pipeline notifier: send a new story's media straight to the chat."""
+    kind = 'video' if story['type'] == 'video' else 'photo'
+    try:
+        await send_story_media(
+            bot,
+            get_file_id_cache(),
+            chat_id,
+            kind,
+            story['media_hash'],
+            story['media_path'],
+            caption=f"🎭 <b>@{username}</b> just posted a new story!",
+            parse_mode="HTML")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send alert for @{username} to {chat_id}: {e}")
+        return False
+
+
+async def send_story_digest(bot, chat_id: str,
+                            alerts: List[Dict[str, Any]]) -> bool:
+    """Digest sender: one album of the held stories plus a summary."""
+    if len(alerts) == 1:
+        return await send_story_alert(bot, chat_id, alerts[0]['username'],
+                                      alerts[0]['story'])
+    try:
+        await send_story_album(bot, get_file_id_cache(), chat_id, [{
+            'kind': 'video' if alert['story']['type'] == 'video' else 'photo',
+            'media_hash': alert['story']['media_hash'],
+            'path': alert['story']['media_path'],
+            'caption': f"🎭 <b>@{alert['username']}</b>"
+        } for alert in alerts])
+        names = ", ".join(f"@{alert['username']}" for alert in alerts)
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"🎭 <b>{len(alerts)} new stories</b> from {names}",
+            parse_mode="HTML")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send digest of {len(alerts)} stories "
+                     f"to {chat_id}: {e}")
+        return False
+
+
+async def notify_story(bot, chat_id: str, username: str,
+                       story: Dict[str, Any]):
+    """Pipeline notifier: hold the alert for a digest or send it now."""
+    if story_digest and story_digest.should_hold(username):
+        return story_digest.add(chat_id, username, story)
+    return await send_story_alert(bot, chat_id, username, story)
+
+
+async def on_startup(application: Application) -> None:
+    """Run once the bot is initialized, before it starts taking updates."""
+    global warm_up_task, story_digest
+    startup.mark("bot initialized")
+    get_command_jobs().start()
+    get_monitor().profiler.reporter = partial(send_profile_report,
+                                              application.bot)
+
+    # Integrated mode: the monitor loop shares this event loop, browser,
+    # Instagram session and registry with the command handlers
+    runs_monitor = (os.getenv('RUN_MONITOR_IN_BOT', '1') != '0' and
+                    acquire_monitor_lock())
+    if runs_monitor:
+        # Don't hold up command handling on Chromium. Other workers
+        # launch it on their first heavy command instead, so they
+        # don't all log in to Instagram at once
+        warm_up_task = asyncio.create_task(warm_up())
+        story_digest = StoryDigest.from_env(
+            partial(send_story_digest, application.bot))
+        get_monitor().pipeline.notifier = partial(notify_story,
+                                                  application.bot)
+        get_monitor().start()
+    else:
+        logger.info("Monitor loop runs in another process.")
+        # Chromium can't share a profile directory between processes;
+        # the persistent profile belongs to the monitor
+        get_monitor().browser_profile_dir = None
+
+
+async def on_shutdown(application: Application) -> None:
+    """Stop background work and close the browser."""
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    if command_jobs:
+        await command_jobs.stop()
+    if story_digest:
+        # Held alerts go out now rather than wait for a resend next start
+        await story_digest.flush()
+    if monitor:
+        await monitor.stop()
+        await monitor.profiler.flush()
+        await monitor.cleanup_browser()
+    if file_id_cache:
+        await asyncio.to_thread(file_id_cache.flush)
+
+
+def build_application() -> Application:
+    """Create the Telegram application and register all handlers."""
+    bot_token = os.getenv('BOT_TOKEN')
+    if not bot_token:
+        raise ValueError("BOT_TOKEN environment variable is required")
+
+    with startup.phase("application built"):
+        application = (Application.builder().token(bot_token).post_init(
+            on_startup).post_shutdown(on_shutdown).build())
+
+    # Register handlers
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("track", track))
+    application.add_handler(CommandHandler("untrack", untrack))
+    application.add_handler(CommandHandler("list", list_tracked))
+    application.add_handler(
+        MessageHandler(
+            (filters.Document.FileExtension("txt") |
+             filters.Document.FileExtension("csv")) &
+            filters.CaptionRegex(r'^/(track|untrack)\b'), bulk_document))
+    application.add_handler(CommandHandler("download", download))
+    application.add_handler(CommandHandler("cancel", cancel))
+    application.add_handler(CommandHandler("startup", startup_report))
+    application.add_handler(CommandHandler("profile", profile))
+    application.add_handler(
+        CommandHandler(
+            "stats", lambda u, c: c.bot.send_message(u.effective_chat.id,
+                                                     "📊 Stats coming soon!")))
+    application.add_handler(
+        CommandHandler(
+            "level", lambda u, c: c.bot.send_message(
+                u.effective_chat.id, "🏆 Level system coming soon!")))
+    application.add_handler(
+        CommandHandler(
+            "roast", lambda u, c: c.bot.send_message(
+                u.effective_chat.id, "🔥 Roasting system coming soon!")))
+    application.add_handler(
+        CommandHandler(
+            "tips", lambda u, c: c.bot.send_message(u.effective_chat.id,
+                                                    "🎯 Tips coming soon!")))
+    application.add_handler(
+        CommandHandler(
+            "achievements", lambda u, c: c.bot.send_message(
+                u.effective_chat.id, "🏅 Achievements coming soon!")))
+    application.add_handler(CommandHandler("help",
+                                           start))  # Reuse start command for help
+    application.add_error_handler(error_handler)
+    return application
+
+
+def configure_environment() -> None:
+    """Load .env and set up logging for whichever entry point is used."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    configure_logging()
+
+
+def create_webhook_application() -> Application:
+    """Application factory for the webhook server."""
+    configure_environment()
+    return build_application()
+
+
+# ASGI entry point for webhook mode, e.g.
+#   gunicorn -c gunicorn.conf.py run_bot:app
+app = TelegramWebhookApp(create_webhook_application)
+
+
+def run_webhook() -> None:
+    """Serve the webhook with uvicorn."""
+    import uvicorn
+
+    print("🤖 StoryBot v1.0 – Webhook mode initialized")
+    uvicorn.run("run_bot:app",
+                host="0.0.0.0",
+                port=int(os.getenv('PORT', '5001')),
+                workers=int(os.getenv('WEB_CONCURRENCY', '1')))
 
 
 def run_bot():
+    configure_environment()
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        run_webhook()
+        return
+
     print("🤖 StoryBot v1.0 – Polling mode initialized")
 
     try:
-        # Delete webhook to enable polling
-        requests.get(f"https://api.telegram.org/bot{bot_token}/deleteWebhook",
-                     params={'drop_pending_updates': True})
-        application.initialize()
+        application = build_application()
+        # run_polling deletes any webhook itself, so no extra API call here
         application.run_polling(drop_pending_updates=True)
     except Exception as e:
         logger.error(f"Polling failed: {e}")
@@ -0,0 +1,45 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Records how long each startup phase took, relative to process start."""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        # (phase, seconds since start, duration or None for plain marks)
+        self.phases: List[Tuple[str, float, Optional[float]]] = []
+
+    def mark(self, phase: str) -> None:
+        """Record that a phase was reached."""
+        elapsed = time.monotonic() - self.started_at
+        self.phases.append((phase, elapsed, None))
+        logger.info(f"Startup: {phase} at +{elapsed:.2f}s")
+
+    @contextmanager
+    def phase(self, phase: str):
+        """Time a block and record its duration."""
+        begin = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self.phases.append((phase, end - self.started_at, end - begin))
+            logger.info(f"Startup: {phase} took {end - begin:.2f}s "
+                        f"(done at +{end - self.started_at:.2f}s)")
+
+    def report(self) -> str:
+        """Human-readable summary of all recorded phases."""
+        if not self.phases:
+            return "No startup phases recorded yet."
+        lines = []
+        for phase, elapsed, duration in self.phases:
+            if duration is None:
+                lines.append(f"+{elapsed:6.2f}s  {phase}")
+            else:
+                lines.append(f"+{elapsed:6.2f}s  {phase} ({duration:.2f}s)")
+        return "\n".join(lines)
@@ -0,0 +1,391 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Any
+
+import aiohttp
+
+from request_throttle import RequestThrottle
+from story_buffer import StoryBuffer
+
+logger = logging.getLogger(__name__)
+
+INSTAGRAM_BASE_URL = "https://www.instagram.com"
+# Public app id the Instagram web client sends with every API call
+INSTAGRAM_APP_ID = "936619743392459"
+
+CHALLENGE_MESSAGES = ("login_required", "checkpoint_required",
+                      "challenge_required", "feedback_required")
+
+# Creates a buffer for a download of the given (possibly unknown) size
+BufferFactory = Callable[[Optional[int]], Awaitable[StoryBuffer]]
+
+
+async def _unbudgeted_buffer(expected_size: Optional[int]) -> StoryBuffer:
+    return await StoryBuffer.create(None, expected_size)
+
+
+class StoryAPIError(Exception):
+    """The JSON endpoints could not answer; fall back to the browser."""
+
+
+class SessionChallengedError(StoryAPIError):
+    """Instagram redirected to login or asked for a checkpoint."""
+
+
+class AccountNotFoundError(StoryAPIError):
+    """The username doesn't exist (anymore)."""
+
+
+class ProfileMismatchError(StoryAPIError):
+    """A user id's reel belongs to a different username (a rename)."""
+
+
+class TransientAPIError(StoryAPIError):
+    """A request failed in a way that is worth retrying."""
+
+
+class RateLimitedError(TransientAPIError):
+    """Instagram answered 429 Too Many Requests."""
+
+
+class InstagramStoryAPI:
+    """Browserless story checks against the JSON endpoints of the web app."""
+
+    def __init__(self,
+                 cookies: List[Dict[str, Any]],
+                 base_url: str = INSTAGRAM_BASE_URL,
+                 user_agent: Optional[str] = None,
+                 timeout: float = 15,
+                 throttle: Optional[RequestThrottle] = None):
+        self.base_url = base_url.rstrip('/')
+        self.user_agent = user_agent
+        self.throttle = throttle
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cookies: Dict[str, str] = {}
+        self.update_cookies(cookies)
+
+    def update_cookies(self, cookies: List[Dict[str, Any]]) -> None:
+        """Take over the cookies of the Playwright browser context."""
+        self.cookies = {
+            cookie['name']: cookie['value']
+            for cookie in cookies if cookie.get('name')
+        }
+
+    def has_session(self) -> bool:
+        """Check whether the cookies carry a logged-in session."""
+        return bool(self.cookies.get('sessionid'))
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {
+            'X-IG-App-ID': INSTAGRAM_APP_ID,
+            'X-Requested-With': 'XMLHttpRequest',
+            'Accept': 'application/json',
+            'Referer': f"{self.base_url}/",
+            'Cookie': '; '.join(f"{name}={value}"
+                                for name, value in self.cookies.items()),
+        }
+        if self.cookies.get('csrftoken'):
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+        return headers
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            # Cookies are sent explicitly on API calls only, never to the CDN
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                cookie_jar=aiohttp.DummyCookieJar())
+        return self.session
+
+    async def close(self) -> None:
+        """Close the pooled HTTP session."""
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _get_json(self, path: str,
+                        params: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """GET a JSON endpoint through the throttle, if there is one."""
+        if self.throttle is None:
+            return await self._fetch_json(path, params)
+        return await self.throttle.call(
+            lambda: self._fetch_json(path, params),
+            flagged=(SessionChallengedError, RateLimitedError),
+            retryable=(TransientAPIError,))
+
+    async def _fetch_json(self, path: str,
+                          params: Optional[Dict[str, str]] = None
+                          ) -> Dict[str, Any]:
+        """GET a JSON endpoint and raise if the answer isn't usable."""
+        session = await self._get_session()
+        url = f"{self.base_url}{path}"
+        try:
+            async with session.get(url,
+                                   params=params,
+                                   headers=self._headers(),
+                                   allow_redirects=False) as response:
+                if response.status in (301, 302, 303, 307, 308):
+                    location = response.headers.get('Location', '')
+                    if 'login' in location or 'challenge' in location:
+                        raise SessionChallengedError(
+                            f"Redirected to {location}")
+                    raise StoryAPIError(f"Unexpected redirect to {location}")
+                if response.status in (401, 403):
+                    raise SessionChallengedError(
+                        f"HTTP {response.status} from {path}")
+                if response.status == 404:
+                    raise AccountNotFoundError(f"HTTP 404 from {path}")
+                if response.status == 429:
+                    raise RateLimitedError(f"HTTP 429 from {path}")
+                if response.status >= 500:
+                    raise TransientAPIError(
+                        f"HTTP {response.status} from {path}")
+                if response.status != 200:
+                    raise StoryAPIError(f"HTTP {response.status} from {path}")
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError as e:
+                    raise StoryAPIError(f"Unparseable response from {path}: {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise TransientAPIError(f"Request to {path} failed: {e!r}")
+
+        if not isinstance(data, dict):
+            raise StoryAPIError(f"Unexpected payload from {path}")
+        if data.get('message') in CHALLENGE_MESSAGES or data.get(
+                'require_login'):
+            raise SessionChallengedError(
+                f"Session challenged: {data.get('message')}")
+        if data.get('status') == 'fail':
+            raise StoryAPIError(f"API error: {data.get('message')}")
+        return data
+
+    async def get_profile(self, username: str) -> Dict[str, Any]:
+        """Resolve a username to its user id and visibility."""
+        data = await self._get_json('/api/v1/users/web_profile_info/',
+                                    {'username': username})
+        try:
+            user = data['data']['user']
+        except (KeyError, TypeError):
+            raise StoryAPIError(f"No profile info for @{username}")
+        if not user:
+            raise AccountNotFoundError(f"@{username} doesn't exist")
+        try:
+            return {
+                'user_id': str(user['id']),
+                'is_private': bool(user.get('is_private')),
+                'followed': bool(user.get('followed_by_viewer'))
+            }
+        except (KeyError, TypeError):
+            raise StoryAPIError(f"No user id in profile info for @{username}")
+
+    async def get_user_id(self, username: str) -> str:
+        """Resolve a username to its numeric user id."""
+        return (await self.get_profile(username))['user_id']
+
+    @staticmethod
+    def _reel_items(reel: Optional[Dict[str, Any]],
+                    username: Optional[str]) -> List[Dict[str, Any]]:
+        if not reel:
+            return []
+        owner = (reel.get('user') or {}).get('username')
+        if username and owner and owner.lower() != username.lower():
+            raise ProfileMismatchError(
+                f"Reel of {reel.get('id')} belongs to @{owner} now")
+        return list(reel.get('items') or [])
+
+    async def get_reel_items(self,
+                             user_id: str,
+                             username: Optional[str] = None
+                             ) -> List[Dict[str, Any]]:
+        """
+        Fetch the raw story items of a user's reel (empty if no story).
+        With a username, raises ProfileMismatchError if the id belongs to
+        someone else now.
+        """
+        data = await self._get_json('/api/v1/feed/reels_media/',
+                                    {'reel_ids': user_id})
+        reels = data.get('reels')
+        if isinstance(reels, dict):
+            return self._reel_items(reels.get(user_id), username)
+        reels_media = data.get('reels_media')
+        if isinstance(reels_media, list):
+            for reel in reels_media:
+                if str(reel.get('id')) == user_id:
+                    return self._reel_items(reel, username)
+            return []
+        raise StoryAPIError(f"No reels in response for user {user_id}")
+
+    @staticmethod
+    def parse_story_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract type, media URL and thumbnail URL from a raw story item."""
+        try:
+            candidates = item.get('image_versions2', {}).get('candidates') or []
+            thumbnail_url = candidates[0]['url'] if candidates else None
+            videos = item.get('video_versions') or []
+            if videos:
+                return {
+                    'id': str(item.get('pk') or item.get('id')),
+                    'type': 'video',
+                    'media_url': videos[0]['url'],
+                    'thumbnail_url': thumbnail_url,
+                    'taken_at': item.get('taken_at'),
+                }
+            if not thumbnail_url:
+                raise StoryAPIError("Story item has no media")
+            return {
+                'id': str(item.get('pk') or item.get('id')),
+                'type': 'image',
+                'media_url': thumbnail_url,
+                'thumbnail_url': thumbnail_url,
+                'taken_at': item.get('taken_at'),
+            }
+        except (KeyError, TypeError, AttributeError) as e:
+            raise StoryAPIError(f"Malformed story item: {e}")
+
+    async def download_to(self, url: str,
+                          new_buffer: BufferFactory) -> StoryBuffer:
+        """Stream media from the CDN into a buffer (no session cookies)."""
+        session = await self._get_session()
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise StoryAPIError(
+                        f"Failed to download media: {response.status}")
+                buffer = await new_buffer(response.content_length)
+                try:
+                    async for chunk in response.content.iter_chunked(64 *
+                                                                     1024):
+                        await buffer.awrite(chunk)
+                except BaseException:
+                    buffer.close()
+                    raise
+                return buffer
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise StoryAPIError(f"Error downloading media: {e!r}")
+
+    async def _read_prefix(self, response: aiohttp.ClientResponse,
+                           limit: int) -> bytes:
+        data = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            data += chunk
+            if len(data) >= limit:
+                break
+        return bytes(data[:limit])
+
+    async def fingerprint(self,
+                          url: str,
+                          head_bytes: int = 64 * 1024,
+                          tail_bytes: int = 0) -> str:
+        """
+        Cheap identity of a media file: a digest of its first head_bytes
+        (and optionally last tail_bytes), fetched with HTTP Range, plus
+        its total size and ETag. Servers that ignore Range are cut off
+        after head_bytes as well.
+        """
+        session = await self._get_session()
+        try:
+            async with session.get(
+                    url, headers={'Range':
+                                  f'bytes=0-{head_bytes - 1}'}) as response:
+                if response.status not in (200, 206):
+                    raise StoryAPIError(
+                        f"Failed to fingerprint media: {response.status}")
+                content_range = response.headers.get('Content-Range', '')
+                size = content_range.rpartition('/')[2] if (
+                    response.status == 206) else str(
+                        response.content_length or '')
+                etag = response.headers.get('ETag', '')
+                head = await self._read_prefix(response, head_bytes)
+
+            tail = b''
+            if tail_bytes and size.isdigit() and int(size) > head_bytes:
+                async with session.get(
+                        url, headers={'Range':
+                                      f'bytes=-{tail_bytes}'}) as response:
+                    if response.status == 206:
+                        tail = await self._read_prefix(response, tail_bytes)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise StoryAPIError(f"Error fingerprinting media: {e!r}")
+
+        digest = hashlib.sha256(f"{size}:{etag}:{len(tail)}:".encode())
+        digest.update(head)
+        digest.update(tail)
+        return digest.hexdigest()
+
+    async def get_latest_story_item(
+            self,
+            username: str,
+            user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the newest parsed story item of a user, or None. A known
+        user id saves the profile lookup.
+        """
+        if user_id is None:
+            user_id = await self.get_user_id(username)
+        items = await self.get_reel_items(user_id, username)
+        if not items:
+            return None
+        item = self.parse_story_item(items[-1])
+        item['user_id'] = user_id
+        return item
+
+    async def fetch_story(
+            self,
+            item: Dict[str, Any],
+            new_buffer: BufferFactory = _unbudgeted_buffer,
+            media_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Download a parsed story item into the same shape as
+        InstagramMonitor.get_story_content. For videos the thumbnail
+        stands in for the screenshot; pass the media_hash of a video that
+        is already stored to fetch only the thumbnail (media_content is
+        then None).
+        """
+        if media_hash and item['type'] == 'video' and item['thumbnail_url']:
+            screenshot = await self.download_to(item['thumbnail_url'],
+                                                new_buffer)
+            media_content = None
+        else:
+            media_content = await self.download_to(item['media_url'],
+                                                   new_buffer)
+            media_hash = media_content.hexdigest()
+            try:
+                if item['type'] == 'video' and item['thumbnail_url']:
+                    screenshot = await self.download_to(
+                        item['thumbnail_url'], new_buffer)
+                else:
+                    screenshot = media_content
+            except BaseException:
+                media_content.close()
+                raise
+
+        return {
+            'type': item['type'],
+            'screenshot': screenshot,
+            'screenshot_hash': screenshot.hexdigest(),
+            'media_content': media_content,
+            'media_hash': media_hash,
+            'story_id': item['id'],
+            'user_id': item.get('user_id'),
+            'source': 'api'
+        }
+
+    async def get_latest_story(
+            self,
+            username: str,
+            new_buffer: BufferFactory = _unbudgeted_buffer
+    ) -> Optional[Dict[str, Any]]:
+        """Fetch the newest story of a user, or None if there is no story."""
+        item = await self.get_latest_story_item(username)
+        if item is None:
+            return None
+        return await self.fetch_story(item, new_buffer)
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from typing import List, Optional, BinaryIO, Union
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    Global cap on the bytes story captures may hold in memory.
+
+    Captures reserve their expected size up front. When the budget is
+    exhausted a capture waits for others to release; if that takes too
+    long it gets nothing and spools straight to disk instead.
+    """
+
+    def __init__(self, max_bytes: int, wait_timeout: float = 5.0):
+        self.max_bytes = max_bytes
+        self.wait_timeout = wait_timeout
+        self.in_use = 0
+        self.peak = 0
+        self.spilled = 0
+        self._waiters: List[asyncio.Future] = []
+
+    async def reserve(self, nbytes: int) -> int:
+        """Reserve up to nbytes; returns the amount granted (0 = use disk)."""
+        nbytes = min(nbytes, self.max_bytes)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        while self.in_use + nbytes > self.max_bytes:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return 0
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                return 0
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+        return nbytes
+
+    def release(self, nbytes: int) -> None:
+        """Give reserved bytes back and wake up waiting captures."""
+        self.in_use -= nbytes
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class StoryBuffer:
+    """
+    Spooled buffer for one piece of captured story media.
+
+    Data stays in memory up to the reservation granted by the budget and
+    spills to a temp file beyond that. The SHA-256 is computed as data
+    arrives, so nobody has to hash a full copy afterwards.
+    """
+
+    def __init__(self,
+                 budget: Optional[MemoryBudget] = None,
+                 reserved: int = 0,
+                 spool_dir: Optional[str] = None):
+        self.budget = budget
+        self.reserved = reserved
+        self.spool_dir = spool_dir
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._memory: Optional[io.BytesIO] = io.BytesIO()
+        self._file: Optional[BinaryIO] = None
+        self.closed = False
+
+    @classmethod
+    async def create(cls,
+                     budget: Optional[MemoryBudget],
+                     expected_size: Optional[int] = None,
+                     default_size: int = 8 * 1024 * 1024,
+                     spool_dir: Optional[str] = None) -> "StoryBuffer":
+        """Create a buffer, reserving its expected size from the budget."""
+        if budget is None:
+            return cls(reserved=expected_size or default_size,
+                       spool_dir=spool_dir)
+        reserved = await budget.reserve(expected_size or default_size)
+        if not reserved:
+            budget.spilled += 1
+            logger.info("Capture memory budget exhausted, spooling to disk")
+        return cls(budget, reserved, spool_dir)
+
+    @classmethod
+    async def from_bytes(cls, data: bytes,
+                         budget: Optional[MemoryBudget] = None) -> "StoryBuffer":
+        """Wrap bytes that already exist (e.g. a Playwright screenshot)."""
+        buffer = await cls.create(budget, len(data))
+        await buffer.awrite(data)
+        return buffer
+
+    @property
+    def in_memory(self) -> bool:
+        return self._file is None
+
+    def write(self, chunk: Union[bytes, memoryview]) -> None:
+        """Append a chunk, spilling to disk once past the reservation."""
+        if self._file is None and self.size + len(chunk) > self.reserved:
+            self._spill(self._spool())
+        (self._file or self._memory).write(chunk)
+        self._digest.update(chunk)
+        self.size += len(chunk)
+
+    async def awrite(self, chunk: Union[bytes, memoryview]) -> None:
+        """
+        write() for the event loop: the spill and every write that goes
+        to disk run in a worker thread.
+        """
+        if self._file is None:
+            if self.size + len(chunk) <= self.reserved:
+                self.write(chunk)
+                return
+            self._spill(await asyncio.to_thread(self._spool))
+        await asyncio.to_thread(self._file.write, chunk)
+        self._digest.update(chunk)
+        self.size += len(chunk)
+
+    def _spool(self) -> BinaryIO:
+        """Temp file holding what has been written so far (blocking)."""
+        spool = tempfile.TemporaryFile(dir=self.spool_dir)
+        spool.write(self._memory.getbuffer())
+        return spool
+
+    def _spill(self, spool: BinaryIO) -> None:
+        # Budget waiters are woken here, so this runs on the loop
+        self._file = spool
+        self._memory = None
+        self._release()
+
+    def hexdigest(self) -> str:
+        """SHA-256 of everything written so far."""
+        return self._digest.hexdigest()
+
+    def getbuffer(self) -> Optional[memoryview]:
+        """Zero-copy view of the data while it is held in memory."""
+        return self._memory.getbuffer() if self.in_memory else None
+
+    def open(self) -> BinaryIO:
+        """Rewound handle on the spooled file (disk-backed buffers only)."""
+        if self.in_memory:
+            raise ValueError("Buffer is in memory, use getbuffer()")
+        self._file.seek(0)
+        return self._file
+
+    def _release(self) -> None:
+        if self.budget and self.reserved:
+            self.budget.release(self.reserved)
+        self.reserved = 0
+
+    def close(self) -> None:
+        """Free the memory reservation and any temp file."""
+        if self.closed:
+            return
+        self.closed = True
+        self._release()
+        if self._file:
+            self._file.close()
+        self._memory = None
+        self._file = None
+
+
+def budget_from_env() -> MemoryBudget:
+    """Build the process-wide capture budget from the environment."""
+    return MemoryBudget(
+        int(os.getenv('CAPTURE_MEMORY_BUDGET_MB', '64')) * 1024 * 1024,
+        wait_timeout=float(os.getenv('CAPTURE_BUDGET_WAIT_SECONDS', '5')))
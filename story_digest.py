@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Telegram albums hold 2-10 items
+MAX_ALBUM_ITEMS = 10
+
+# (chat_id, [{"username", "story"}, ...]) -> delivered
+DigestSender = Callable[[Any, List[Dict[str, Any]]], Awaitable[bool]]
+
+
+class StoryDigest:
+    """
+    Holds a chat's story alerts for `window` seconds after the first one
+    and delivers them together, so a burst of stories costs one album
+    and one summary instead of a message per story. A chat's digest goes
+    out early once it reaches `max_items`.
+
+    add() returns a future that resolves to whether the digest holding
+    the alert was delivered, which the detection pipeline uses to
+    advance delivery cursors only after the fact. Alerts for
+    `priority_accounts` aren't held (see should_hold).
+    """
+
+    def __init__(self,
+                 send: DigestSender,
+                 window: float = 0,
+                 max_items: int = MAX_ALBUM_ITEMS,
+                 priority_accounts: Optional[Set[str]] = None):
+        self.send = send
+        self.window = window
+        self.max_items = max(1, min(max_items, MAX_ALBUM_ITEMS))
+        self.priority_accounts = {
+            name.lower()
+            for name in priority_accounts or ()
+        }
+        # chat_id -> held alerts, each {"username", "story", "future"}
+        self.pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self.digests_sent = 0
+        self.alerts_coalesced = 0
+
+    @classmethod
+    def from_env(cls, send: DigestSender) -> "StoryDigest":
+        """Build a digest configured from the environment (off by default)."""
+        return cls(send,
+                   window=float(os.getenv('DIGEST_WINDOW_SECONDS', '0')),
+                   max_items=int(
+                       os.getenv('DIGEST_MAX_ITEMS', str(MAX_ALBUM_ITEMS))),
+                   priority_accounts={
+                       name.strip().lstrip('@')
+                       for name in os.getenv('PRIORITY_ACCOUNTS',
+                                             '').split(',') if name.strip()
+                   })
+
+    def should_hold(self, username: str) -> bool:
+        """Whether an alert for this account waits for the chat's digest."""
+        return self.window > 0 and username.lower(
+        ) not in self.priority_accounts
+
+    def add(self, chat_id: Any, username: str,
+            story: Dict[str, Any]) -> "asyncio.Future[bool]":
+        """Hold an alert for the chat's next digest."""
+        future = asyncio.get_running_loop().create_future()
+        key = str(chat_id)
+        batch = self.pending.setdefault(key, [])
+        batch.append({'username': username, 'story': story,
+                      'future': future})
+        if len(batch) >= self.max_items:
+            # Taken now, so later adds start a new batch rather than
+            # joining one whose send is already scheduled
+            self._start_send(key, self.pending.pop(key))
+        elif key not in self._timers:
+            self._timers[key] = asyncio.create_task(self._send_later(key))
+        return future
+
+    async def _send_later(self, key: str) -> None:
+        await asyncio.sleep(self.window)
+        self._timers.pop(key, None)
+        await self._deliver(key, self.pending.pop(key, []))
+
+    def _start_send(self, key: str, batch: List[Dict[str, Any]]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        task = asyncio.create_task(self._deliver(key, batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, key: str, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        try:
+            delivered = await self.send(
+                key, [{'username': entry['username'], 'story': entry['story']}
+                      for entry in batch])
+        except Exception as e:
+            logger.error(f"Failed to send digest to {key}: {e}")
+            delivered = False
+        if delivered:
+            self.digests_sent += 1
+            self.alerts_coalesced += len(batch)
+        for entry in batch:
+            if not entry['future'].done():
+                entry['future'].set_result(bool(delivered))
+
+    async def flush(self) -> None:
+        """Send every held digest now, e.g. before shutting down."""
+        for key in list(self.pending):
+            self._start_send(key, self.pending.pop(key))
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'held': sum(len(batch) for batch in self.pending.values()),
+            'digests_sent': self.digests_sent,
+            'alerts_coalesced': self.alerts_coalesced
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from alert_state_store import AlertStateStore
+
+NOW = datetime(2025, 3, 10, 12, 0)
+
+
+def key(chat_id, day, story='aaaaaaaa-bbbbbbbb'):
+    return f"alice-{chat_id}-{day:%Y%m%d}-{story}"
+
+
+def seen_state(entries, cursors=None):
+    return {
+        'version': 2,
+        'next_seq': len(entries) + 1,
+        'seen': {
+            str(seq): {'hashes': hashes, 'seen_at': seen_at.isoformat()}
+            for seq, (hashes, seen_at) in enumerate(entries, 1)
+        },
+        'cursors': cursors or {},
+        'timestamp': NOW.isoformat(),
+        'last_check': ''
+    }
+
+
+def test_per_chat_keys_migrate_to_seen_set_and_cursors():
+    yesterday = NOW - timedelta(days=1)
+    legacy = {
+        'hashes': {
+            key('1', yesterday): 'a:b',
+            key('-100200', yesterday): 'a:b',
+            key('1', NOW, 'cccccccc-dddddddd'): 'c:d',
+        },
+        'timestamp': NOW.isoformat(),
+        'last_check': ''
+    }
+    state = AlertStateStore.migrate(legacy)
+    assert state['seen'] == {
+        '1': {'hashes': 'a:b', 'seen_at': '2025-03-09T00:00:00'},
+        '2': {'hashes': 'c:d', 'seen_at': '2025-03-10T00:00:00'}
+    }
+    assert state['cursors'] == {'1': 2, '-100200': 1}
+    assert state['next_seq'] == 3
+
+
+def test_keys_of_stories_without_media_migrate():
+    legacy = {
+        'hashes': {
+            key('-100200', NOW, 'aaaaaaaa-no-media'): 'a:',
+            key('1', NOW - timedelta(days=1), 'aaaaaaaa-no-media'): 'a:',
+        },
+        'timestamp': NOW.isoformat(),
+        'last_check': ''
+    }
+    state = AlertStateStore.migrate(legacy)
+    assert state['seen'] == {
+        '1': {'hashes': 'a:', 'seen_at': '2025-03-09T00:00:00'}
+    }
+    assert state['cursors'] == {'1': 1, '-100200': 1}
+
+
+def test_stories_are_recorded_once_and_cursors_only_advance(tmp_path):
+    store = AlertStateStore(str(tmp_path))
+    story = {'screenshot_hash': 'a' * 64, 'media_hash': 'b' * 64}
+    assert store.record_seen('alice', story) == 1
+    # Same media, different screenshot: still the same story
+    assert store.record_seen('alice', {'screenshot_hash': 'c' * 64,
+                                       'media_hash': 'b' * 64}) == 1
+    assert store.record_seen('alice', {'screenshot_hash': 'd' * 64}) == 2
+
+    store.advance_cursors('alice', {'1': 2, '2': 1})
+    store.advance_cursors('alice', {'1': 1})
+    state = store.get('alice')
+    assert state['cursors'] == {'1': 2, '2': 1}
+    assert len(state['seen']) == 2
+
+
+def test_stale_stories_and_cursors_are_dropped():
+    store = AlertStateStore('unused', retention_hours=48)
+    state = seen_state([('a:b', NOW - timedelta(days=3)),
+                        ('c:d', NOW - timedelta(days=1)),
+                        ('e:f', NOW)],
+                       cursors={'1': 1, '2': 2, '3': 3})
+    assert store.compact_state(state, NOW) == 2
+    assert set(state['seen']) == {'2', '3'}
+    assert state['cursors'] == {'2': 2, '3': 3}
+
+
+def test_background_pass_reports_reclaimed_bytes(tmp_path):
+    store = AlertStateStore(str(tmp_path), retention_hours=48)
+    old_day = datetime.now() - timedelta(days=10)
+    for name in ('alice', 'bob', 'carol'):
+        state = {
+            'hashes': {key(i, old_day): 'x' * 64 for i in range(50)},
+            'timestamp': old_day.isoformat()
+        }
+        with open(tmp_path / f"{name}.json", 'w') as f:
+            json.dump(state, f)
+    store.record_seen('dave', {'screenshot_hash': 'y', 'media_hash': 'z'})
+    fresh = store.get('dave')
+
+    stats = asyncio.run(store.compact_all(batch_size=2))
+    assert stats['files'] == 4
+    assert stats['compacted'] == 3
+    assert stats['reclaimed_bytes'] > 3 * 50 * 20
+    assert store.get('alice')['seen'] == {}
+    assert store.get('alice')['cursors'] == {}
+    assert store.get('dave') == fresh
@@ -0,0 +1,221 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from browser_lifecycle import (BrowserLifecycleManager, descendants_rss,
+                               prune_browser_profile)
+
+
+class FakeMonitor:
+    """Stands in for InstagramMonitor's browser hooks."""
+
+    def __init__(self):
+        self.browser = object()
+        self.context = object()
+        self.events = []
+        self.login_lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def exclusive_browser(self):
+        async with self.login_lock:
+            yield
+
+    async def save_session(self):
+        self.events.append('save')
+
+    async def recycle_context(self):
+        self.events.append('context')
+
+    async def cleanup_browser(self):
+        self.events.append('cleanup')
+
+    async def launch_browser(self):
+        self.events.append('launch')
+
+    async def restore_session(self):
+        self.events.append('restore')
+        return True
+
+
+def make_manager(monitor, **kwargs):
+    manager = BrowserLifecycleManager(monitor, **kwargs)
+    manager.measure_rss = lambda force=False: 0
+    return manager
+
+
+def test_context_recycled_after_check_threshold():
+
+    async def scenario():
+        monitor = FakeMonitor()
+        manager = make_manager(monitor, max_checks_per_context=3)
+        for _ in range(3):
+            async with manager.check_slot():
+                manager.page_used()
+            await manager.maybe_recycle()
+        return monitor, manager
+
+    monitor, manager = asyncio.run(scenario())
+    assert monitor.events == ['save', 'context', 'restore']
+    assert manager.checks_in_context == 0
+    assert manager.context_recycles == 1
+
+
+def test_checks_that_skip_the_page_are_not_counted():
+
+    async def scenario():
+        monitor = FakeMonitor()
+        manager = make_manager(monitor, max_checks_per_context=3)
+        # JSON fast-path checks hold a slot but never touch the page
+        for _ in range(5):
+            async with manager.check_slot():
+                pass
+            await manager.maybe_recycle()
+        return monitor, manager
+
+    monitor, manager = asyncio.run(scenario())
+    assert monitor.events == []
+    assert manager.checks_in_context == 0
+
+
+def test_memory_over_limit_recycles_whole_browser():
+
+    async def scenario():
+        monitor = FakeMonitor()
+        manager = make_manager(monitor, max_rss_mb=100)
+        manager.measure_rss = lambda force=False: 200 * 1024 * 1024
+        await manager.maybe_recycle()
+        return monitor, manager
+
+    monitor, manager = asyncio.run(scenario())
+    assert monitor.events == ['save', 'cleanup', 'launch', 'restore']
+    assert manager.browser_recycles == 1
+
+
+def test_recycle_drains_in_flight_and_holds_new_checks():
+
+    async def scenario():
+        monitor = FakeMonitor()
+        manager = make_manager(monitor)
+        release = asyncio.Event()
+
+        async def slow_check():
+            async with manager.check_slot():
+                monitor.events.append('check started')
+                await release.wait()
+                monitor.events.append('check finished')
+
+        async def late_check():
+            await asyncio.sleep(0.01)
+            async with manager.check_slot():
+                monitor.events.append('late check')
+
+        check = asyncio.create_task(slow_check())
+        await asyncio.sleep(0)
+        recycle = asyncio.create_task(manager.recycle('context'))
+        late = asyncio.create_task(late_check())
+        await asyncio.sleep(0.05)
+        assert 'save' not in monitor.events
+        release.set()
+        await asyncio.gather(check, recycle, late)
+        return monitor.events
+
+    assert asyncio.run(scenario()) == [
+        'check started', 'check finished', 'save', 'context', 'restore',
+        'late check'
+    ]
+
+
+def test_recycle_waits_for_a_login_outside_check_slots():
+
+    async def scenario():
+        monitor = FakeMonitor()
+        manager = make_manager(monitor)
+        release = asyncio.Event()
+
+        async def login():
+            async with monitor.login_lock:
+                monitor.events.append('login started')
+                await release.wait()
+                monitor.events.append('login finished')
+
+        logging_in = asyncio.create_task(login())
+        await asyncio.sleep(0)
+        recycle = asyncio.create_task(manager.recycle('context'))
+        await asyncio.sleep(0.01)
+        assert 'save' not in monitor.events
+        release.set()
+        await asyncio.gather(logging_in, recycle)
+        return monitor.events
+
+    assert asyncio.run(scenario()) == [
+        'login started', 'login finished', 'save', 'context', 'restore'
+    ]
+
+
+def test_descendants_rss_is_non_negative():
+    assert descendants_rss() >= 0
+
+
+def test_profile_caches_are_pruned_before_the_profile(tmp_path):
+    profile = tmp_path / "profile"
+    (profile / "Default" / "Cache").mkdir(parents=True)
+    (profile / "Default" / "Cache" / "data_1").write_bytes(b'x' * 4000)
+    (profile / "Default" / "Cookies").write_bytes(b'c' * 100)
+
+    assert prune_browser_profile(str(profile), 10_000) == 0
+    assert prune_browser_profile(str(profile), 1000) == 4000
+    assert (profile / "Default" / "Cookies").exists()
+    assert not (profile / "Default" / "Cache").exists()
+
+    # Still too big without its caches: start over
+    assert prune_browser_profile(str(profile), 50) == 100
+    assert not profile.exists()
+
+
+class FakePersistentContext:
+
+    def __init__(self, cookies):
+        self.jar = list(cookies)
+        self.pages = ['first page']
+
+    async def cookies(self):
+        return self.jar
+
+    async def add_cookies(self, cookies):
+        self.jar.extend(cookies)
+
+
+def test_persistent_profile_is_seeded_with_the_saved_session(
+        tmp_path, monkeypatch):
+    from instagram_monitor import InstagramMonitor
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('BROWSER_PROFILE_DIR', str(tmp_path / "profile"))
+    monkeypatch.setenv('BROWSER_DISK_CACHE_MB', '64')
+    monitor = InstagramMonitor('user', 'pass')
+    launches = []
+
+    class FakeChromium:
+
+        async def launch_persistent_context(self, user_data_dir, **kwargs):
+            launches.append((user_data_dir, kwargs))
+            return FakePersistentContext([])
+
+    monitor.playwright = type('FakePlaywright', (), {
+        'chromium': FakeChromium()
+    })()
+    session = [{'name': 'sessionid', 'value': 'abc'}]
+
+    async def saved_state():
+        return {'cookies': session}
+
+    async def scenario():
+        await monitor.launch_persistent_context(
+            ['--no-sandbox'], asyncio.create_task(saved_state()))
+
+    asyncio.run(scenario())
+    user_data_dir, kwargs = launches[0]
+    assert user_data_dir == str(tmp_path / "profile")
+    assert f'--disk-cache-size={64 * 1024 * 1024}' in kwargs['args']
+    assert kwargs['service_workers'] == 'block'
+    assert monitor.browser is monitor.context
+    assert monitor.context.jar == session
+    assert monitor.page == 'first page'
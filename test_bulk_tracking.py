@@ -0,0 +1,78 @@
+import run_bot
+from user_registry import UserRegistry
+
+
+def use_registry(tmp_path, monkeypatch):
+    registry = UserRegistry(str(tmp_path / "users.json"))
+    saves = []
+    save = registry.save
+
+    def counting_save(users):
+        saves.append(users)
+        save(users)
+
+    registry.save = counting_save
+    monkeypatch.setattr(run_bot, 'registry', registry)
+    return registry, saves
+
+
+def test_parse_usernames_accepts_lists_and_csv():
+    text = "@Alice, bob;carol\n dave  \n\neve,"
+    assert run_bot.parse_usernames(text) == [
+        'alice', 'bob', 'carol', 'dave', 'eve'
+    ]
+
+
+def test_bulk_add_validates_once_and_writes_once(tmp_path, monkeypatch):
+    registry, saves = use_registry(tmp_path, monkeypatch)
+    registry.save({'1': ['alice']})
+    saves.clear()
+
+    result = run_bot.add_users(
+        1, ['alice', 'bob', 'bad-name!', 'carol', 'bob'])
+    assert result == {
+        'added': ['bob', 'carol'],
+        'duplicate': ['alice', 'bob'],
+        'invalid': ['bad-name!']
+    }
+    assert len(saves) == 1
+    assert registry.load() == {'1': ['alice', 'bob', 'carol']}
+
+
+def test_bulk_remove_drops_empty_chats(tmp_path, monkeypatch):
+    registry, saves = use_registry(tmp_path, monkeypatch)
+    registry.save({'1': ['alice', 'bob'], '2': ['alice']})
+    saves.clear()
+
+    result = run_bot.remove_users(1, ['alice', 'bob', 'zed'])
+    assert result == {
+        'removed': ['alice', 'bob'],
+        'missing': ['zed'],
+        'invalid': []
+    }
+    assert len(saves) == 1
+    assert registry.load() == {'2': ['alice']}
+    assert "Stopped tracking (2)" in run_bot.format_bulk_result(result)
+
+
+def test_bulk_result_escapes_names():
+    text = run_bot.format_bulk_result({'added': ['alice'],
+                                       'invalid': ['<b>bad</b>&co']})
+    assert "@&lt;b&gt;bad&lt;/b&gt;&amp;co" in text
+    assert "<b>" not in text
+
+
+def test_bulk_first_checks_are_capped(monkeypatch):
+    requested = []
+
+    class Monitor:
+
+        def request_priority_check(self, users):
+            requested.append(users)
+            return True
+
+    monkeypatch.setattr(run_bot, 'monitor', Monitor())
+
+    names = [f"account_{n}" for n in range(500)]
+    assert run_bot.queue_first_check(1, names)
+    assert requested == [{'1': names[:run_bot.MAX_FIRST_CHECKS]}]
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from command_jobs import CommandJobManager, JobLimitError
+
+
+def test_chats_take_turns_and_respect_concurrency():
+
+    async def scenario():
+        manager = CommandJobManager(workers=1, per_chat_queued=10,
+                                    rate_limit=10)
+        order = []
+
+        def job(label):
+
+            async def run(job):
+                order.append(label)
+                await asyncio.sleep(0)
+
+            return run
+
+        for i in range(3):
+            manager.submit(1, 'download', f'a{i}', job(f'a{i}'))
+        manager.submit(2, 'download', 'b0', job('b0'))
+        manager.start()
+        while manager.stats()['completed'] < 4:
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return order
+
+    assert asyncio.run(scenario()) == ['a0', 'b0', 'a1', 'a2']
+
+
+def test_one_chat_never_runs_more_than_its_share():
+
+    async def scenario():
+        manager = CommandJobManager(workers=4, per_chat_queued=10,
+                                    rate_limit=10)
+        running = []
+        peak = []
+
+        async def run(job):
+            running.append(job)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(job)
+
+        for _ in range(4):
+            manager.submit(1, 'download', 'x', run)
+        manager.start()
+        while manager.stats()['completed'] < 4:
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return max(peak)
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_queue_and_rate_limits():
+    manager = CommandJobManager(per_chat_queued=2, rate_limit=3)
+
+    async def run(job):
+        pass
+
+    manager.submit(1, 'download', 'x', run)
+    manager.submit(1, 'download', 'x', run)
+    with pytest.raises(JobLimitError):
+        manager.submit(1, 'download', 'x', run)
+
+    manager.cancel(1)
+    manager.submit(1, 'download', 'x', run)
+    manager.cancel(1)
+    with pytest.raises(JobLimitError, match="Slow down"):
+        manager.submit(1, 'download', 'x', run)
+    # Other chats are unaffected
+    manager.submit(2, 'download', 'x', run)
+
+
+def test_cancel_running_job_reports_progress():
+
+    async def scenario():
+        manager = CommandJobManager(workers=1)
+        reports = []
+        started = asyncio.Event()
+
+        async def run(job):
+            started.set()
+            await asyncio.sleep(10)
+
+        async def progress(text):
+            reports.append(text)
+
+        job = manager.submit(1, 'download', 'x', run)
+        job.progress = progress
+        manager.start()
+        await started.wait()
+        assert manager.cancel(1) is job
+        while job.status == 'running':
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return job, reports
+
+    job, reports = asyncio.run(scenario())
+    assert job.status == 'cancelled'
+    assert reports == [f"🛑 Job #{job.id} cancelled."]
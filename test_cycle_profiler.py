@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+from cycle_profiler import CycleProfiler
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+def test_profiles_only_the_armed_runs(tmp_path):
+    reports = []
+
+    async def reporter(chat_id, path, summary):
+        reports.append((chat_id, path, summary))
+
+    async def scenario():
+        profiler = CycleProfiler(str(tmp_path), top=5, reporter=reporter)
+        async with profiler.profile('cycle'):
+            busy_work()
+        profiler.arm('cycle', 2, chat_id=42)
+        for _ in range(3):
+            async with profiler.profile('cycle', "Cycle"):
+                # A download overlapping a profiled cycle isn't profiled
+                async with profiler.profile('download'):
+                    busy_work()
+        await profiler.flush()
+        return profiler
+
+    profiler = asyncio.run(scenario())
+    assert len(reports) == 2
+    assert profiler.armed == {}
+    chat_id, path, summary = reports[0]
+    assert chat_id == 42 and os.path.exists(path)
+    assert "(1 more to profile)" in summary.splitlines()[0]
+    assert "busy_work" in summary
+    assert "more to profile" not in reports[1][2]
+
+
+def test_errors_in_the_profiled_block_still_count(tmp_path):
+
+    async def scenario():
+        profiler = CycleProfiler(str(tmp_path))
+        profiler.arm('download', 1)
+        try:
+            async with profiler.profile('download'):
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        await profiler.flush()
+        return profiler
+
+    profiler = asyncio.run(scenario())
+    assert profiler.armed == {}
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_slow_reports_do_not_hold_up_the_next_run(tmp_path):
+    sent = asyncio.Event()
+
+    async def reporter(chat_id, path, summary):
+        await sent.wait()
+
+    async def profiled_runs(profiler):
+        for _ in range(2):
+            async with profiler.profile('cycle'):
+                pass
+
+    async def scenario():
+        profiler = CycleProfiler(str(tmp_path), reporter=reporter)
+        profiler.arm('cycle', 2, chat_id=42)
+        # The upload is still pending when the runs are done
+        await asyncio.wait_for(profiled_runs(profiler), 1)
+        sent.set()
+        await profiler.flush()
+
+    asyncio.run(scenario())
+    # Both runs finished within the same second and kept their own file
+    assert len(os.listdir(tmp_path)) == 2
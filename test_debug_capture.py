@@ -0,0 +1,88 @@
+import asyncio
+import gzip
+import os
+
+from debug_capture import DebugCapture
+
+
+class FakePage:
+    url = 'https://www.instagram.com/accounts/login/'
+
+    def __init__(self):
+        self.captures = 0
+
+    async def content(self):
+        self.captures += 1
+        return f'<html>attempt {self.captures}</html>'
+
+    async def screenshot(self, type='png'):
+        return b'png-bytes'
+
+
+def test_captures_are_compressed_throttled_and_bounded(tmp_path):
+    ring = DebugCapture(str(tmp_path), max_captures=2, min_interval=600)
+    page = FakePage()
+
+    async def scenario():
+        first = await ring.capture(page, 'me@example', 'login',
+                                   RuntimeError('no home icon'))
+        # The same failure again right away isn't captured
+        repeat = await ring.capture(page, 'me@example', 'login')
+        others = [
+            await ring.capture(page, 'other', step)
+            for step in ('login', 'story-check')
+        ]
+        return first, repeat, others
+
+    first, repeat, others = asyncio.run(scenario())
+    assert repeat is None
+    assert os.path.basename(others[0]).startswith('other-login-')
+    with gzip.open(others[1], 'rt') as f:
+        content = f.read()
+    assert 'step: story-check' in content and 'attempt 3' in content
+
+    # Only the two newest captures (HTML + screenshot each) are kept
+    assert not os.path.exists(first)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(path)[:-len('.html.gz')] + suffix
+        for path in others for suffix in ('.html.gz', '.png'))
+
+
+def test_nothing_is_captured_when_disabled(tmp_path):
+    ring = DebugCapture(str(tmp_path / 'captures'), max_captures=0)
+    assert asyncio.run(ring.capture(FakePage(), 'me', 'login')) is None
+    assert not os.path.exists(tmp_path / 'captures')
+
+
+def test_profile_without_a_story_is_not_captured(tmp_path, monkeypatch):
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    from instagram_monitor import InstagramMonitor
+
+    monkeypatch.chdir(tmp_path)
+    monitor = InstagramMonitor('user', 'pass')
+    captured = []
+
+    class ProfilePage(FakePage):
+
+        async def wait_for_load_state(self, state):
+            pass
+
+        async def query_selector(self, selector):
+            return None
+
+        async def wait_for_selector(self, selector, timeout):
+            raise PlaywrightTimeoutError(f"Timeout {timeout}ms exceeded")
+
+    async def navigate(url):
+        return None
+
+    async def capture_failure(step, error=None):
+        captured.append(step)
+
+    monitor.page = ProfilePage()
+    monitor.navigate = navigate
+    monitor.capture_failure = capture_failure
+
+    assert asyncio.run(monitor.check_story_browser('quiet')) is None
+    assert captured == []
@@ -0,0 +1,235 @@
+import asyncio
+import time
+
+from instagram_monitor import InstagramMonitor
+from detection_pipeline import DetectionPipeline, PipelineStage
+
+
+def make_monitor(tmp_path, monkeypatch, stories):
+    monkeypatch.chdir(tmp_path)
+    monitor = InstagramMonitor('user', 'pass')
+
+    async def probe_story(username):
+        return {'mode': 'api'} if username in stories else None
+
+    async def capture_story(username, probe):
+        return dict(stories[username])
+
+    monitor.probe_story = probe_story
+    monitor.capture_story = capture_story
+    return monitor
+
+
+def test_new_stories_are_committed_and_fanned_out(tmp_path, monkeypatch):
+    story = {'type': 'image', 'screenshot_hash': 'a' * 64,
+             'media_hash': 'b' * 64}
+    monitor = make_monitor(tmp_path, monkeypatch, {'alice': story})
+    sent = []
+
+    async def notifier(chat_id, username, story):
+        sent.append((chat_id, username))
+        return True
+
+    async def scenario():
+        pipeline = DetectionPipeline(monitor, notifier)
+        users = {'1': ['alice', 'bob'], '2': ['alice']}
+        await pipeline.run_cycle(users)
+        await pipeline.notify.join()
+        # Same story again: deduped, nobody is alerted twice
+        await pipeline.run_cycle(users)
+        await pipeline.notify.join()
+        await pipeline.stop()
+        return pipeline.stats()
+
+    stats = asyncio.run(scenario())
+    assert sorted(sent) == [('1', 'alice'), ('2', 'alice')]
+    assert stats['alerts_sent'] == 2
+    assert stats['probe']['processed'] == 4
+    assert stats['stories_recorded'] == 1
+    state = monitor.get_last_alert_state('alice')
+    # Recorded once for the account, one cursor per chat
+    assert [entry['hashes'] for entry in state['seen'].values()
+            ] == [f"{'a' * 64}:{'b' * 64}"]
+    assert state['cursors'] == {'1': 1, '2': 1}
+    # Every capture and alert released its pin on the story's blobs
+    assert monitor.media_store._pins == {}
+
+
+def test_late_subscribers_and_failed_deliveries_catch_up(tmp_path,
+                                                         monkeypatch):
+    story = {'type': 'image', 'screenshot_hash': 'a' * 64,
+             'media_hash': 'b' * 64}
+    monitor = make_monitor(tmp_path, monkeypatch, {'alice': story})
+    sent = []
+    failing = {'2'}
+
+    async def notifier(chat_id, username, story):
+        if chat_id in failing:
+            return False
+        sent.append(chat_id)
+        return True
+
+    async def scenario():
+        pipeline = DetectionPipeline(monitor, notifier)
+        await pipeline.run_cycle({'1': ['alice'], '2': ['alice']})
+        await pipeline.notify.join()
+        failing.clear()
+        await pipeline.run_cycle({'1': ['alice'], '2': ['alice'],
+                                  '3': ['alice']})
+        await pipeline.notify.join()
+        await pipeline.stop()
+        return pipeline.stats()
+
+    stats = asyncio.run(scenario())
+    assert sent == ['1', '2', '3']
+    assert stats['stories_recorded'] == 1
+    assert monitor.get_last_alert_state('alice')['cursors'] == {
+        '1': 1, '2': 1, '3': 1}
+
+
+def test_slow_delivery_does_not_hold_up_the_cycle(tmp_path, monkeypatch):
+    stories = {
+        f'user{i}': {'type': 'image', 'screenshot_hash': f'{i:064d}',
+                     'media_hash': f'{i:064x}'}
+        for i in range(5)
+    }
+    monitor = make_monitor(tmp_path, monkeypatch, stories)
+    release = asyncio.Event()
+
+    async def notifier(chat_id, username, story):
+        await release.wait()
+        return True
+
+    async def scenario():
+        pipeline = DetectionPipeline(monitor, notifier, {'notify': 1})
+        await asyncio.wait_for(pipeline.run_cycle({'1': list(stories)}), 1)
+        pending = pipeline.stats()['notify']
+        release.set()
+        await pipeline.notify.join()
+        await pipeline.stop()
+        return pending, pipeline.stats()
+
+    pending, stats = asyncio.run(scenario())
+    assert pending['depth'] + pending['in_progress'] == 5
+    assert stats['alerts_sent'] == 5
+
+
+def test_full_queue_pushes_back():
+
+    async def scenario():
+        release = asyncio.Event()
+        seen = []
+
+        async def slow(item):
+            await release.wait()
+            seen.append(item)
+            return []
+
+        stage = PipelineStage('slow', slow, concurrency=1, queue_size=2)
+        stage.start()
+        for i in range(3):
+            await stage.put(i)
+        blocked = asyncio.create_task(stage.put(3))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        release.set()
+        await blocked
+        await stage.join()
+        await stage.stop()
+        return seen, stage.stats()
+
+    seen, stats = asyncio.run(scenario())
+    assert seen == [0, 1, 2, 3]
+    assert stats['max_depth'] == 2
+
+
+def test_priority_checks_jump_the_queue(tmp_path, monkeypatch):
+    monitor = make_monitor(tmp_path, monkeypatch, {})
+    probed = []
+
+    async def probe_story(username):
+        probed.append(username)
+        await asyncio.sleep(0)
+        return None
+
+    monitor.probe_story = probe_story
+
+    async def notifier(chat_id, username, story):
+        return True
+
+    async def scenario():
+        pipeline = DetectionPipeline(monitor, notifier, {'probe': 1})
+        cycle = asyncio.create_task(
+            pipeline.run_cycle({'1': [f'user{i}' for i in range(10)]}))
+        await asyncio.sleep(0)
+        await pipeline.check_now({'2': ['newbie']})
+        await cycle
+        await pipeline.stop()
+
+    asyncio.run(scenario())
+    assert len(probed) == 11
+    assert probed.index('newbie') < 5
+
+
+def test_a_new_story_found_twice_fans_out_once(tmp_path, monkeypatch):
+    story = {'type': 'image', 'screenshot_hash': 'a' * 64,
+             'media_hash': 'b' * 64}
+    monitor = make_monitor(tmp_path, monkeypatch, {'alice': story})
+
+    async def notifier(chat_id, username, story):
+        return True
+
+    async def scenario():
+        pipeline = DetectionPipeline(monitor, notifier)
+        # A priority check and the cycle both get past dedupe first
+        item = {'username': 'alice', 'chats': ['1', '2'],
+                'probe': {'mode': 'api'}}
+        deduped = []
+        for _ in range(2):
+            captured = await pipeline._capture(item)
+            deduped += await pipeline._dedupe(captured[0])
+        assert [entry['seq'] for entry in deduped] == [None, None]
+        return [await pipeline._commit(entry) for entry in deduped]
+
+    first, second = asyncio.run(scenario())
+    assert [alert['chat_id'] for alert in first] == ['1', '2']
+    assert second == []
+
+
+def test_cycle_deadline_carries_unchecked_accounts_over(tmp_path,
+                                                        monkeypatch):
+    monitor = make_monitor(tmp_path, monkeypatch, {})
+    probed = []
+
+    async def slow_probe(username):
+        probed.append(username)
+        await asyncio.sleep(0.05)
+        return None
+
+    monitor.probe_story = slow_probe
+
+    async def notifier(chat_id, username, story):
+        return True
+
+    async def scenario():
+        pipeline = DetectionPipeline(monitor, notifier, {'probe': 1},
+                                     queue_size=2)
+        users = {'1': [f'user{n}' for n in range(10)]}
+        first = await pipeline.run_cycle(users,
+                                         deadline=time.monotonic() + 0.12)
+        first_probed = list(probed)
+        probed.clear()
+        second = await pipeline.run_cycle(users)
+        await pipeline.stop()
+        return first, first_probed, second
+
+    first, first_probed, second = asyncio.run(scenario())
+    assert 2 <= first['checked'] <= 4
+    assert first['checked'] == len(first_probed)
+    assert first['carried_over'] == 10 - first['checked']
+    assert first['coverage'] < 1
+    assert first['max_staleness'] >= 0.1
+    # Accounts left over go first, then the rest in the usual order
+    assert probed == ([f'user{n}' for n in range(first['checked'], 10)] +
+                      first_probed)
+    assert second['coverage'] == 1 and second['carried_over'] == 0
@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import os
+import shutil
 from instagram_monitor import InstagramMonitor
 
 # Setup logging
@@ -72,7 +73,7 @@ async def test_download_story(username: str):
                 
             # Process story content
             logger.info("Processing story content...")
-            story_content = await monitor.get_story_content(story_element)
+            story_content = await monitor.get_story_content(story_element, username)
             if not story_content:
                 logger.error(f"❌ Could not download story content for @{username}")
                 return False
@@ -90,8 +91,7 @@ async def test_download_story(username: str):
             
             # Save screenshot
             screenshot_path = os.path.join(test_dir, f"{username}_screenshot.png")
-            with open(screenshot_path, "wb") as f:
-                f.write(story_content['screenshot'])
+            shutil.copyfile(story_content['screenshot_path'], screenshot_path)
             logger.info(f"  Saved screenshot to {screenshot_path}")
             
             # Save media content
@@ -100,8 +100,7 @@ async def test_download_story(username: str):
             else:
                 media_path = os.path.join(test_dir, f"{username}_image.jpg")
                 
-            with open(media_path, "wb") as f:
-                f.write(story_content['media_content'])
+            shutil.copyfile(story_content['media_path'], media_path)
             logger.info(f"  Saved media to {media_path}")
             
             return True
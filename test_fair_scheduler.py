@@ -0,0 +1,29 @@
+from fair_scheduler import FairScheduler
+
+
+def test_heavy_chats_cannot_starve_small_ones():
+    users = {'heavy': [f'h{n}' for n in range(500)], 'small': ['s1', 's2']}
+    order = FairScheduler().order(users)
+    assert order[:4] == ['h0', 's1', 'h1', 's2']
+    assert len(order) == 502
+
+
+def test_weights_and_shared_accounts(monkeypatch):
+    monkeypatch.setenv('CHAT_WEIGHTS', 'premium:2, broken:x')
+    scheduler = FairScheduler.from_env()
+    users = {
+        'free': ['f1', 'f2', 'f3'],
+        'premium': ['p1', 'p2', 'p3', 'p4'],
+    }
+    assert scheduler.order(users) == ['f1', 'p1', 'p2', 'f2', 'p3', 'p4',
+                                      'f3']
+
+    # A shared account is checked once, when its first chat reaches it,
+    # and the other chat moves on to its next account for free
+    users = {'a': ['a1', 'shared'], 'b': ['shared', 'b1']}
+    assert FairScheduler().order(users) == ['a1', 'shared', 'b1']
+
+
+def test_zero_weight_chats_go_last():
+    users = {'muted': ['m1'], 'normal': ['n1', 'n2']}
+    assert FairScheduler({'muted': 0}).order(users) == ['n1', 'n2', 'm1']
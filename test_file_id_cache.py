@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from telegram.error import BadRequest
+
+from file_id_cache import FileIdCache, send_story_album, send_story_media
+
+
+class FakeBot:
+    """Records sends and hands out a file_id for every upload."""
+
+    def __init__(self, reject_ids=()):
+        self.uploads = 0
+        self.sent = []
+        self.reject_ids = set(reject_ids)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        if isinstance(photo, str):
+            if photo in self.reject_ids:
+                raise BadRequest("Wrong file identifier")
+            self.sent.append((chat_id, photo))
+            file_id = photo
+        else:
+            await asyncio.sleep(0.01)
+            photo.read()
+            self.uploads += 1
+            file_id = f"file-{self.uploads}"
+            self.sent.append((chat_id, "upload"))
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)],
+                               video=None)
+
+
+def test_each_media_is_uploaded_once_across_chats(tmp_path):
+    media = tmp_path / "media.jpg"
+    media.write_bytes(b"jpeg")
+    cache = FileIdCache(str(tmp_path / "ids.json"))
+    bot = FakeBot()
+
+    async def deliver():
+        await asyncio.gather(*[
+            send_story_media(bot, cache, chat_id, "photo", "abc", str(media))
+            for chat_id in range(20)
+        ])
+
+    asyncio.run(deliver())
+    assert bot.uploads == 1
+    assert len(bot.sent) == 20
+    assert FileIdCache(str(tmp_path / "ids.json")).get("abc",
+                                                      "photo") == "file-1"
+
+
+def test_rejected_file_id_is_reuploaded(tmp_path):
+    media = tmp_path / "media.jpg"
+    media.write_bytes(b"jpeg")
+    cache = FileIdCache(str(tmp_path / "ids.json"))
+    cache.set("abc", "photo", "stale-id")
+    bot = FakeBot(reject_ids={"stale-id"})
+
+    asyncio.run(send_story_media(bot, cache, 1, "photo", "abc", str(media)))
+    assert bot.uploads == 1
+    assert cache.get("abc", "photo") == "file-1"
+
+
+def test_cache_is_bounded(tmp_path):
+    cache = FileIdCache(str(tmp_path / "ids.json"), max_entries=2)
+    for i in range(3):
+        cache.set(f"hash{i}", "photo", f"id{i}")
+        cache.entries[f"photo:hash{i}"]["stored_at"] = i
+    assert cache.get("hash0", "photo") is None
+    assert cache.get("hash2", "photo") == "id2"
+
+
+def test_upload_locks_are_dropped_after_upload(tmp_path):
+    media = tmp_path / "media.jpg"
+    media.write_bytes(b"jpeg")
+    cache = FileIdCache(str(tmp_path / "ids.json"))
+
+    async def deliver():
+        await asyncio.gather(*[
+            send_story_media(FakeBot(), cache, chat_id, "photo",
+                             f"hash{chat_id % 3}", str(media))
+            for chat_id in range(6)
+        ])
+
+    asyncio.run(deliver())
+    assert cache._upload_locks == {}
+
+
+def test_writes_are_batched_until_flush(tmp_path):
+    path = str(tmp_path / "ids.json")
+    cache = FileIdCache(path, save_interval=3600)
+    cache.set("hash0", "photo", "id0")
+    cache.set("hash1", "photo", "id1")
+    assert FileIdCache(path).get("hash1", "photo") is None
+
+    cache.flush()
+    assert FileIdCache(path).get("hash1", "photo") == "id1"
+
+
+class AlbumBot:
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    async def send_media_group(self, chat_id, media):
+        self.calls += 1
+        raise BadRequest(self.error)
+
+
+def test_album_keeps_file_ids_on_unrelated_errors(tmp_path):
+    cache = FileIdCache(str(tmp_path / "ids.json"))
+    cache.set("abc", "photo", "cached-id")
+    bot = AlbumBot("Message caption is too long")
+    items = [{"kind": "photo", "media_hash": "abc", "path": "unused"}]
+
+    with pytest.raises(BadRequest):
+        asyncio.run(send_story_album(bot, cache, 1, items))
+    assert bot.calls == 1
+    assert cache.get("abc", "photo") == "cached-id"
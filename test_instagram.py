@@ -85,6 +85,7 @@ async def test_content_processing(username: str):
                     logger.info(f"  Screenshot Hash: {content['screenshot_hash'][:8]}...")
                     if content.get('media_hash'):
                         logger.info(f"  Media Hash: {content['media_hash'][:8]}...")
+                    monitor.release_story(content)
                     return True
         
         logger.info("No stories available for content processing test")
@@ -0,0 +1,51 @@
+import io
+import json
+import logging
+
+from log_setup import (JsonFormatter, RateLimitFilter, configure_logging,
+                       shutdown_logging)
+
+
+def make_record(msg, *args):
+    return logging.LogRecord('monitor', logging.INFO, __file__, 1, msg, args,
+                             None)
+
+
+def test_records_are_written_as_json_off_the_caller(monkeypatch):
+    stream = io.StringIO()
+    root = logging.getLogger()
+    monkeypatch.setattr(root, 'handlers', [])
+    level = root.level
+    configure_logging(level='info', fmt='json', stream=stream)
+    try:
+        logging.getLogger('monitor').info("Checking @%s", 'alice',
+                                          extra={'chat_id': 42})
+    finally:
+        shutdown_logging()
+        root.setLevel(level)
+    entry = json.loads(stream.getvalue())
+    assert entry['message'] == "Checking @alice"
+    assert entry['logger'] == 'monitor'
+    assert entry['level'] == 'INFO'
+    assert entry['chat_id'] == 42
+    assert root.handlers == []
+
+
+def test_same_template_is_rate_limited(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr('log_setup.time.monotonic', lambda: now[0])
+    rate_limit = RateLimitFilter(interval=60, burst=2)
+    allowed = [
+        rate_limit.filter(make_record("Checking @%s", name))
+        for name in ('a', 'b', 'c', 'd')
+    ]
+    assert allowed == [True, True, False, False]
+    # Other templates have their own budget
+    assert rate_limit.filter(make_record("Skipping @%s", 'a'))
+
+    now[0] += 61
+    record = make_record("Checking @%s", 'e')
+    assert rate_limit.filter(record)
+    assert record.suppressed == 2
+    assert record.getMessage() == "Checking @e (+2 suppressed)"
+    assert JsonFormatter().format(record).count('"suppressed": 2') == 1
@@ -0,0 +1,81 @@
+from instagram_monitor import InstagramMonitor
+from media_store import MediaStore
+from test_story_api import (VIDEO_BYTES, FakeContext, run_with_stand_in,
+                            serve_stand_in)
+
+
+def test_fingerprint_reads_only_the_requested_ranges():
+
+    async def fingerprints(api):
+        base = api.base_url
+        return (await api.fingerprint(f'{base}/cdn/video', head_bytes=64),
+                await api.fingerprint(f'{base}/cdn/video', head_bytes=64),
+                await api.fingerprint(f'{base}/cdn/video', head_bytes=64,
+                                      tail_bytes=32),
+                await api.fingerprint(f'{base}/cdn/thumb', head_bytes=64))
+
+    plain, again, with_tail, thumb = run_with_stand_in(fingerprints)
+    assert plain == again
+    assert len({plain, with_tail, thumb}) == 3
+
+
+def test_fingerprints_are_pruned_with_their_blob(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=10)
+    media_hash = store.put(b'12345678')
+    store.record_fingerprint('fp', media_hash)
+    assert store.find_fingerprint('fp') == media_hash
+    # Unknown blobs are never recorded
+    store.record_fingerprint('other', 'f' * 64)
+    assert store.find_fingerprint('other') is None
+
+    store.put(b'abcdefgh')
+    assert store.find_fingerprint('fp') is None
+    assert 'fp' not in MediaStore(str(tmp_path)).index['fingerprints']
+
+
+def test_fingerprint_hits_keep_their_blob_from_eviction(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=20)
+    reused = store.put(b'12345678')
+    store.record_fingerprint('fp', reused)
+    other = store.put(b'abcdefgh')
+    store.index['blobs'][reused]['last_used'] -= 60
+    store.index['blobs'][other]['last_used'] -= 30
+
+    assert store.find_fingerprint('fp') == reused
+    store.put(b'ABCDEFGH')
+    assert store.has(reused) and not store.has(other)
+
+
+def test_known_video_is_not_downloaded_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monitor = InstagramMonitor('user', 'pass')
+    monitor.context = FakeContext()
+    monitor.throttle.rate = monitor.throttle.max_rate = 100
+    monitor.fingerprint_bytes = 64
+    downloads = []
+
+    async def scenario(base_url):
+        monitor.api_base_url = base_url
+        story_api = await monitor.get_story_api()
+        download_to = story_api.download_to
+
+        async def counting_download_to(url, new_buffer):
+            downloads.append(url.rsplit('/', 1)[1])
+            return await download_to(url, new_buffer)
+
+        story_api.download_to = counting_download_to
+        first = await monitor.check_story_http('videouser')
+        # The same video posted again under a new story id
+        monitor.media_store.index['users'].clear()
+        second = await monitor.check_story_http('videouser')
+        await monitor.cleanup_browser()
+        return first, second
+
+    first, second = serve_stand_in(scenario)
+    assert downloads == ['video', 'thumb', 'thumb']
+    assert second['source'] == 'api'
+    assert second['media_hash'] == first['media_hash']
+    with open(second['media_path'], 'rb') as f:
+        assert f.read() == VIDEO_BYTES
+    assert monitor.media_store.find_story('videouser', '22')
+    assert monitor.capture_budget.in_use == 0
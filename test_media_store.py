@@ -0,0 +1,126 @@
+import hashlib
+import os
+import time
+
+from media_store import MediaStore
+
+
+def test_put_is_content_addressed_and_deduplicated(tmp_path):
+    store = MediaStore(root=str(tmp_path / "store"))
+    first = store.put(b"story-bytes")
+    second = store.put(b"story-bytes")
+
+    assert first == second == hashlib.sha256(b"story-bytes").hexdigest()
+    assert store.blob_path(first) == os.path.join(str(tmp_path / "store"),
+                                                  "objects", first[:2], first)
+    with store.open(first) as f:
+        assert f.read() == b"story-bytes"
+    assert len(store.index["blobs"]) == 1
+
+
+def test_put_file_streams_into_store(tmp_path):
+    source = tmp_path / "video.mp4"
+    source.write_bytes(b"v" * 200_000)
+    store = MediaStore(root=str(tmp_path / "store"))
+    with open(source, "rb") as f:
+        media_hash = store.put_file(f)
+
+    assert media_hash == hashlib.sha256(b"v" * 200_000).hexdigest()
+    assert os.path.getsize(store.blob_path(media_hash)) == 200_000
+    assert not [p for p in os.listdir(store.objects_dir) if p.endswith(".tmp")]
+
+
+def test_index_survives_restart(tmp_path):
+    root = str(tmp_path / "store")
+    store = MediaStore(root=root)
+    story = {"type": "image", "story_id": "42",
+             "screenshot_hash": store.put(b"shot"),
+             "media_hash": store.put(b"media")}
+    store.record_story("someone", story)
+    store.flush()
+
+    reopened = MediaStore(root=root)
+    assert reopened.find_story("someone", "42")["media_hash"] == story[
+        "media_hash"]
+    assert reopened.find_story("someone", "43") is None
+
+
+def test_story_records_are_written_in_batches(tmp_path):
+    root = str(tmp_path / "store")
+    store = MediaStore(root=root, save_interval=3600)
+    media_hash = store.put(b"media")
+    store.record_story("someone", {"type": "image", "story_id": "1",
+                                   "screenshot_hash": media_hash,
+                                   "media_hash": media_hash})
+    store.record_fingerprint("fp", media_hash)
+    assert MediaStore(root=root).find_story("someone", "1") is None
+
+    store.flush()
+    reopened = MediaStore(root=root)
+    assert reopened.find_story("someone", "1") is not None
+    assert reopened.find_fingerprint("fp") == media_hash
+
+
+def test_new_blobs_do_not_rewrite_the_index_each_time(tmp_path):
+    root = str(tmp_path / "store")
+    store = MediaStore(root=root, save_interval=3600)
+    store.put(b"first")
+    second, third = store.put(b"second"), store.put(b"third")
+    assert second not in MediaStore(root=root).index["blobs"]
+
+    store.flush()
+    assert third in MediaStore(root=root).index["blobs"]
+
+
+def test_story_hits_count_as_uses(tmp_path):
+    store = MediaStore(root=str(tmp_path / "store"), max_bytes=250)
+    shot, media = store.put(b"a" * 50), store.put(b"b" * 50)
+    store.record_story("someone", {"type": "image", "story_id": "1",
+                                   "screenshot_hash": shot,
+                                   "media_hash": media})
+    other = store.put(b"c" * 100)
+    for entry in store.index["blobs"].values():
+        entry["last_used"] -= 60
+
+    assert store.find_story("someone", "1") is not None
+    store.put(b"d" * 100)
+    assert store.has(shot) and store.has(media) and not store.has(other)
+
+
+def test_pinned_blobs_survive_eviction(tmp_path):
+    store = MediaStore(root=str(tmp_path / "store"), max_bytes=150,
+                       max_age_seconds=3600)
+    pinned = store.put(b"a" * 100)
+    store.pin(pinned)
+    store.index["blobs"][pinned]["stored_at"] -= 7200
+    newer = store.put(b"b" * 100)
+
+    assert store.has(pinned) and not store.has(newer)
+    store.unpin(pinned)
+    store.evict()
+    assert not store.has(pinned)
+
+
+def test_budget_evicts_least_recently_used(tmp_path):
+    store = MediaStore(root=str(tmp_path / "store"), max_bytes=250)
+    old = store.put(b"a" * 100)
+    store.index["blobs"][old]["last_used"] -= 60
+    newer = store.put(b"b" * 100)
+    newest = store.put(b"c" * 100)
+
+    assert not store.has(old)
+    assert store.has(newer) and store.has(newest)
+
+
+def test_age_eviction_drops_blobs_and_index_entries(tmp_path):
+    store = MediaStore(root=str(tmp_path / "store"), max_age_seconds=3600)
+    story = {"type": "image", "story_id": "1",
+             "screenshot_hash": store.put(b"shot"),
+             "media_hash": store.put(b"media")}
+    store.record_story("someone", story)
+    for entry in store.index["blobs"].values():
+        entry["stored_at"] = time.time() - 7200
+
+    assert store.evict() == len(b"shot") + len(b"media")
+    assert store.get_user_stories("someone") == []
+    assert "someone" not in store.index["users"]
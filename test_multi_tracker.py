@@ -0,0 +1,84 @@
+import pytest
+
+import multi_tracker
+from user_registry import UserRegistry
+
+
+class FakeResponse:
+
+    def __init__(self, updates):
+        self.updates = updates
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"ok": True, "result": self.updates}
+
+
+class FakeSession:
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append(dict(params))
+        return FakeResponse(self.batches.pop(0) if self.batches else [])
+
+
+def message(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {"chat": {"id": chat_id}, "text": text}
+    }
+
+
+def test_updates_are_ingested_once_with_one_write_per_batch(
+        tmp_path, monkeypatch):
+    registry = UserRegistry(str(tmp_path / "users.json"))
+    saves = []
+    save = registry.save
+    registry.save = lambda users: (saves.append(users), save(users))
+    session = FakeSession([
+        [message(10, 1, "track alice"), message(11, 2, "hello"),
+         message(12, 1, "track @bob")],
+        [message(13, 2, "track alice")],
+    ])
+    monkeypatch.setattr(multi_tracker, "registry", registry)
+    monkeypatch.setattr(multi_tracker, "_session", session)
+    monkeypatch.setattr(multi_tracker, "OFFSET_FILE",
+                        str(tmp_path / "offset.json"))
+
+    assert multi_tracker.update_users(timeout=0) == 3
+    assert multi_tracker.update_users(timeout=0) == 1
+    assert multi_tracker.update_users(timeout=0) == 0
+
+    assert "offset" not in session.calls[0]
+    assert session.calls[1]["offset"] == 13
+    assert session.calls[2]["offset"] == 14
+    assert len(saves) == 2
+    assert registry.load() == {"1": ["alice", "bob"], "2": ["alice"]}
+    assert multi_tracker.load_offset() == 14
+
+
+def test_run_needs_a_token(monkeypatch):
+    monkeypatch.setattr(multi_tracker, "BOT_TOKEN", None)
+    with pytest.raises(ValueError):
+        multi_tracker.run()
+
+
+def test_bad_batches_do_not_stop_the_poller(monkeypatch):
+    errors = [ValueError("Expecting value"), OSError("disk full")]
+
+    def update_users():
+        if not errors:
+            raise KeyboardInterrupt
+        raise errors.pop(0)
+
+    monkeypatch.setattr(multi_tracker, "BOT_TOKEN", "token")
+    monkeypatch.setattr(multi_tracker, "update_users", update_users)
+    monkeypatch.setattr(multi_tracker.time, "sleep", lambda seconds: None)
+    with pytest.raises(KeyboardInterrupt):
+        multi_tracker.run()
+    assert errors == []
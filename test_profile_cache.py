@@ -0,0 +1,67 @@
+from instagram_monitor import InstagramMonitor
+from profile_cache import ProfileCache
+from test_story_api import FakeContext, serve_stand_in
+
+
+def test_entries_expire_and_survive_restarts(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('profile_cache.time.time', lambda: now[0])
+    path = str(tmp_path / "profiles.json")
+    cache = ProfileCache(path, ttl=100, missing_ttl=10)
+    cache.put('alice', '1')
+    cache.mark_missing('ghost')
+    cache.mark_private('secret')
+    # Nothing is written until the monitor flushes after a cycle
+    assert ProfileCache(path).entries == {}
+    cache.flush()
+
+    reloaded = ProfileCache(path, ttl=100, missing_ttl=10)
+    assert reloaded.get('alice')['user_id'] == '1'
+    assert reloaded.skip_reason(reloaded.get('alice')) is None
+    assert reloaded.skip_reason(reloaded.get('ghost')) == "account doesn't exist"
+    assert reloaded.skip_reason(reloaded.get('secret')) == "account is private"
+
+    now[0] += 50
+    assert reloaded.get('ghost') is None
+    assert reloaded.get('alice') is not None
+
+
+def test_checks_reuse_profiles_and_skip_missing_accounts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monitor = InstagramMonitor('user', 'pass')
+    monitor.context = FakeContext()
+    monitor.throttle.rate = monitor.throttle.max_rate = 100
+
+    async def login():
+        return True
+
+    monitor.ensure_logged_in = login
+
+    async def scenario(base_url):
+        monitor.api_base_url = base_url
+        first = await monitor.probe_story('imageuser')
+        requests_after_first = monitor.throttle.requests
+        second = await monitor.probe_story('imageuser')
+        profile_lookups = (monitor.throttle.requests - requests_after_first)
+
+        # A stale id that now belongs to someone else is re-resolved
+        monitor.profile_cache.put('imageuser', '2')
+        renamed = await monitor.probe_story('imageuser')
+
+        missing = await monitor.probe_story('gone')
+        requests_before = monitor.throttle.requests
+        missing_again = await monitor.probe_story('gone')
+        skipped_requests = monitor.throttle.requests - requests_before
+        await monitor.cleanup_browser()
+        return (first, second, profile_lookups, renamed, missing,
+                missing_again, skipped_requests)
+
+    (first, second, profile_lookups, renamed, missing, missing_again,
+     skipped_requests) = serve_stand_in(scenario)
+    assert first['item']['id'] == second['item']['id'] == '11'
+    # Only the reel was fetched the second time
+    assert profile_lookups == 1
+    assert renamed['item']['user_id'] == '1'
+    assert monitor.profile_cache.get('imageuser')['user_id'] == '1'
+    assert missing is None and missing_again is None
+    assert skipped_requests == 0
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from request_throttle import CircuitOpenError, RequestThrottle
+from story_api import InstagramStoryAPI, RateLimitedError, SessionChallengedError
+from test_story_api import SESSION_COOKIES, serve_stand_in
+
+
+def test_rate_increases_additively_and_halves_on_flags():
+    throttle = RequestThrottle('me', rate=1, increase=0.1, decrease=0.5,
+                               breaker_threshold=10)
+    throttle.record_success()
+    throttle.record_success()
+    assert throttle.rate == pytest.approx(1.2)
+    throttle.record_flag('429')
+    assert throttle.rate == pytest.approx(0.6)
+    for _ in range(10):
+        throttle.record_success()
+    assert throttle.rate == pytest.approx(1.6)
+
+
+def test_token_bucket_paces_requests():
+
+    async def scenario():
+        throttle = RequestThrottle('me', rate=20, burst=1, increase=0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(4):
+            await throttle.acquire()
+        return loop.time() - started
+
+    # One token up front, three more at 20/s
+    assert asyncio.run(scenario()) >= 0.14
+
+
+def test_breaker_opens_then_half_opens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('request_throttle.time.monotonic', lambda: now[0])
+    throttle = RequestThrottle('me', breaker_threshold=2,
+                               breaker_cooldown=60)
+    throttle.record_flag('challenge')
+    assert not throttle.is_open()
+    throttle.record_flag('challenge')
+    assert throttle.is_open()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(throttle.acquire())
+
+    # After the cooldown one probe gets through; a flag reopens for longer
+    now[0] += 61
+    assert not throttle.is_open()
+    assert throttle.stats()['open'] is False and not throttle.half_open
+    assert asyncio.run(throttle.acquire()) is True
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(throttle.acquire())
+    throttle.record_flag('challenge')
+    assert throttle.is_open()
+    now[0] += 61
+    assert throttle.is_open()
+    now[0] += 60
+    assert not throttle.is_open()
+    assert asyncio.run(throttle.acquire()) is True
+    throttle.record_success()
+    assert throttle.trips == 0 and not throttle.half_open
+    assert asyncio.run(throttle.acquire()) is False
+
+
+def test_inconclusive_trial_lets_the_next_request_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('request_throttle.time.monotonic', lambda: now[0])
+    throttle = RequestThrottle('me', breaker_threshold=1,
+                               breaker_cooldown=60, max_retries=0)
+    throttle.record_flag('challenge')
+    now[0] += 61
+
+    async def timeout():
+        raise asyncio.TimeoutError()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(throttle.call(timeout, retryable=(asyncio.TimeoutError,)))
+    assert not throttle.half_open
+    assert asyncio.run(throttle.acquire()) is True
+
+
+def test_call_retries_transient_errors_only():
+
+    async def scenario():
+        throttle = RequestThrottle('me', rate=100, max_rate=100,
+                                   retry_delay=0.001,
+                                   max_retries=2, breaker_threshold=10)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimitedError('429')
+            return 'ok'
+
+        result = await throttle.call(flaky,
+                                     flagged=(RateLimitedError,),
+                                     retryable=(RateLimitedError,))
+
+        async def challenged():
+            attempts.append(1)
+            raise SessionChallengedError('checkpoint')
+
+        with pytest.raises(SessionChallengedError):
+            await throttle.call(challenged,
+                                flagged=(SessionChallengedError,),
+                                retryable=(RateLimitedError,))
+        return result, len(attempts), throttle
+
+    result, attempts, throttle = asyncio.run(scenario())
+    assert result == 'ok'
+    assert attempts == 4
+    assert throttle.flags == 3
+    assert throttle.retries == 2
+
+
+def test_api_calls_go_through_the_throttle():
+
+    async def scenario(base_url):
+        throttle = RequestThrottle('me', rate=100)
+        async with InstagramStoryAPI(SESSION_COOKIES,
+                                     base_url=base_url,
+                                     throttle=throttle) as api:
+            await api.get_latest_story_item('imageuser')
+            try:
+                await api.get_user_id('challenged')
+            except SessionChallengedError:
+                pass
+        return throttle
+
+    throttle = serve_stand_in(scenario)
+    assert throttle.requests == 3
+    assert throttle.flags == 1
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+from startup_timer import StartupTimer
+
+
+def test_importing_bot_does_not_import_playwright(tmp_path):
+    code = ("import sys, run_bot; "
+            "print('playwright' in sys.modules, run_bot.monitor)")
+    result = subprocess.run([sys.executable, "-c", code],
+                            capture_output=True,
+                            text=True,
+                            cwd=str(tmp_path),
+                            env={"PYTHONPATH": os.path.dirname(os.path.abspath(__file__))},
+                            check=True)
+    assert result.stdout.split() == ["False", "None"]
+
+
+def test_startup_report_lists_phases():
+    timer = StartupTimer()
+    timer.mark("imports done")
+    with timer.phase("browser warm-up"):
+        pass
+    report = timer.report()
+    assert "imports done" in report
+    assert "browser warm-up (" in report
+
+
+def test_only_the_monitor_worker_uses_the_browser_profile(tmp_path,
+                                                          monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+
+    import run_bot
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('BROWSER_PROFILE_DIR', str(tmp_path / "profile"))
+    monkeypatch.setattr(run_bot, 'monitor', None)
+    monkeypatch.setattr(run_bot, 'warm_up_task', None)
+    monkeypatch.setattr(run_bot, 'command_jobs', None)
+    monkeypatch.setattr(run_bot, 'acquire_monitor_lock', lambda: False)
+
+    async def start_worker():
+        await run_bot.on_startup(SimpleNamespace(bot=None))
+        await run_bot.command_jobs.stop()
+        return run_bot.get_monitor()
+
+    monitor = asyncio.run(start_worker())
+    assert monitor.browser_profile_dir is None
+    assert run_bot.warm_up_task is None
+
+
+def test_file_id_cache_reads_settings_loaded_after_import(tmp_path,
+                                                          monkeypatch):
+    import run_bot
+
+    path = str(tmp_path / "ids.json")
+    monkeypatch.setattr(run_bot, 'file_id_cache', None)
+    monkeypatch.setenv('FILE_ID_CACHE_FILE', path)
+    assert run_bot.get_file_id_cache().path == path
+
+
+def test_job_and_admin_settings_are_read_after_import(monkeypatch):
+    import run_bot
+
+    monkeypatch.setattr(run_bot, 'command_jobs', None)
+    monkeypatch.setenv('JOB_WORKERS', '5')
+    monkeypatch.setenv('ADMIN_CHAT_IDS', '42, 7')
+    assert run_bot.get_command_jobs().workers == 5
+    assert run_bot.is_admin(7)
+    assert not run_bot.is_admin(8)
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+from aiohttp import web
+
+from instagram_monitor import InstagramMonitor
+from story_api import (InstagramStoryAPI, StoryAPIError, SessionChallengedError,
+                       _unbudgeted_buffer)
+
+IMAGE_BYTES = b'fake-jpeg-bytes'
+VIDEO_BYTES = b'fake-mp4-bytes' * 100
+THUMB_BYTES = b'fake-thumbnail-bytes'
+SESSION_COOKIES = [{'name': 'sessionid', 'value': 'abc'},
+                   {'name': 'csrftoken', 'value': 'tok'}]
+
+
+def make_stand_in(base_url_holder):
+    """Build a stand-in for the Instagram endpoints the fast path uses."""
+    users = {'imageuser': '1', 'videouser': '2', 'nostory': '3',
+             'challenged': '4', 'garbage': '5'}
+
+    async def profile_info(request):
+        if 'sessionid=abc' not in request.headers.get('Cookie', ''):
+            raise web.HTTPFound('/accounts/login/')
+        username = request.query['username']
+        if username not in users:
+            return web.json_response({'status': 'fail'}, status=404)
+        if username == 'challenged':
+            return web.json_response({'message': 'checkpoint_required',
+                                      'status': 'fail'})
+        if username == 'garbage':
+            return web.Response(text='<html>not json</html>')
+        return web.json_response(
+            {'data': {'user': {'id': users[username]}}})
+
+    async def reels_media(request):
+        base = base_url_holder[0]
+        user_id = request.query['reel_ids']
+        image = {'pk': 11, 'taken_at': 1,
+                 'image_versions2': {'candidates': [{'url': f'{base}/cdn/img'}]}}
+        video = {'pk': 22, 'taken_at': 2,
+                 'image_versions2': {'candidates': [{'url': f'{base}/cdn/thumb'}]},
+                 'video_versions': [{'url': f'{base}/cdn/video'}]}
+        reels = {'1': {'items': [image], 'user': {'username': 'imageuser'}},
+                 '2': {'items': [image, video],
+                       'user': {'username': 'videouser'}}}
+        if user_id in reels:
+            return web.json_response({'reels': {user_id: reels[user_id]}})
+        return web.json_response({'reels': {}})
+
+    async def cdn(request):
+        if request.match_info['name'] == 'slow':
+            await asyncio.sleep(1)
+        if request.headers.get('Cookie'):
+            return web.Response(status=400, text='cookies leaked to CDN')
+        body = {'img': IMAGE_BYTES, 'video': VIDEO_BYTES,
+                'thumb': THUMB_BYTES,
+                'slow': IMAGE_BYTES}[request.match_info['name']]
+        headers = {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+        start, _, end = request.headers.get('Range', 'bytes=').split(
+            '=', 1)[1].partition('-')
+        if not start and not end:
+            return web.Response(body=body, headers=headers)
+        if not start:
+            start, end = max(len(body) - int(end), 0), len(body) - 1
+        start, end = int(start), min(int(end or len(body) - 1), len(body) - 1)
+        headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+        return web.Response(status=206, body=body[start:end + 1],
+                            headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/api/v1/users/web_profile_info/', profile_info)
+    app.router.add_get('/api/v1/feed/reels_media/', reels_media)
+    app.router.add_get('/cdn/{name}', cdn)
+    return app
+
+
+def serve_stand_in(test):
+    """Run `test(base_url)` against a stand-in server on a random local port."""
+
+    async def runner_main():
+        holder = ['']
+        runner = web.AppRunner(make_stand_in(holder))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        holder[0] = f'http://127.0.0.1:{port}'
+        try:
+            return await test(holder[0])
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(runner_main())
+
+
+def run_with_stand_in(test, cookies=SESSION_COOKIES):
+    """Run `test(api)` with a client pointed at the stand-in server."""
+
+    async def with_api(base_url):
+        async with InstagramStoryAPI(cookies, base_url=base_url) as api:
+            return await test(api)
+
+    return serve_stand_in(with_api)
+
+
+def test_image_story_is_parsed():
+    story = run_with_stand_in(lambda api: api.get_latest_story('imageuser'))
+    assert story['type'] == 'image'
+    assert bytes(story['media_content'].getbuffer()) == IMAGE_BYTES
+    assert story['media_hash'] == hashlib.sha256(IMAGE_BYTES).hexdigest()
+    assert story['screenshot_hash'] == story['media_hash']
+    assert story['story_id'] == '11'
+
+
+def test_video_story_uses_thumbnail_as_screenshot():
+    story = run_with_stand_in(lambda api: api.get_latest_story('videouser'))
+    assert story['type'] == 'video'
+    assert bytes(story['media_content'].getbuffer()) == VIDEO_BYTES
+    assert bytes(story['screenshot'].getbuffer()) == THUMB_BYTES
+    assert story['story_id'] == '22'
+
+
+def test_no_story_returns_none():
+    assert run_with_stand_in(lambda api: api.get_latest_story('nostory')) is None
+
+
+def test_checkpoint_raises_challenge():
+    try:
+        run_with_stand_in(lambda api: api.get_latest_story('challenged'))
+    except SessionChallengedError:
+        return
+    raise AssertionError("expected SessionChallengedError")
+
+
+def test_login_redirect_raises_challenge():
+    try:
+        run_with_stand_in(lambda api: api.get_latest_story('imageuser'),
+                          cookies=[])
+    except SessionChallengedError:
+        return
+    raise AssertionError("expected SessionChallengedError")
+
+
+def test_unparseable_response_raises():
+    try:
+        run_with_stand_in(lambda api: api.get_latest_story('garbage'))
+    except SessionChallengedError:
+        raise AssertionError("garbage is not a challenge")
+    except StoryAPIError:
+        return
+    raise AssertionError("expected StoryAPIError")
+
+
+def test_check_story_falls_back_to_browser(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monitor = InstagramMonitor('user', 'pass')
+    calls = []
+
+    async def login():
+        return True
+
+    async def fast_path(username):
+        raise SessionChallengedError("checkpoint")
+
+    async def browser(username):
+        calls.append(username)
+        return {'type': 'image', 'screenshot_hash': 'x'}
+
+    monitor.ensure_logged_in = login
+    monitor.probe_story_http = fast_path
+    monitor.check_story_browser = browser
+
+    story = asyncio.run(monitor.check_story('someone'))
+    assert story == {'type': 'image', 'screenshot_hash': 'x'}
+    assert calls == ['someone']
+
+
+class FakeContext:
+
+    async def cookies(self):
+        return SESSION_COOKIES
+
+
+def test_fast_path_reuses_stored_media(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monitor = InstagramMonitor('user', 'pass')
+    monitor.context = FakeContext()
+    monitor.throttle.rate = monitor.throttle.max_rate = 100
+    downloads = []
+
+    async def scenario(base_url):
+        monitor.api_base_url = base_url
+        story_api = await monitor.get_story_api()
+        download_to = story_api.download_to
+
+        async def counting_download_to(url, new_buffer):
+            downloads.append(url)
+            return await download_to(url, new_buffer)
+
+        story_api.download_to = counting_download_to
+        first = await monitor.check_story_http('videouser')
+        second = await monitor.check_story_http('videouser')
+        await monitor.cleanup_browser()
+        return first, second
+
+    first, second = serve_stand_in(scenario)
+    assert len(downloads) == 2
+    assert second['source'] == 'store'
+    assert second['media_hash'] == first['media_hash']
+    with open(second['media_path'], 'rb') as f:
+        assert f.read() == VIDEO_BYTES
+    assert monitor.capture_budget.in_use == 0
+
+
+def test_media_download_timeout_is_a_story_api_error():
+
+    async def scenario(base_url):
+        async with InstagramStoryAPI(SESSION_COOKIES,
+                                     base_url=base_url,
+                                     timeout=0.1) as api:
+            try:
+                await api.download_to(f'{base_url}/cdn/slow',
+                                      _unbudgeted_buffer)
+            except StoryAPIError as e:
+                return e
+
+    assert isinstance(serve_stand_in(scenario), StoryAPIError)
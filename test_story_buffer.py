@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+
+from story_buffer import MemoryBudget, StoryBuffer
+
+
+def test_small_capture_stays_in_memory():
+
+    async def scenario():
+        budget = MemoryBudget(1024)
+        buffer = await StoryBuffer.create(budget, 100)
+        buffer.write(b"x" * 100)
+        assert buffer.in_memory
+        assert bytes(buffer.getbuffer()) == b"x" * 100
+        assert budget.in_use == 100
+        buffer.close()
+        assert budget.in_use == 0
+
+    asyncio.run(scenario())
+
+
+def test_capture_past_reservation_spills_to_disk():
+
+    async def scenario():
+        budget = MemoryBudget(1024)
+        buffer = await StoryBuffer.create(budget, 10)
+        buffer.write(b"a" * 8)
+        buffer.write(b"b" * 8)
+        assert not buffer.in_memory
+        assert budget.in_use == 0
+        assert buffer.open().read() == b"a" * 8 + b"b" * 8
+        assert buffer.hexdigest() == hashlib.sha256(b"a" * 8 +
+                                                    b"b" * 8).hexdigest()
+        buffer.close()
+
+    asyncio.run(scenario())
+
+
+def test_awrite_spills_and_writes_spooled_chunks_in_a_thread(monkeypatch):
+    threaded = []
+    to_thread = asyncio.to_thread
+
+    async def tracking_to_thread(fn, *args):
+        threaded.append(getattr(fn, '__name__', repr(fn)))
+        return await to_thread(fn, *args)
+
+    monkeypatch.setattr('story_buffer.asyncio.to_thread', tracking_to_thread)
+
+    async def scenario():
+        budget = MemoryBudget(1024)
+        buffer = await StoryBuffer.create(budget, 10)
+        await buffer.awrite(b"a" * 8)
+        assert threaded == []
+        await buffer.awrite(b"b" * 8)
+        await buffer.awrite(b"c" * 8)
+        assert budget.in_use == 0
+        data = buffer.open().read()
+        buffer.close()
+        return data
+
+    assert asyncio.run(scenario()) == b"a" * 8 + b"b" * 8 + b"c" * 8
+    assert threaded == ['_spool', 'write', 'write']
+
+
+def test_exhausted_budget_waits_then_spools():
+
+    async def scenario():
+        budget = MemoryBudget(100, wait_timeout=0.05)
+        holder = await StoryBuffer.create(budget, 100)
+        waiting = await StoryBuffer.create(budget, 50)
+        assert waiting.reserved == 0
+        assert budget.spilled == 1
+        waiting.write(b"y" * 50)
+        assert not waiting.in_memory
+        waiting.close()
+        holder.close()
+
+    asyncio.run(scenario())
+
+
+def test_waiting_capture_gets_memory_when_released():
+
+    async def scenario():
+        budget = MemoryBudget(100, wait_timeout=1)
+        holder = await StoryBuffer.create(budget, 100)
+        asyncio.get_running_loop().call_later(0.01, holder.close)
+        waiting = await StoryBuffer.create(budget, 60)
+        assert waiting.reserved == 60
+        assert budget.peak == 100
+        waiting.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,130 @@
+import asyncio
+from types import SimpleNamespace
+
+from detection_pipeline import DetectionPipeline
+from file_id_cache import FileIdCache, send_story_album
+from story_digest import StoryDigest
+from test_detection_pipeline import make_monitor
+
+
+def make_story(n):
+    return {'type': 'image', 'screenshot_hash': f'{n}' * 64,
+            'media_hash': f'{n}' * 64}
+
+
+def test_alerts_are_coalesced_per_chat():
+    sent = []
+
+    async def send(chat_id, alerts):
+        sent.append((chat_id, [alert['username'] for alert in alerts]))
+        return chat_id != 'broken'
+
+    async def scenario():
+        digest = StoryDigest(send, window=0.05, max_items=3,
+                             priority_accounts={'Boss'})
+        futures = [
+            digest.add('1', name, make_story(n))
+            for n, name in enumerate(['a', 'b'])
+        ]
+        futures.append(digest.add('broken', 'a', make_story(1)))
+        # A full digest goes out without waiting for the window
+        full = [digest.add('2', name, make_story(1)) for name in 'xyz']
+        await asyncio.sleep(0)
+        early = list(sent)
+        results = await asyncio.gather(*futures, *full)
+        return digest, early, results
+
+    digest, early, results = asyncio.run(scenario())
+    assert early == [('2', ['x', 'y', 'z'])]
+    assert sorted(sent) == [('1', ['a', 'b']), ('2', ['x', 'y', 'z']),
+                            ('broken', ['a'])]
+    assert results == [True, True, False, True, True, True]
+    assert digest.stats() == {'held': 0, 'digests_sent': 2,
+                              'alerts_coalesced': 5}
+    assert not digest.should_hold('boss')
+    assert not StoryDigest(send).should_hold('a')
+
+
+def test_full_digests_never_exceed_max_items():
+    sent = []
+
+    async def send(chat_id, alerts):
+        sent.append(len(alerts))
+        return True
+
+    async def scenario():
+        digest = StoryDigest(send, window=0.05, max_items=3)
+        # All added before the first full digest's send gets to run
+        futures = [digest.add('1', f'user{n}', make_story(n % 10))
+                   for n in range(8)]
+        return await asyncio.gather(*futures)
+
+    results = asyncio.run(scenario())
+    assert all(results)
+    assert sorted(sent) == [2, 3, 3]
+
+
+def test_cursors_advance_when_the_digest_is_delivered(tmp_path, monkeypatch):
+    stories = {'alice': make_story(1), 'bob': make_story(2)}
+    monitor = make_monitor(tmp_path, monkeypatch, stories)
+    delivered = asyncio.Event()
+    sent = []
+
+    async def send(chat_id, alerts):
+        await delivered.wait()
+        sent.append(sorted(alert['username'] for alert in alerts))
+        return True
+
+    async def scenario():
+        digest = StoryDigest(send, window=0.01)
+
+        async def notifier(chat_id, username, story):
+            return digest.add(chat_id, username, story)
+
+        pipeline = DetectionPipeline(monitor, notifier, {'notify': 1})
+        await pipeline.run_cycle({'1': ['alice', 'bob']})
+        await pipeline.notify.join()
+        # Both alerts handed over by the single notify worker, none sent
+        held = pipeline.alerts_sent
+        delivered.set()
+        await digest.flush()
+        await asyncio.sleep(0.02)
+        await pipeline.stop()
+        return held, pipeline.alerts_sent
+
+    held, alerts_sent = asyncio.run(scenario())
+    assert held == 0 and alerts_sent == 2
+    assert sent == [['alice', 'bob']]
+    assert monitor.get_last_alert_state('alice')['cursors'] == {'1': 1}
+    assert monitor.get_last_alert_state('bob')['cursors'] == {'1': 1}
+    assert monitor.media_store._pins == {}
+
+
+class AlbumBot:
+
+    def __init__(self):
+        self.albums = []
+
+    async def send_media_group(self, chat_id, media):
+        self.albums.append([item.media for item in media])
+        return [
+            SimpleNamespace(photo=[SimpleNamespace(file_id=f'new-{n}')],
+                            video=None) for n in range(len(media))
+        ]
+
+
+def test_album_reuses_cached_file_ids(tmp_path):
+    cache = FileIdCache(str(tmp_path / "ids.json"))
+    cache.set('a' * 64, 'photo', 'known-id')
+    (tmp_path / "b.jpg").write_bytes(b'jpeg')
+    bot = AlbumBot()
+    items = [
+        {'kind': 'photo', 'media_hash': 'a' * 64, 'path': 'unused'},
+        {'kind': 'photo', 'media_hash': 'b' * 64,
+         'path': str(tmp_path / "b.jpg")},
+    ]
+
+    asyncio.run(send_story_album(bot, cache, 1, items))
+    assert bot.albums[0][0] == 'known-id'
+    assert cache.get('a' * 64, 'photo') == 'known-id'
+    assert cache.get('b' * 64, 'photo') == 'new-1'
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+
+from instagram_monitor import InstagramMonitor
+from user_registry import UserRegistry
+
+
+def test_registry_is_shared_and_picks_up_external_edits(tmp_path):
+    path = str(tmp_path / "users.json")
+    registry = UserRegistry(path)
+    registry.save({"1": ["alice"]})
+    monitor = InstagramMonitor("user", "pass", registry=registry)
+    assert monitor.load_users() == {"1": ["alice"]}
+
+    with open(path, "w") as f:
+        json.dump({"1": ["alice", "bob"]}, f)
+    os.utime(path, ns=(1, 1))
+    assert registry.load() == {"1": ["alice", "bob"]}
+
+
+def test_load_returns_a_copy(tmp_path):
+    registry = UserRegistry(str(tmp_path / "users.json"))
+    registry.save({"1": ["alice"]})
+    registry.load()["1"].append("mallory")
+    assert registry.load() == {"1": ["alice"]}
+
+
+def test_transaction_writes_once_and_aborts_on_error(tmp_path):
+    registry = UserRegistry(str(tmp_path / "users.json"))
+    with registry.transaction() as users:
+        users["1"] = ["alice"]
+        users["2"] = ["bob"]
+    assert UserRegistry(registry.path).load() == {"1": ["alice"],
+                                                  "2": ["bob"]}
+
+    try:
+        with registry.transaction() as users:
+            users["3"] = ["carol"]
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert "3" not in registry.load()
+
+
+def test_monitor_runs_as_background_task(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monitor = InstagramMonitor("user", "pass")
+    cycles = []
+
+    async def fake_run():
+        while True:
+            cycles.append(1)
+            await asyncio.sleep(0.01)
+
+    monitor.run = fake_run
+
+    async def scenario():
+        task = monitor.start()
+        assert monitor.start() is task
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return task
+
+    task = asyncio.run(scenario())
+    assert task.cancelled()
+    assert cycles
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+from webhook_app import TelegramWebhookApp, default_secret_token
+
+
+class FakeBot:
+    token = "123:abc"
+
+    def __init__(self):
+        self.webhooks = []
+
+    async def set_webhook(self, **kwargs):
+        self.webhooks.append(kwargs)
+
+
+class FakeApplication:
+    """The parts of telegram.ext.Application the webhook app touches."""
+
+    def __init__(self):
+        self.bot = FakeBot()
+        self.update_queue = asyncio.Queue()
+        self.running = False
+        self.events = []
+        self.post_init = self._post_init
+        self.post_stop = None
+        self.post_shutdown = None
+
+    async def _post_init(self, application):
+        self.events.append('post_init')
+
+    async def initialize(self):
+        self.events.append('initialize')
+
+    async def start(self):
+        self.running = True
+        self.events.append('start')
+
+    async def stop(self):
+        self.running = False
+        self.events.append('stop')
+
+    async def shutdown(self):
+        self.events.append('shutdown')
+
+
+async def call(app, method, path, body=b'', headers=()):
+    """Send one HTTP request through the ASGI app."""
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'headers': list(headers)}
+    sent = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+UPDATE = {'update_id': 1,
+          'message': {'message_id': 5, 'date': 0, 'text': '/list',
+                      'chat': {'id': 42, 'type': 'private'}}}
+
+
+def make_app():
+    fake = FakeApplication()
+    app = TelegramWebhookApp(lambda: fake,
+                             webhook_path='/telegram',
+                             webhook_url='https://bot.example.com',
+                             secret_token='s3cret')
+    return app, fake
+
+
+def test_verified_update_is_queued():
+
+    async def scenario():
+        app, fake = make_app()
+        await app.startup()
+        status, _ = await call(
+            app, 'POST', '/telegram', json.dumps(UPDATE).encode(),
+            [(b'x-telegram-bot-api-secret-token', b's3cret')])
+        update = fake.update_queue.get_nowait()
+        await app.shutdown()
+        return status, update, fake
+
+    status, update, fake = asyncio.run(scenario())
+    assert status == 200
+    assert update.effective_chat.id == 42
+    assert fake.bot.webhooks[0]['url'] == 'https://bot.example.com/telegram'
+    assert fake.bot.webhooks[0]['secret_token'] == 's3cret'
+    assert fake.events == ['initialize', 'post_init', 'start', 'stop',
+                           'shutdown']
+
+
+def test_wrong_secret_is_rejected():
+
+    async def scenario():
+        app, fake = make_app()
+        await app.startup()
+        status, _ = await call(
+            app, 'POST', '/telegram', json.dumps(UPDATE).encode(),
+            [(b'x-telegram-bot-api-secret-token', b'nope')])
+        return status, fake.update_queue.qsize()
+
+    assert asyncio.run(scenario()) == (403, 0)
+
+
+def test_health_and_invalid_payload():
+
+    async def scenario():
+        app, _ = make_app()
+        before = await call(app, 'GET', '/health')
+        await app.startup()
+        after = await call(app, 'GET', '/health')
+        invalid = [
+            await call(app, 'POST', '/telegram', body,
+                       [(b'x-telegram-bot-api-secret-token', b's3cret')])
+            for body in (b'not json', b'null', b'[1, 2]', b'42')
+        ]
+        return before, after, invalid, app.application.update_queue
+
+    before, after, invalid, queue = asyncio.run(scenario())
+    assert before == (503, {'status': 'starting'})
+    assert after == (200, {'status': 'healthy'})
+    assert [status for status, _ in invalid] == [400, 400, 400, 400]
+    assert queue.empty()
+
+
+def test_default_secret_is_stable_and_valid():
+    secret = default_secret_token("123:abc")
+    assert secret == default_secret_token("123:abc")
+    assert secret.isalnum() and len(secret) <= 256
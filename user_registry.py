@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class UserRegistry:
+    """
+    Shared view of users.json (chat id -> tracked usernames).
+
+    The bot handlers and the monitor loop read the same in-memory copy,
+    which is only re-read when the file changes on disk, and writes are
+    atomic so a crash can't leave a half-written file behind.
+    """
+
+    def __init__(self, path: str = "users.json"):
+        self.path = path
+        self._users: Dict[str, List[str]] = {}
+        self._mtime = None
+        self._lock = threading.RLock()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self) -> None:
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return
+        if mtime is None:
+            self._users = {}
+        else:
+            try:
+                with open(self.path, "r") as f:
+                    self._users = json.load(f)
+            except (json.JSONDecodeError, PermissionError, OSError) as e:
+                logger.error(f"Error loading users: {e}")
+                return
+        self._mtime = mtime
+
+    def load(self) -> Dict[str, List[str]]:
+        """Return a copy of the current registry."""
+        with self._lock:
+            self._refresh()
+            return {
+                chat_id: list(usernames)
+                for chat_id, usernames in self._users.items()
+            }
+
+    def save(self, users: Dict[str, List[str]]) -> None:
+        """Replace the registry and persist it atomically."""
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(users, f)
+                os.replace(tmp_path, self.path)
+            except (PermissionError, IOError) as e:
+                logger.error(f"Error saving users: {e}")
+                return
+            self._users = {
+                chat_id: list(usernames)
+                for chat_id, usernames in users.items()
+            }
+            self._mtime = self._file_mtime()
+
+    @contextmanager
+    def transaction(self):
+        """Edit the registry in place and write it once at the end."""
+        with self._lock:
+            users = self.load()
+            yield users
+            self.save(users)
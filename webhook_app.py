@@ -0,0 +1,163 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+from typing import Callable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def default_secret_token(bot_token: str) -> str:
+    """Derive a webhook secret every worker agrees on without extra config."""
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+
+class TelegramWebhookApp:
+    """
+    Minimal ASGI app serving the Telegram webhook.
+
+    The Application is built and started on lifespan startup (so importing
+    the module stays cheap) and updates posted by Telegram are verified
+    against the secret token and fed into its update queue.
+    """
+
+    def __init__(self,
+                 application_factory: Callable[[], Application],
+                 webhook_path: Optional[str] = None,
+                 webhook_url: Optional[str] = None,
+                 secret_token: Optional[str] = None):
+        self.application_factory = application_factory
+        self.webhook_path = webhook_path
+        self.webhook_url = webhook_url
+        self.secret_token = secret_token
+        self.application: Optional[Application] = None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.error(f"Webhook startup failed: {e}")
+                    await send({
+                        'type': 'lifespan.startup.failed',
+                        'message': str(e)
+                    })
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self) -> None:
+        """Build, initialize and start the Application and register the webhook."""
+        application = self.application_factory()
+        self.webhook_path = self.webhook_path or os.getenv(
+            'WEBHOOK_PATH', '/telegram')
+        self.webhook_url = self.webhook_url or os.getenv('WEBHOOK_URL')
+        self.secret_token = self.secret_token or os.getenv(
+            'WEBHOOK_SECRET') or default_secret_token(application.bot.token)
+
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        self.application = application
+
+        if self.webhook_url:
+            url = self.webhook_url.rstrip('/') + self.webhook_path
+            await application.bot.set_webhook(
+                url=url,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES)
+            logger.info(f"Webhook registered at {url}")
+        else:
+            logger.warning("WEBHOOK_URL not set, not registering the webhook")
+
+    async def shutdown(self) -> None:
+        """Stop the Application and run its shutdown hooks."""
+        application = self.application
+        if application is None:
+            return
+        self.application = None
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    async def _http(self, scope, receive, send) -> None:
+        path = scope['path']
+        method = scope['method']
+        if path == '/health' and method in ('GET', 'HEAD'):
+            status = 'healthy' if self.application else 'starting'
+            await self._respond(send, 200 if self.application else 503,
+                                {'status': status})
+        elif path == self.webhook_path and method == 'POST':
+            await self._webhook(scope, receive, send)
+        else:
+            await self._respond(send, 404, {'error': 'not found'})
+
+    async def _webhook(self, scope, receive, send) -> None:
+        headers = dict(scope.get('headers') or [])
+        token = headers.get(b'x-telegram-bot-api-secret-token', b'').decode(
+            'latin-1')
+        if not self.secret_token or not hmac.compare_digest(
+                token, self.secret_token):
+            await self._respond(send, 403, {'error': 'forbidden'})
+            return
+        if self.application is None:
+            await self._respond(send, 503, {'error': 'starting'})
+            return
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if len(body) > MAX_BODY_BYTES:
+                await self._respond(send, 413, {'error': 'too large'})
+                return
+
+        try:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                # null, arrays and scalars are valid JSON but no update
+                raise ValueError(f"expected an object, got "
+                                 f"{type(payload).__name__}")
+            update = Update.de_json(payload, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            await self._respond(send, 400, {'error': 'invalid update'})
+            return
+
+        await self.application.update_queue.put(update)
+        await self._respond(send, 200, {'ok': True})
+
+    @staticmethod
+    async def _respond(send, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})